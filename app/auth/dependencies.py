@@ -1,9 +1,9 @@
 import base64
-import json
-from fastapi import Depends, HTTPException, WebSocket, status
+from fastapi import Depends, HTTPException, Request, WebSocket, status
 from fastapi.security import OAuth2PasswordBearer
 from typing import Optional
 import os
+from app.shared import serialization
 from app.utils.auth_helpers import verify_jwt_and_seed
 from dotenv import load_dotenv
 
@@ -13,6 +13,9 @@ load_dotenv()
 # Initialize the OAuth2PasswordBearer with the token URL
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
+# Comma-separated usernames allowed to use administrative endpoints
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+
 
 # Fix the dependency injection for get_current_user
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -37,7 +40,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         # Add padding if needed
         padding = '=' * (4 - len(payload_b64) % 4) if len(payload_b64) % 4 != 0 else ''
         payload_json = base64.urlsafe_b64decode(payload_b64 + padding).decode('utf-8')
-        payload = json.loads(payload_json)
+        payload = serialization.loads(payload_json)
 
         if not payload.get("name"):
             raise credentials_exception
@@ -56,6 +59,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except Exception as e:
         raise credentials_exception from e
 
+async def get_current_admin(current_user: str = Depends(get_current_user)):
+    if current_user not in ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Administrator access required")
+    return current_user
+
 async def get_token_from_websocket(websocket: WebSocket) -> str:
     jwt = websocket.headers.get("X-User-JWT")
     if not jwt:
@@ -88,7 +96,7 @@ async def get_current_user_ws(websocket: WebSocket, jwt: str = Depends(get_token
         # Add padding if needed
         padding = '=' * (4 - len(payload_b64) % 4) if len(payload_b64) % 4 != 0 else ''
         payload_json = base64.urlsafe_b64decode(payload_b64 + padding).decode('utf-8')
-        payload = json.loads(payload_json)
+        payload = serialization.loads(payload_json)
 
         if not payload.get("name"):
             raise credentials_exception
@@ -105,4 +113,19 @@ async def get_current_user_ws(websocket: WebSocket, jwt: str = Depends(get_token
 
         return username
     except Exception as e:
-        raise credentials_exception from e
\ No newline at end of file
+        raise credentials_exception from e
+
+async def get_current_user_sse(request: Request, token: Optional[str] = None):
+    # EventSource cannot send headers, so the token may also come as ?token=
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token is required for authentication",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return await get_current_user(token)
@@ -1,6 +1,6 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 import os
 from dotenv import load_dotenv
 
@@ -23,6 +23,11 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 # Create a SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Session behind the services' module-level query objects. It is created on
+# first use (one per thread), so importing a service never touches the database.
+# The schema is managed by Alembic migrations only.
+ScopedSession = scoped_session(SessionLocal)
+
 # Create a Base class
 Base = declarative_base()
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Table, Enum
+from sqlalchemy import BigInteger, Column, Integer, Float, String, Text, DateTime, ForeignKey, Boolean, Table, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import datetime
@@ -20,11 +20,25 @@ class Message(Base):
     content = Column(Text, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"))
     group_id = Column(Integer, ForeignKey("groups.id"))
+    room_id = Column(Integer, ForeignKey("nats_rooms.id"), nullable=True)
+    # Time-ordered id assigned at publish time, shared with the live NATS envelope
+    uid = Column(BigInteger, unique=True, nullable=True)
+    # Position of the message in its room (1-based), assigned when it is persisted
+    seq = Column(BigInteger, nullable=True)
+    # Postgres also maintains a search_vector tsvector column, filled by a trigger
+    # and GIN-indexed (migration 9b4e1f6c2a57); it is left out of the model as only
+    # MessageQueries.search_room_messages reads it.
     created_at = Column(DateTime, default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="messages")
     group = relationship("Group", back_populates="messages")
+    room = relationship("NatsRoom")
+
+    __table_args__ = (
+        # Keyset pagination of a room's history
+        Index("ix_messages_room_id_uid", "room_id", "uid"),
+    )
 
 # User table
 class User(Base):
@@ -37,6 +51,9 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=func.now())
     nats_seed_hash = Column(String(100), nullable=True)
+    nats_jwt = Column(Text, nullable=True)
+    nats_public_key = Column(String(100), nullable=True)
+    nats_account_public_key = Column(String(100), nullable=True)
     nats_account_id = Column(Integer, ForeignKey("nats_accounts.id"), nullable=True)
     nats_expires_at = Column(DateTime, nullable=True)
     nats_expired_at = Column(DateTime, nullable=True)
@@ -57,6 +74,11 @@ class NatsAccount(Base):
     name = Column(String(100), unique=True, nullable=False)
     public_key = Column(String(100), unique=True, nullable=False)
     description = Column(Text, nullable=True)
+    # Publish rate limits for rooms of this account (messages/second and burst); NULL uses the defaults
+    user_publish_rate = Column(Float, nullable=True)
+    user_publish_burst = Column(Integer, nullable=True)
+    room_publish_rate = Column(Float, nullable=True)
+    room_publish_burst = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
@@ -106,6 +128,9 @@ class NatsRoom(Base):
     description = Column(Text, nullable=True)
     account_id = Column(Integer, ForeignKey("nats_accounts.id"), nullable=False)
     is_public = Column(Boolean, default=False)
+    # Persisted messages so far and the newest of them, maintained by the message writer
+    message_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    last_message_uid = Column(BigInteger, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
@@ -121,6 +146,9 @@ class NatsUserRoom(Base):
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     room_id = Column(Integer, ForeignKey("nats_rooms.id"), primary_key=True)
     joined_at = Column(DateTime, default=func.now())
+    # Read marker, by message uid: unread messages are the room's messages with a newer uid
+    last_read_uid = Column(BigInteger, nullable=True)
+    last_read_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
     
     # Relationships
     user = relationship("User", back_populates="nats_rooms")
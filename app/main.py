@@ -1,30 +1,43 @@
-import asyncio
-import threading
 from fastapi import FastAPI, Depends
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import pages, room_router
 from app.routers import chat_router
 from app.routers import user_router
+from app.routers import sse_router
 import logging
 from dotenv import load_dotenv
-from app.database.db import engine, get_db
-from app.database import models
+from contextlib import asynccontextmanager
+from app.database.db import ScopedSession, get_db
 from sqlalchemy.orm import Session
 
-from app.services.auth_service import start_auth_service
+from app.services.health_service import health
+from app.services.lifecycle_service import lifecycle
+from app.shared.log import configure_logging
+from app.shared.serialization import JSONResponse
+from app.shared.static_assets import PrecompressedStaticFiles
+from app.shared.templating import precompile, templates
+from app.shared.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY
 
 # Load environment variables from .env file
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
+# Log records are written by a background thread, never on the event loop
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Create database tables on application startup
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background services run on the app's event loop; the schema is managed by Alembic
+    precompile(templates.env)
+    await lifecycle.start()
+    yield
+    # Drain NATS and persist queued messages before the process exits
+    await lifecycle.stop()
+    ScopedSession.remove()
 
-app = FastAPI()
+# REST responses are encoded with the app's JSON serializer (orjson when installed)
+app = FastAPI(lifespan=lifespan, default_response_class=JSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,16 +47,14 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-# Set up Jinja2 templates
-templates = Jinja2Templates(directory="app/templates")
-
-# Mount static files
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# Mount static files; built assets are served precompressed and cached as immutable
+app.mount("/static", PrecompressedStaticFiles(directory="app/static"), name="static")
 
 app.include_router(chat_router.router, tags=["chat"])
 app.include_router(pages.router)
 app.include_router(user_router.router, tags=["user"])
 app.include_router(room_router.router, tags=["room"])
+app.include_router(sse_router.router, tags=["sse"])
 
 
 # Add a simple DB test endpoint
@@ -59,6 +70,21 @@ def test_db(db: Session = Depends(get_db)):
     except Exception as e:
         return {"message": f"Database connection error: {str(e)}"}
     
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    # Liveness: answering at all means the event loop is running
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    # Readiness from the cached checks; probes never open connections
+    report = health.readiness(draining=lifecycle.draining)
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
 @app.get("/test-nats")
 async def test_nats():
     from app.services.auth_service import get_test_connection
@@ -67,58 +93,3 @@ async def test_nats():
         return {"message": "NATS connection successful!"}
     except Exception as e:
         return {"message": f"NATS connection error: {str(e)}"}
-    
-
-# auth_service_thread = None
-
-# # Define a function to run the auth service in a separate thread
-# def run_auth_service_in_thread():
-#     """Run the auth service in a separate thread"""
-#     from app.services.auth_service import run_auth_service
-    
-#     # Create a new event loop for this thread
-#     loop = asyncio.new_event_loop()
-#     asyncio.set_event_loop(loop)
-    
-#     try:
-#         # Run the auth service async function
-#         # Make sure run_auth_service is an async function in your auth_service.py
-#         loop.run_until_complete(run_auth_service())
-#     except Exception as e:
-#         logger.error(f"Error starting auth service: {str(e)}")
-#     finally:
-#         loop.close()
-
-# @app.on_event("startup")
-# async def startup_event():
-#     """Start the application and the auth service in a background thread"""
-#     global auth_service_thread
-    
-#     logger.info("Starting up the application...")
-    
-#     # Start auth service in a separate thread
-#     auth_service_thread = threading.Thread(target=run_auth_service_in_thread, daemon=True)
-#     auth_service_thread.start()
-    
-#     logger.info("Auth service started in background thread")
-
-# @app.on_event("shutdown")
-# async def shutdown_event():
-#     """Clean up resources when the application shuts down"""
-#     logger.info("Shutting down the application...")
-    
-#     # If you need to gracefully stop the auth service, add code here
-#     # For example, you might want to implement a stop_auth_service() function
-    
-#     logger.info("Application shutdown complete.")
-
-# Add an endpoint to check auth service status
-# @app.get("/auth-service-status")
-# async def auth_service_status():
-#     """Check if the auth service is running"""
-#     global auth_service_thread
-    
-#     if auth_service_thread and auth_service_thread.is_alive():
-#         return {"status": "running"}
-#     else:
-#         return {"status": "not running"}
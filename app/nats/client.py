@@ -1,30 +1,265 @@
 import nats 
 import asyncio
-import json
+import base64
+import time
 import uuid
 import os
+from collections import deque
 from dotenv import load_dotenv
-from nats.aio.client import Client
-from typing import Dict, Any
+from pydantic import ValidationError
+from nats.aio.subscription import DEFAULT_SUB_PENDING_BYTES_LIMIT, DEFAULT_SUB_PENDING_MSGS_LIMIT
+from typing import Dict, Any, Iterable, List, Optional
+from app.nats.transport import new_client, subject_covers, subject_matches
+from app.shared import serialization
 from app.shared.auth_token import AuthToken
+from app.shared.envelopes import ENVELOPE_VERSION, ChatEnvelope, parse_chat_envelope
+from app.shared.rate_limit import RateLimiter
+from app.shared.tracing import TRACE_FIELD, mark_sent, start_trace
 
 # Load environment variables from .env file
 load_dotenv()
 
+class EnvelopeTemplate:
+    """
+    A message envelope whose fixed fields (v, type, sender, sender_id) are
+    serialized once. render() only encodes the text and timestamp and returns
+    the same bytes as serialization.dumps of the full dict.
+    """
+
+    def __init__(self, kind: str, sender: str, sender_id: str):
+        head = serialization.dumps({"v": ENVELOPE_VERSION, "type": kind, "sender": sender, "sender_id": sender_id})
+        self.prefix = head[:-1]
+
+    def render(self, message: Optional[str] = None, timestamp: Optional[float] = None) -> bytes:
+        parts = [self.prefix]
+        if message is not None:
+            parts.append(b',"message":')
+            parts.append(serialization.dumps(message))
+        parts.append(b',"timestamp":')
+        parts.append(serialization.dumps(time.time() if timestamp is None else timestamp))
+        parts.append(b"}")
+        return b"".join(parts)
+
+
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "error")
+# Subjects of private messages, chat.private.<client id>
+PRIVATE_PREFIX = "chat.private."
+
+
+def sub_allow_from_jwt(user_jwt: str) -> Optional[List[str]]:
+    """
+    The subjects a NATS user JWT allows subscribing to (nats.sub.allow), or
+    None if it does not restrict them. The JWT is not verified: the server does that.
+    """
+    payload_b64 = user_jwt.split(".")[1]
+    padding = "=" * (-len(payload_b64) % 4)
+    payload = serialization.loads(base64.urlsafe_b64decode(payload_b64 + padding))
+    allow = payload.get("nats", {}).get("sub", {}).get("allow")
+    return list(allow) if allow else None
+
+
+class MessageOverflowError(Exception):
+    """Raised by a MessageStream with the "error" overflow policy once its buffer overflowed"""
+
+
+class ChatMessage:
+    """
+    A received message. The JSON payload is decoded on first access to a
+    field, so consumers that only route or count messages never parse them.
+    type, sender and text come from the validated envelope and are None for
+    a payload that is not one; payload and get() give the raw JSON object.
+    """
+
+    __slots__ = ("subject", "data", "_payload", "_envelope")
+
+    def __init__(self, subject: str, data: bytes):
+        self.subject = subject
+        self.data = data
+        self._payload = None
+        self._envelope = None
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        if self._payload is None:
+            try:
+                payload = serialization.loads(self.data)
+            except ValueError:
+                payload = None
+            self._payload = payload if isinstance(payload, dict) else {}
+        return self._payload
+
+    def get(self, key: str, default=None):
+        return self.payload.get(key, default)
+
+    def __getitem__(self, key: str):
+        return self.payload[key]
+
+    @property
+    def envelope(self) -> Optional[ChatEnvelope]:
+        """The payload validated against the envelope schema, or None if it does not match"""
+        if self._envelope is None:
+            try:
+                self._envelope = parse_chat_envelope(self.data)
+            except ValidationError:
+                self._envelope = False
+        return self._envelope or None
+
+    @property
+    def type(self) -> Optional[str]:
+        envelope = self.envelope
+        return envelope.type if envelope else None
+
+    @property
+    def sender(self) -> Optional[str]:
+        envelope = self.envelope
+        return envelope.sender if envelope else None
+
+    @property
+    def text(self) -> Optional[str]:
+        envelope = self.envelope
+        return envelope.message if envelope else None
+
+
+class MessageStream:
+    """
+    Messages of a channel consumed with async for, through a buffer bounded
+    to max_msgs messages and max_bytes bytes. When a message arrives at a full
+    buffer, overflow decides: "drop_new" discards it (what a NATS server does
+    to a slow consumer), "drop_oldest" discards the oldest buffered messages
+    to make room, and "error" ends the iteration with MessageOverflowError.
+
+    With "drop_new" the limits are also the pending limits of the NATS
+    subscription, so a burst the callback has not copied into the buffer yet
+    is dropped by the NATS client the same way. The other policies must see
+    every message to apply, so their subscription keeps the NATS defaults
+    (or the stream limits, if larger).
+    """
+
+    def __init__(self, client: "ChatClient", channel: str, max_msgs: int, max_bytes: int, overflow: str):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.client = client
+        self.channel = channel
+        self.max_msgs = max_msgs
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        self.buffer = deque()
+        self.pending_bytes = 0
+        self.dropped = 0
+        self.subscription = None
+        self.closed = False
+        self.error = None
+        self.ready = asyncio.Event()
+
+    async def start(self):
+        if self.subscription is None and not self.closed:
+            if self.overflow == "drop_new":
+                limits = (self.max_msgs, self.max_bytes)
+            else:
+                limits = (max(self.max_msgs, DEFAULT_SUB_PENDING_MSGS_LIMIT), max(self.max_bytes, DEFAULT_SUB_PENDING_BYTES_LIMIT))
+            self.subscription = await self.client.nc.subscribe(
+                self.channel, cb=self._on_message, pending_msgs_limit=limits[0], pending_bytes_limit=limits[1],
+            )
+        return self
+
+    async def _on_message(self, msg):
+        if self.closed:
+            return
+        size = len(msg.data)
+        if len(self.buffer) >= self.max_msgs or self.pending_bytes + size > self.max_bytes:
+            if self.overflow == "drop_new" or size > self.max_bytes:
+                self.dropped += 1
+                return
+            if self.overflow == "error":
+                self.dropped += 1
+                self.error = MessageOverflowError(f"{self.channel}: more than {self.max_msgs} messages or {self.max_bytes} bytes pending")
+                await self.close()
+                return
+            while self.buffer and (len(self.buffer) >= self.max_msgs or self.pending_bytes + size > self.max_bytes):
+                self.pending_bytes -= len(self.buffer.popleft().data)
+                self.dropped += 1
+
+        self.buffer.append(ChatMessage(msg.subject, msg.data))
+        self.pending_bytes += size
+        self.ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatMessage:
+        await self.start()
+        while not self.buffer:
+            if self.closed:
+                if self.error is not None:
+                    raise self.error
+                raise StopAsyncIteration
+            self.ready.clear()
+            await self.ready.wait()
+        message = self.buffer.popleft()
+        self.pending_bytes -= len(message.data)
+        return message
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Stop receiving; messages already buffered can still be read"""
+        if self.closed:
+            return
+        self.closed = True
+        self.ready.set()
+        self.client.streams.discard(self)
+        if self.subscription is not None:
+            subscription, self.subscription = self.subscription, None
+            await subscription.unsubscribe()
+
+
 class ChatClient:
-    def __init__(self, server_url=None, username=None, auth_token=None, client_id=None):
+    def __init__(self, server_url=None, username=None, auth_token=None, client_id=None, trace_messages=False,
+                 publish_rate=None, publish_burst=None, flush_interval=None, wildcard=None, sub_allow=None):
         self.server_url = server_url or os.getenv("NATS_SERVER_URL", "nats://0.0.0.0:4222")
         self.username = username or os.getenv("DEFAULT_USERNAME") or f"user_{uuid.uuid4().hex[:8]}"
         self.client_id = client_id or str(uuid.uuid4())
         self.auth_token = auth_token
-        self.nc = Client()
+        # Always attach a trace context to sent messages, regardless of TRACE_SAMPLE_RATE
+        self.trace_messages = trace_messages
+        # Optional client-side send limit (messages/second, burst); 0, the default, disables it.
+        # The server enforces the real limits either way
+        self.publish_rate = float(publish_rate if publish_rate is not None else os.getenv("CHAT_CLIENT_PUBLISH_RATE", "0"))
+        self.publish_burst = int(publish_burst if publish_burst is not None else os.getenv("CHAT_CLIENT_PUBLISH_BURST", "20"))
+        self.rate_limiter = RateLimiter(max_keys=1)
+        # Seconds between background flushes of published messages; 0 leaves flushing to the connection
+        self.flush_interval = float(flush_interval if flush_interval is not None else os.getenv("CHAT_CLIENT_FLUSH_INTERVAL", "0"))
+        self.flush_task = None
+        self.unflushed = 0
+        self.nc = new_client(self.server_url)
         self.chat_channel = os.getenv("CHAT_CHANNEL", "chat.general")
-        self.private_channel = f"chat.private.{self.client_id}"
+        self.private_channel = f"{PRIVATE_PREFIX}{self.client_id}"
 
         self.subscriptions: Dict[str, Any] = {}
         self.joined_groups: Dict[str, Any] = {}
 
+        self.streams = set()
+
+        # Subjects this client may subscribe to (from its JWT); None means unrestricted
+        self.sub_allow = sub_allow
+        # Wildcard mode: one subscription to e.g. chat.> and a local subject -> handler table,
+        # used only if the permissions cover the whole wildcard
+        wildcard = wildcard if wildcard is not None else os.getenv("CHAT_CLIENT_WILDCARD") or None
+        if wildcard and not self._may_subscribe(wildcard):
+            print(f"Not permitted to subscribe to {wildcard}, using one subscription per channel")
+            wildcard = None
+        self.wildcard = wildcard
+        self.wildcard_subscription = None
         self.channel_handlers: Dict[str, Any] = {}
+        self.unrouted = 0
+
+        # Envelopes with this client's fixed fields pre-serialized
+        self.templates = {kind: EnvelopeTemplate(kind, self.username, self.client_id)
+                          for kind in ("message", "private")}
         
     async def connect(self):
         """
@@ -42,7 +277,7 @@ class ChatClient:
         # Add authentication if available
         if self.auth_token:
             # Convert auth token to string for NATS connection
-            auth_token_str = json.dumps(self.auth_token.to_dict())
+            auth_token_str = serialization.dumps_text(self.auth_token.to_dict())
             
             # Add authentication to connect options
             connect_opts["user"] = self.username
@@ -56,34 +291,99 @@ class ChatClient:
         
         # Subscribe to private messages
         await self.nc.subscribe(self.private_channel, cb=self.private_message_handler)
-        
-        # Announce join
-        join_msg = {
-            "type": "join",
-            "sender": self.username,
-            "sender_id": self.client_id,
-            "timestamp": asyncio.get_event_loop().time()
-        }
-        await self.nc.publish(self.chat_channel, json.dumps(join_msg).encode())
+        # No join announcement: presence is published in batches by the app's presence service
+
+    async def _publish(self, subject: str, payload: bytes):
+        """
+        Publish and, with a flush interval, make sure a flush follows
+        """
+        await self.nc.publish(subject, payload)
+        self.unflushed += 1
+        if self.flush_interval > 0 and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while self.unflushed:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self, timeout: float = 10):
+        """
+        Wait until the server has processed every message published so far
+        """
+        self.unflushed = 0
+        await self.nc.flush(timeout)
 
     async def subscribe_to_channel(self, channel: str, message_handler=None):
         """
         Subscribe to a NATS channel
         """
-        if channel in self.subscriptions:
+        if channel in self.subscriptions or channel in self.channel_handlers:
             print(f"Already subscribed to {channel}")
             return
+
+        if not self._may_subscribe(channel):
+            print(f"Not permitted to subscribe to {channel}")
+            return
+
+        if self.wildcard and subject_matches(self.wildcard, channel) and not channel.startswith(PRIVATE_PREFIX):
+            # Routed locally from the wildcard subscription
+            self.channel_handlers[channel] = message_handler or self.message_handler
+            if self.wildcard_subscription is None:
+                self.wildcard_subscription = await self.nc.subscribe(self.wildcard, cb=self._route_message)
+            print(f"Subscribed to {channel}")
+            return self.wildcard_subscription
         
         subscription = await self.nc.subscribe(channel, cb=message_handler or self.message_handler)
         self.subscriptions[channel] = subscription
 
         print(f"Subscribed to {channel}")
         return subscription
+
+    def _may_subscribe(self, subject: str) -> bool:
+        """
+        Whether the JWT permissions allow subscribing to subject (for a
+        wildcard, to every subject it matches)
+        """
+        if self.sub_allow is None:
+            return True
+        return any(subject_covers(allowed, subject) for allowed in self.sub_allow)
+
+    async def _route_message(self, msg):
+        """
+        Dispatch a message of the wildcard subscription to its channel's handler
+        """
+        if msg.subject.startswith(PRIVATE_PREFIX):
+            # Private messages have their own subscription
+            return
+        handler = self.channel_handlers.get(msg.subject)
+        if handler is None:
+            # A subject under the wildcard that this client has not joined
+            self.unrouted += 1
+            return
+        await handler(msg)
     
+    def messages(self, channel: str, max_msgs: int = 1000, max_bytes: int = 8 * 1024 * 1024,
+                 overflow: str = "drop_new") -> MessageStream:
+        """
+        Consume a channel with async for; see MessageStream for the buffering
+        """
+        stream = MessageStream(self, channel, max_msgs, max_bytes, overflow)
+        self.streams.add(stream)
+        return stream
+
     async def unsubscribe_from_channel(self, channel: str):
         """
         Unsubscribe from a NATS channel
         """
+        if channel in self.channel_handlers:
+            del self.channel_handlers[channel]
+            if not self.channel_handlers and self.wildcard_subscription is not None:
+                # Nothing left to route, stop receiving everything under the wildcard
+                await self.wildcard_subscription.unsubscribe()
+                self.wildcard_subscription = None
+            return
+
         if channel not in self.subscriptions:
             print(f"Not subscribed to {channel}")
             return
@@ -91,8 +391,6 @@ class ChatClient:
         await self.subscriptions[channel].unsubscribe()
         
         del self.subscriptions[channel]
-        if channel in self.channel_handlers:
-            del self.channel_handlers[channel]
     
     async def join_group(self, group_name: str):
         """
@@ -106,19 +404,14 @@ class ChatClient:
         if group_channel in self.joined_groups:
             print(f"Already joined group {group_name}")
             return
+
+        if not self._may_subscribe(group_channel):
+            print(f"Not permitted to join group {group_name}")
+            return
         
         await self.subscribe_to_channel(group_channel)
 
         self.joined_groups[group_channel] = group_name
-
-        join_msg = {
-            "type": "join",
-            "sender": self.username,
-            "sender_id": self.client_id,
-            "timestamp": asyncio.get_event_loop().time()
-        }
-
-        await self.nc.publish(group_channel, json.dumps(join_msg).encode())
     
     async def leave_group(self, group_name: str):
         """
@@ -132,15 +425,7 @@ class ChatClient:
         if group_channel not in self.joined_groups:
             print(f"Not a member of group {group_name}")
             return
-            
-        leave_msg = {
-            "type": "leave",
-            "sender": self.username,
-            "sender_id": self.client_id,
-            "timestamp": asyncio.get_event_loop().time()
-        }
-        
-        await self.nc.publish(group_channel, json.dumps(leave_msg).encode())
+
         await self.unsubscribe_from_channel(group_channel)
         
         del self.joined_groups[group_channel]
@@ -149,74 +434,115 @@ class ChatClient:
         """
         Send a message to a group
         """
-        if not group_name.startswith("chat."):
-            group_channel = f"chat.{group_name}"
-        else:
-            group_channel = group_name
-            
+        group_channel = self._group_channel(group_name)
+        if group_channel is None:
+            return False
+
+        retry_after = self.rate_limiter.acquire("send", self.publish_rate, self.publish_burst)
+        if retry_after:
+            print(f"Sending too fast to {group_name}, retry in {retry_after:.2f}s")
+            return False
+
+        await self._publish(group_channel, self._message_payload(message))
+        return True
+
+    async def send_many(self, group_name: str, messages: Iterable[str], flush_every: int = 0) -> int:
+        """
+        Send several messages to a group: membership is checked once and the
+        envelopes come from the template. With flush_every, waits for the
+        server every flush_every messages and after the last one, which bounds
+        how much is buffered unacknowledged. Stops early when the send limit is
+        reached; returns the number of messages sent.
+        """
+        group_channel = self._group_channel(group_name)
+        if group_channel is None:
+            return 0
+
+        sent = 0
+        for message in messages:
+            retry_after = self.rate_limiter.acquire("send", self.publish_rate, self.publish_burst)
+            if retry_after:
+                print(f"Sending too fast to {group_name}, retry in {retry_after:.2f}s")
+                break
+            await self._publish(group_channel, self._message_payload(message))
+            sent += 1
+            if flush_every and sent % flush_every == 0:
+                await self.flush()
+        if flush_every and sent % flush_every:
+            await self.flush()
+        return sent
+
+    def _group_channel(self, group_name: str) -> Optional[str]:
+        """
+        The subject of a group this client may send to, or None
+        """
+        group_channel = group_name if group_name.startswith("chat.") else f"chat.{group_name}"
         if group_channel not in self.joined_groups and group_channel != self.chat_channel:
             print(f"Not a member of group {group_name}. Join the group first.")
-            return False
-            
+            return None
+        return group_channel
+
+    def _message_payload(self, message: str) -> bytes:
+        trace = start_trace("chat_client", force=self.trace_messages)
+        if trace is None:
+            return self.templates["message"].render(message)
+
         message_data = {
+            "v": ENVELOPE_VERSION,
             "type": "message",
             "sender": self.username,
             "sender_id": self.client_id,
             "message": message,
-            "timestamp": asyncio.get_event_loop().time()
+            "timestamp": time.time()
         }
-        
-        await self.nc.publish(group_channel, json.dumps(message_data).encode())
-        return True
+        mark_sent(trace)
+        message_data[TRACE_FIELD] = trace
+        return serialization.dumps(message_data)
     
     async def send_private_message(self, recipient_id: str, message: str):
         """
         Send a private message to another user
         """
-        message_data = {
-            "type": "private",
-            "sender": self.username,
-            "sender_id": self.client_id,
-            "message": message,
-            "timestamp": asyncio.get_event_loop().time()
-        }
-        
-        await self.nc.publish(f"chat.private.{recipient_id}", json.dumps(message_data).encode())
+        await self._publish(f"{PRIVATE_PREFIX}{recipient_id}", self.templates["private"].render(message))
         return True
     
     async def message_handler(self, msg):
         """
         Default message handler for group messages
         """
-        data = json.loads(msg.data.decode())
-        if data.get("sender_id") != self.client_id:
-            if data.get("type") == "join":
-                print(f">> {data['sender']} has joined the chat")
-            elif data.get("type") == "leave":
-                print(f">> {data['sender']} has left the chat")
+        try:
+            envelope = parse_chat_envelope(msg.data)
+        except ValidationError:
+            # Not a chat envelope (or from a newer client version)
+            return
+        if envelope.sender_id != self.client_id:
+            # Clients before batched presence still announce joins and leaves
+            if envelope.type == "join":
+                print(f">> {envelope.sender} has joined the chat")
+            elif envelope.type == "leave":
+                print(f">> {envelope.sender} has left the chat")
             else:
-                print(f"{data['sender']}: {data['message']}")
+                print(f"{envelope.sender}: {envelope.message}")
     
     async def private_message_handler(self, msg):
         """
         Default message handler for private messages
         """
-        data = json.loads(msg.data.decode())
-        print(f"[PRIVATE] {data['sender']}: {data['message']}")
+        try:
+            envelope = parse_chat_envelope(msg.data)
+        except ValidationError:
+            return
+        print(f"[PRIVATE] {envelope.sender}: {envelope.message}")
         
     async def close(self):
         """
         Close the NATS connection
         """
-        # Send leave message to all joined groups
-        for group_channel in list(self.joined_groups.keys()):
-            leave_msg = {
-                "type": "leave",
-                "sender": self.username,
-                "sender_id": self.client_id,
-                "timestamp": asyncio.get_event_loop().time()
-            }
-            await self.nc.publish(group_channel, json.dumps(leave_msg).encode())
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        for stream in list(self.streams):
+            await stream.close()
             
         # Close NATS connection
         await self.nc.close()
@@ -5,6 +5,8 @@ import asyncio
 
 from dotenv import load_dotenv
 
+from app.utils.nats_helpers import extract_jwt_and_nkeys_seed_from_file
+
 load_dotenv()
 
 NSC_PATH = "nsc"  # giả định nsc đã được cài và trong $PATH
@@ -59,6 +61,31 @@ def create_user(username, account):
     run_ncs_command(["add", "user", username, "--account", account])
     print(f"User {username} created successfully.")
 
+def mint_user_credentials(username, account):
+    """
+    Create a NATS user with nsc and return its parsed credentials.
+    Runs inside bulk import worker processes, so it must not touch the database.
+    """
+    create_user(username, account)
+    jwt, seed, public_key, account_public_key = extract_jwt_and_nkeys_seed_from_file(get_creds_path(username))
+    if not jwt or not seed or not public_key or not account_public_key:
+        raise RuntimeError(f"Failed to read NATS credentials for user {username}")
+    return {
+        "jwt": jwt,
+        "seed": seed,
+        "public_key": public_key,
+        "account_public_key": account_public_key,
+    }
+
+def delete_user_credentials(username, account):
+    """
+    Delete a NATS user created by mint_user_credentials, revoking its JWT and
+    removing its nkey and creds file. Used when the user could not be stored.
+    """
+    print(f"Deleting user {username} from account {account}...")
+    run_ncs_command(["delete", "user", "--name", username, "--account", account,
+                     "--revoke", "--rm-nkey", "--rm-creds"])
+
 def get_users(account):
     output = run_ncs_command(["list", "users", "--account", account], capture_output=True)
     if output:
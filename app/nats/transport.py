@@ -0,0 +1,402 @@
+"""
+Pluggable NATS transport.
+
+new_client(url) returns the client for a NATS URL: a nats-py Client, or, for
+inproc:// URLs, a client of an in-process broker. The in-process client
+implements the part of the nats-py API this project uses (publish with
+headers, subscribe with * and > wildcards and queue groups, request/reply,
+flush, drain, close) and hands out nats-py Msg objects, so the app, the auth
+service and ChatClient run unchanged with no NATS server. Clients connecting
+to the same inproc:// URL (e.g. inproc://test) share a broker.
+
+Delivery is asynchronous as with a server: publish() only queues the message
+on every matching subscription, each subscription with a callback runs it
+from its own task, in order, a queue group gets each message once, and a
+subscription with pending_msgs_limit messages or pending_bytes_limit bytes
+waiting drops new ones (a slow consumer).
+"""
+
+import asyncio
+import itertools
+import logging
+import random
+import uuid
+from typing import Dict, Generic, List, Optional, TypeVar
+
+from nats.aio.client import Client
+from nats.aio.msg import Msg
+from nats.aio.subscription import DEFAULT_SUB_PENDING_BYTES_LIMIT
+from nats.errors import (
+    BadSubjectError,
+    ConnectionClosedError,
+    NoRespondersError,
+    SlowConsumerError,
+    TimeoutError,
+)
+
+logger = logging.getLogger(__name__)
+
+INPROC_SCHEME = "inproc://"
+DEFAULT_PENDING_MSGS_LIMIT = 512 * 1024
+
+T = TypeVar("T")
+
+
+def new_client(url: Optional[str]):
+    """A NATS client for url: in-process for inproc:// URLs, nats-py otherwise"""
+    if url and url.startswith(INPROC_SCHEME):
+        return InProcessClient()
+    return Client()
+
+
+# Subjects
+
+def check_subject(subject: str, wildcards: bool = False):
+    """Raise BadSubjectError for subjects a server would reject"""
+    if not subject or any(c.isspace() for c in subject):
+        raise BadSubjectError
+    tokens = subject.split(".")
+    for i, token in enumerate(tokens):
+        if not token:
+            raise BadSubjectError
+        if token in ("*", ">") and not wildcards:
+            raise BadSubjectError
+        if token == ">" and i != len(tokens) - 1:
+            raise BadSubjectError
+
+
+def subject_matches(pattern: str, subject: str) -> bool:
+    """Whether subject matches pattern, where * matches one token and a final > one or more"""
+    if pattern == subject:
+        return True
+    pattern_tokens = pattern.split(".")
+    subject_tokens = subject.split(".")
+    for i, token in enumerate(pattern_tokens):
+        if token == ">":
+            return len(subject_tokens) > i
+        if i >= len(subject_tokens) or (token != "*" and token != subject_tokens[i]):
+            return False
+    return len(pattern_tokens) == len(subject_tokens)
+
+
+def subject_covers(pattern: str, other: str) -> bool:
+    """Whether every subject matching the pattern other also matches pattern"""
+    pattern_tokens = pattern.split(".")
+    other_tokens = other.split(".")
+    for i, token in enumerate(pattern_tokens):
+        if token == ">":
+            return len(other_tokens) > i
+        if i >= len(other_tokens) or other_tokens[i] == ">":
+            return False
+        if token != "*" and token != other_tokens[i]:
+            return False
+    return len(pattern_tokens) == len(other_tokens)
+
+
+def is_wildcard(pattern: str) -> bool:
+    return any(token in ("*", ">") for token in pattern.split("."))
+
+
+class SubjectIndex(Generic[T]):
+    """Values registered under subject patterns, looked up by concrete subject"""
+
+    def __init__(self):
+        # Literal subjects are a dict lookup; only wildcard patterns are scanned
+        self.literal: Dict[str, List[T]] = {}
+        self.wildcard: Dict[str, List[T]] = {}
+
+    def add(self, pattern: str, value: T):
+        table = self.wildcard if is_wildcard(pattern) else self.literal
+        table.setdefault(pattern, []).append(value)
+
+    def remove(self, pattern: str, value: T):
+        table = self.wildcard if is_wildcard(pattern) else self.literal
+        values = table.get(pattern)
+        if values and value in values:
+            values.remove(value)
+            if not values:
+                del table[pattern]
+
+    def match(self, subject: str) -> List[T]:
+        matches = list(self.literal.get(subject, ()))
+        for pattern, values in self.wildcard.items():
+            if subject_matches(pattern, subject):
+                matches.extend(values)
+        return matches
+
+    def __len__(self):
+        return sum(len(values) for values in self.literal.values()) + sum(len(values) for values in self.wildcard.values())
+
+
+# In-process broker
+
+class InProcessBroker:
+    def __init__(self):
+        self.subscriptions: SubjectIndex["InProcessSubscription"] = SubjectIndex()
+        self.sids = itertools.count(1)
+
+    def add(self, subscription: "InProcessSubscription"):
+        self.subscriptions.add(subscription.subject, subscription)
+
+    def remove(self, subscription: "InProcessSubscription"):
+        self.subscriptions.remove(subscription.subject, subscription)
+
+    def publish(self, subject: str, data: bytes, reply: str = "", headers: Optional[Dict[str, str]] = None) -> int:
+        """Queue a message on every matching subscription, one per queue group; returns the number of receivers"""
+        groups: Dict[str, List[InProcessSubscription]] = {}
+        receivers = 0
+        for subscription in self.subscriptions.match(subject):
+            if subscription.queue:
+                groups.setdefault(subscription.queue, []).append(subscription)
+            else:
+                subscription.enqueue(subject, data, reply, headers)
+                receivers += 1
+        for members in groups.values():
+            random.choice(members).enqueue(subject, data, reply, headers)
+            receivers += 1
+        return receivers
+
+
+_brokers: Dict[str, InProcessBroker] = {}
+
+
+def get_broker(url: str) -> InProcessBroker:
+    """The broker behind an inproc:// URL, created on first use"""
+    name = url[len(INPROC_SCHEME):].strip("/") or "default"
+    broker = _brokers.get(name)
+    if broker is None:
+        broker = _brokers[name] = InProcessBroker()
+    return broker
+
+
+class InProcessSubscription:
+    def __init__(self, client: "InProcessClient", sid: int, subject: str, queue: str = "", cb=None,
+                 max_msgs: int = 0, pending_msgs_limit: int = DEFAULT_PENDING_MSGS_LIMIT,
+                 pending_bytes_limit: int = DEFAULT_SUB_PENDING_BYTES_LIMIT):
+        self._client = client
+        self._id = sid
+        self._subject = subject
+        self._queue = queue
+        self._cb = cb
+        self._max_msgs = max_msgs
+        self._pending_msgs_limit = pending_msgs_limit
+        # 0 or less: no byte limit
+        self._pending_bytes_limit = pending_bytes_limit
+        self._pending: asyncio.Queue = asyncio.Queue()
+        self._pending_size = 0
+        self._received = 0
+        self._closed = False
+        self._task = asyncio.create_task(self._run()) if cb is not None else None
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def subject(self) -> str:
+        return self._subject
+
+    @property
+    def queue(self) -> str:
+        return self._queue
+
+    @property
+    def pending_msgs(self) -> int:
+        return self._pending.qsize()
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._pending_size
+
+    def enqueue(self, subject: str, data: bytes, reply: str, headers: Optional[Dict[str, str]]):
+        if self._closed:
+            return
+        if self._pending.qsize() >= self._pending_msgs_limit or (
+                self._pending_bytes_limit > 0 and self._pending_size + len(data) > self._pending_bytes_limit):
+            self.dropped += 1
+            self._client._slow_consumer(self)
+            return
+        msg = Msg(_client=self._client, subject=subject, reply=reply, data=data,
+                  headers=dict(headers) if headers else None, _sid=self._id)
+        self._pending.put_nowait(msg)
+        self._pending_size += len(data)
+        self._received += 1
+        # Like the server, stop sending once max_msgs have been sent
+        if self._max_msgs and self._received >= self._max_msgs:
+            self._client.broker.remove(self)
+
+    async def _run(self):
+        while True:
+            msg = await self._pending.get()
+            try:
+                if msg is None:
+                    return
+                self._pending_size -= len(msg.data)
+                self.delivered += 1
+                await self._cb(msg)
+            except Exception as e:
+                logger.error("Error in callback for %s: %s", self._subject, e)
+            finally:
+                self._pending.task_done()
+            if self._max_msgs and self.delivered >= self._max_msgs:
+                self._stop()
+                return
+
+    async def next_msg(self, timeout: Optional[float] = 1.0) -> Msg:
+        if self._cb is not None:
+            raise RuntimeError("next_msg is not available on subscriptions with a callback")
+        if self._closed and self._pending.empty():
+            raise ConnectionClosedError
+        try:
+            msg = await asyncio.wait_for(self._pending.get(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError
+        if msg is None:
+            raise ConnectionClosedError
+        self._pending_size -= len(msg.data)
+        self.delivered += 1
+        return msg
+
+    @property
+    def messages(self):
+        async def iterate():
+            while True:
+                try:
+                    yield await self.next_msg(timeout=None)
+                except ConnectionClosedError:
+                    return
+        return iterate()
+
+    def _stop(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._client.broker.remove(self)
+        self._client._subscriptions.pop(self._id, None)
+        # Wakes up the delivery task or a waiting next_msg
+        self._pending.put_nowait(None)
+
+    async def unsubscribe(self, limit: int = 0):
+        if limit and self.delivered < limit:
+            self._max_msgs = limit
+            if self._received >= limit:
+                self._client.broker.remove(self)
+            return
+        self._stop()
+
+    async def drain(self):
+        """Stop receiving and wait for the messages already queued to be handled"""
+        self._client.broker.remove(self)
+        if self._task is not None and not self._closed:
+            await self._pending.join()
+        self._stop()
+
+
+class InProcessClient:
+    """A NATS client connected to an InProcessBroker, for inproc:// URLs"""
+
+    def __init__(self):
+        self.broker: Optional[InProcessBroker] = None
+        self.options: Dict = {}
+        self._subscriptions: Dict[int, InProcessSubscription] = {}
+        self._connected = False
+        self._closed = False
+        self._inbox_prefix = f"_INBOX.{uuid.uuid4().hex}"
+        self._inbox_ids = itertools.count(1)
+
+    async def connect(self, servers=None, **options):
+        url = servers if isinstance(servers, str) else (servers or [INPROC_SCHEME])[0]
+        if not url.startswith(INPROC_SCHEME):
+            raise ValueError(f"Not an in-process NATS URL: {url}")
+        self.options = options
+        self.broker = get_broker(url)
+        self.connected_url = url
+        self._connected = True
+        self._closed = False
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected and not self._closed
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    @property
+    def is_reconnecting(self) -> bool:
+        return False
+
+    @property
+    def is_draining(self) -> bool:
+        return False
+
+    @property
+    def pending_data_size(self) -> int:
+        # Nothing is buffered: publish() hands messages to the broker directly
+        return 0
+
+    def _check_connected(self):
+        if not self.is_connected:
+            raise ConnectionClosedError
+
+    def _slow_consumer(self, subscription: InProcessSubscription):
+        error_cb = self.options.get("error_cb")
+        if error_cb is not None:
+            error = SlowConsumerError(subject=subscription.subject, reply="", sid=subscription._id, sub=subscription)
+            asyncio.ensure_future(error_cb(error))
+        elif subscription.dropped == 1:
+            logger.warning("Slow consumer on %s: dropping messages", subscription.subject)
+
+    def new_inbox(self) -> str:
+        return f"{self._inbox_prefix}.{next(self._inbox_ids)}"
+
+    async def publish(self, subject: str, payload: bytes = b"", reply: str = "",
+                      headers: Optional[Dict[str, str]] = None) -> None:
+        self._check_connected()
+        check_subject(subject)
+        self.broker.publish(subject, payload, reply, headers)
+
+    async def subscribe(self, subject: str, queue: str = "", cb=None, future=None, max_msgs: int = 0,
+                        pending_msgs_limit: int = DEFAULT_PENDING_MSGS_LIMIT,
+                        pending_bytes_limit: int = DEFAULT_SUB_PENDING_BYTES_LIMIT) -> InProcessSubscription:
+        self._check_connected()
+        check_subject(subject, wildcards=True)
+        subscription = InProcessSubscription(self, next(self.broker.sids), subject, queue, cb, max_msgs,
+                                             pending_msgs_limit, pending_bytes_limit)
+        self._subscriptions[subscription._id] = subscription
+        self.broker.add(subscription)
+        return subscription
+
+    async def request(self, subject: str, payload: bytes = b"", timeout: float = 0.5, old_style: bool = False,
+                      headers: Optional[Dict[str, str]] = None) -> Msg:
+        self._check_connected()
+        check_subject(subject)
+        inbox = self.new_inbox()
+        subscription = await self.subscribe(inbox, max_msgs=1)
+        try:
+            if not self.broker.publish(subject, payload, inbox, headers):
+                raise NoRespondersError
+            return await subscription.next_msg(timeout)
+        finally:
+            await subscription.unsubscribe()
+
+    async def flush(self, timeout: float = 10) -> None:
+        # Published messages are queued on their subscriptions already; let the loop run once
+        self._check_connected()
+        await asyncio.sleep(0)
+
+    async def drain(self) -> None:
+        if self._closed:
+            return
+        for subscription in list(self._subscriptions.values()):
+            await subscription.drain()
+        await self.close()
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        for subscription in list(self._subscriptions.values()):
+            subscription._stop()
+        self._closed = True
+        self._connected = False
+        closed_cb = self.options.get("closed_cb")
+        if closed_cb is not None:
+            await closed_cb()
@@ -1,8 +1,16 @@
+from collections import defaultdict
+from typing import List
 from fastapi import Depends
+from sqlalchemy import case, func, insert, literal_column, update
 from sqlalchemy.orm import Session
-from app.database.models import Message
+from app.database.models import Message, NatsRoom, User
 from app.database.db import get_db
+from app.shared.metrics import instrument_queries
 
+# Text search configuration of messages.search_vector; queries must use the same one
+SEARCH_CONFIG = "english"
+
+@instrument_queries
 class MessageQueries:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
@@ -15,6 +23,74 @@ class MessageQueries:
         self.db.refresh(db_message)
         return db_message
     
+    # Insert a batch of room messages in one statement, numbering them within their rooms
+    def create_room_messages(self, rows: List[dict]):
+        if not rows:
+            return
+        by_room = defaultdict(list)
+        for row in rows:
+            by_room[row["room_id"]].append(row)
+
+        # One counter update per room per batch; ascending ids keep lock order stable across nodes
+        for room_id in sorted(by_room):
+            room_rows = sorted(by_room[room_id], key=lambda row: row["uid"])
+            newest = room_rows[-1]["uid"]
+            end = self.db.execute(
+                update(NatsRoom).where(NatsRoom.id == room_id).values(
+                    message_count=NatsRoom.message_count + len(room_rows),
+                    last_message_uid=case(
+                        (NatsRoom.last_message_uid > newest, NatsRoom.last_message_uid), else_=newest
+                    ),
+                ).returning(NatsRoom.message_count)
+            ).scalar_one()
+            for offset, row in enumerate(room_rows):
+                row["seq"] = end - len(room_rows) + offset + 1
+
+        self.db.execute(insert(Message), rows)
+        self.db.commit()
+    
+    # Map message uids to (room_id, seq) of the persisted messages
+    def get_seqs_by_uids(self, uids: list):
+        if not uids:
+            return {}
+        rows = self.db.query(Message.uid, Message.room_id, Message.seq).filter(Message.uid.in_(uids)).all()
+        return {row.uid: (row.room_id, row.seq) for row in rows}
+    
+    # Get a page of room messages older than before_uid, newest first (keyset pagination)
+    def get_room_messages_before(self, room_id: int, before_uid: int = None, limit: int = 50):
+        query = self.db.query(Message, User.username).outerjoin(
+            User, Message.user_id == User.id
+        ).filter(Message.room_id == room_id)
+        if before_uid is not None:
+            query = query.filter(Message.uid < before_uid)
+        return query.order_by(Message.uid.desc()).limit(limit).all()
+    
+    # Full-text search over messages in the given rooms, best matches first
+    def search_room_messages(self, room_ids: List[int], query: str, limit: int = 20, offset: int = 0):
+        if not room_ids:
+            return []
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        # Column maintained by a Postgres trigger, see migration 9b4e1f6c2a57
+        search_vector = literal_column("messages.search_vector")
+        rank = func.ts_rank_cd(search_vector, tsquery).label("rank")
+
+        # Rank and page on ids first so snippets are only built for the returned page
+        page = self.db.query(Message.id, rank).filter(
+            Message.room_id.in_(room_ids),
+            search_vector.op("@@")(tsquery),
+        ).order_by(rank.desc(), Message.uid.desc()).offset(offset).limit(limit).subquery()
+
+        snippet = func.ts_headline(
+            SEARCH_CONFIG, Message.content, tsquery, "MaxFragments=1, MaxWords=24, MinWords=8"
+        ).label("snippet")
+        return self.db.query(Message, User.username, NatsRoom.name, page.c.rank, snippet).join(
+            page, Message.id == page.c.id
+        ).join(
+            NatsRoom, Message.room_id == NatsRoom.id
+        ).outerjoin(
+            User, Message.user_id == User.id
+        ).order_by(page.c.rank.desc(), Message.uid.desc()).all()
+    
     # Get messages for a group
     def get_group_messages(self, group_id: int, skip: int = 0, limit: int = 100):
         return self.db.query(Message).filter(
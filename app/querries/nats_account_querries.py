@@ -2,7 +2,9 @@ from fastapi import Depends
 from sqlalchemy.orm import Session
 from app.database.models import NatsAccount
 from app.database.db import get_db
+from app.shared.metrics import instrument_queries
 
+@instrument_queries
 class NatsAccountQueries:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
@@ -2,8 +2,10 @@ from fastapi import Depends
 from sqlalchemy.orm import Session
 from app.database.models import NatsAuthSession
 from app.database.db import get_db
+from app.shared.metrics import instrument_queries
 from datetime import datetime
 
+@instrument_queries
 class NatsAuthSessionQueries:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
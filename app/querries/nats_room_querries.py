@@ -1,8 +1,12 @@
+from typing import List
 from fastapi import Depends
+from sqlalchemy import bindparam, func, literal, or_, select, update
 from sqlalchemy.orm import Session
-from app.database.models import NatsRoom, NatsUserRoom, User
+from app.database.models import Message, NatsAccount, NatsRoom, NatsUserRoom, User
 from app.database.db import get_db
+from app.shared.metrics import instrument_queries
 
+@instrument_queries
 class NatsRoomQueries:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
@@ -15,6 +19,13 @@ class NatsRoomQueries:
     def get_room_by_name(self, name: str):
         return self.db.query(NatsRoom).filter(NatsRoom.name == name).first()
     
+    # Map room names to ids
+    def get_room_ids_by_names(self, names: list):
+        if not names:
+            return {}
+        rows = self.db.query(NatsRoom.id, NatsRoom.name).filter(NatsRoom.name.in_(names)).all()
+        return {row.name: row.id for row in rows}
+    
     # Get rooms by account ID
     def get_rooms_by_account(self, account_id: int):
         return self.db.query(NatsRoom).filter(NatsRoom.account_id == account_id).all()
@@ -50,7 +61,14 @@ class NatsRoomQueries:
         ).first()
         
         if not exists:
-            user_room = NatsUserRoom(user_id=user_id, room_id=room_id)
+            # New members start with everything already sent marked as read
+            room = self.get_room(room_id)
+            user_room = NatsUserRoom(
+                user_id=user_id,
+                room_id=room_id,
+                last_read_seq=(room.message_count or 0) if room else 0,
+                last_read_uid=room.last_message_uid if room else None,
+            )
             self.db.add(user_room)
             self.db.commit()
             return user_room
@@ -88,6 +106,55 @@ class NatsRoomQueries:
             NatsUserRoom, NatsRoom.id == NatsUserRoom.room_id
         ).filter(NatsUserRoom.user_id == user.id).all()
     
+    # Names and account publish limits of a user's rooms, as plain rows (no ORM objects kept in the session)
+    def get_room_limits_for_user(self, username: str):
+        return self.db.query(
+            NatsRoom.name,
+            NatsAccount.id.label("account_id"),
+            NatsAccount.user_publish_rate,
+            NatsAccount.user_publish_burst,
+            NatsAccount.room_publish_rate,
+            NatsAccount.room_publish_burst,
+        ).join(
+            NatsUserRoom, NatsRoom.id == NatsUserRoom.room_id
+        ).join(
+            User, NatsUserRoom.user_id == User.id
+        ).join(
+            NatsAccount, NatsRoom.account_id == NatsAccount.id
+        ).filter(User.username == username).all()
+
+    # Unread message count for every room of a user: messages with a newer uid than
+    # the read marker, counted on the (room_id, uid) index and capped at limit
+    def get_unread_counts(self, user_id: int, limit: int):
+        newer = select(literal(1)).where(
+            Message.room_id == NatsRoom.id,
+            Message.uid > func.coalesce(NatsUserRoom.last_read_uid, 0),
+        ).correlate(NatsRoom, NatsUserRoom).limit(limit).subquery()
+        return self.db.query(
+            NatsRoom.name,
+            select(func.count()).select_from(newer).scalar_subquery().label("unread"),
+            NatsRoom.last_message_uid,
+            NatsUserRoom.last_read_uid,
+        ).join(
+            NatsUserRoom, NatsRoom.id == NatsUserRoom.room_id
+        ).filter(NatsUserRoom.user_id == user_id).all()
+    
+    # Move read markers forward; markers never move back to an older message
+    def update_read_markers(self, markers: List[dict]):
+        if not markers:
+            return
+        table = NatsUserRoom.__table__
+        statement = update(table).where(
+            table.c.user_id == bindparam("b_user_id"),
+            table.c.room_id == bindparam("b_room_id"),
+            or_(table.c.last_read_uid.is_(None), table.c.last_read_uid < bindparam("b_uid")),
+        ).values(last_read_seq=bindparam("b_seq"), last_read_uid=bindparam("b_uid"))
+        self.db.connection().execute(statement, [
+            {"b_user_id": m["user_id"], "b_room_id": m["room_id"], "b_seq": m["seq"], "b_uid": m["uid"]}
+            for m in markers
+        ])
+        self.db.commit()
+    
     # Update room
     def update_room(self, room_id: int, **kwargs):
         self.db.query(NatsRoom).filter(NatsRoom.id == room_id).update(kwargs)
@@ -1,9 +1,12 @@
 from fastapi import Depends
 from sqlalchemy.orm import Session
-from app.database.models import User
+from app.database.models import NatsAccount, User
 from app.database.db import get_db
+from app.shared.metrics import instrument_queries
+from app.shared.credential_cache import credential_cache
 from datetime import datetime
 
+@instrument_queries
 class UserQueries:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
@@ -12,6 +15,12 @@ class UserQueries:
     def get_user(self, user_id: int):
         return self.db.query(User).filter(User.id == user_id).first()
     
+    # Name of the NATS account a user belongs to
+    def get_account_name(self, username: str):
+        return self.db.query(NatsAccount.name).join(
+            User, User.nats_account_id == NatsAccount.id
+        ).filter(User.username == username).scalar()
+
     # Get user by username
     def get_user_by_username(self, username: str):
         return self.db.query(User).filter(User.username == username).first()
@@ -22,6 +31,25 @@ class UserQueries:
             return user.hashed_password
         return None
     
+    # Get the subset of usernames that already exist
+    def get_existing_usernames(self, usernames: list):
+        if not usernames:
+            return set()
+        rows = self.db.query(User.username).filter(User.username.in_(usernames)).all()
+        return {row.username for row in rows}
+    
+    # Map usernames to user ids
+    def get_user_ids_by_usernames(self, usernames: list):
+        if not usernames:
+            return {}
+        rows = self.db.query(User.id, User.username).filter(User.username.in_(usernames)).all()
+        return {row.username: row.id for row in rows}
+    
+    # Replace a user's password hash
+    def update_hashed_password(self, user_id: int, hashed_password: str):
+        self.db.query(User).filter(User.id == user_id).update({"hashed_password": hashed_password})
+        self.db.commit()
+    
     # Get user by email
     def get_user_by_email(self, email: str):
         return self.db.query(User).filter(User.email == email).first()
@@ -45,7 +73,8 @@ class UserQueries:
     # Update user NATS credentials
     def update_user_nats_credentials(self, user_id: int, seed_hash: str, 
                                     account_id: int, 
-                                    expires_at=None):
+                                    expires_at=None, jwt: str = None,
+                                    public_key: str = None, account_public_key: str = None):
         user = self.get_user(user_id)
         if not user:
             return None
@@ -53,9 +82,15 @@ class UserQueries:
         user.nats_seed_hash = seed_hash
         user.nats_account_id = account_id
         user.nats_expires_at = expires_at
+        if jwt:
+            user.nats_jwt = jwt
+            user.nats_public_key = public_key
+            user.nats_account_public_key = account_public_key
 
         self.db.commit()
         self.db.refresh(user)
+        # Credentials were rotated, drop the cached copy
+        credential_cache.invalidate(user.username)
         return user
     
     # Get active NATS users (users with valid credentials)
@@ -68,12 +103,16 @@ class UserQueries:
     
     # Create new user with NATS credentials
     def create_user_with_nats_credentials(self, username: str, email: str, hashed_password: str, seed_hash: str,
-                                         account_id: int, expires_at=None):
+                                         account_id: int, expires_at=None, jwt: str = None,
+                                         public_key: str = None, account_public_key: str = None):
         db_user = User(
             username=username,
             email=email,
             hashed_password=hashed_password,
             nats_seed_hash=seed_hash,
+            nats_jwt=jwt,
+            nats_public_key=public_key,
+            nats_account_public_key=account_public_key,
             nats_account_id=account_id,
             nats_expires_at=expires_at
         )
@@ -91,4 +130,5 @@ class UserQueries:
         user.nats_expired_at = datetime.now()
         self.db.commit()
         self.db.refresh(user)
+        credential_cache.invalidate(user.username)
         return user
\ No newline at end of file
@@ -23,4 +23,6 @@ router = APIRouter()
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, current_user = Depends(get_current_user_ws)):
-    await user_rooms_websocket(websocket, current_user)
\ No newline at end of file
+    # ?trace_debug=1 adds server-side per-hop timings to every frame this client receives
+    trace_debug = websocket.query_params.get("trace_debug") in ("1", "true")
+    await user_rooms_websocket(websocket, current_user, trace_debug=trace_debug)
\ No newline at end of file
@@ -1,4 +1,8 @@
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from app.shared.envelopes import MAX_MESSAGE_LENGTH
 
 class MsgPayload(BaseModel):
     msg_id: int
@@ -42,3 +46,13 @@ class CreateUserRequest(BaseModel):
     username: str
     email: str
     password: str
+
+class PublishMessageRequest(BaseModel):
+    room: str
+    # Same limits as a message sent over the WebSocket
+    message: str = Field(max_length=MAX_MESSAGE_LENGTH)
+    type: Literal["message"] = "message"
+
+class MarkReadRequest(BaseModel):
+    room: str
+    message_id: int
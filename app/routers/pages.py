@@ -1,17 +1,16 @@
 from fastapi import APIRouter, Request
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
+from app.shared.templating import pages, templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/", response_class=HTMLResponse)
 async def read_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return pages.response(request, "index.html")
 
 @router.get("/about", response_class=HTMLResponse)
 async def read_about(request: Request):
-    return templates.TemplateResponse("about.html", {"request": request})
+    return pages.response(request, "about.html")
 
 @router.get("/messages", response_class=HTMLResponse)
 async def read_messages(request: Request):
@@ -21,13 +20,8 @@ async def read_messages(request: Request):
         {"id": 3, "content": "FastAPI is great for building APIs."},
     ]
 
-    return templates.TemplateResponse("messages.html", {"request": request, "messages": message_list, "page_title": "Messages"})
+    return templates.TemplateResponse(request, "messages.html", {"messages": message_list, "page_title": "Messages"})
 
 @router.get("/chat", response_class=HTMLResponse)
 async def get_chat(request: Request):
-    return templates.TemplateResponse("chat.html", 
-        {
-            "request": request, 
-            "page_title": "Real-time Chat"
-        }
-    )
\ No newline at end of file
+    return pages.response(request, "chat.html", {"page_title": "Real-time Chat"})
\ No newline at end of file
@@ -1,11 +1,17 @@
-from fastapi import Depends, HTTPException, WebSocket
+from fastapi import Depends, HTTPException, Query, WebSocket
 from fastapi import APIRouter
-from app.routers.models import CreateRoomRequest
+from fastapi.responses import Response
+from app.routers.models import CreateRoomRequest, MarkReadRequest
 from app.nats.client import ChatClient
 from nats.aio.client import Client as NATS
-from typing import Dict
+from typing import Dict, Optional
 import logging
 from app.auth.dependencies import get_current_user
+from app.services.chat_service import get_user_room_names, presence
+from app.services.history_service import HISTORY_ON_JOIN, get_room_history, history_frame
+from app.services.search_service import search_messages as search_messages_service
+from app.services.read_marker_service import read_markers
+from app.shared import serialization
 from app.services.room_service import (
    create_room_and_add_admin_user as create_room_and_add_admin_user_service,
    get_users_in_room as get_users_in_room_service,  
@@ -40,11 +46,58 @@ async def create_room(room: CreateRoomRequest, current_user: str = Depends(get_c
 async def join_room(room_name: str, current_user: str = Depends(get_current_user)):
     try:
         room = await join_room_service(current_user, room_name)
-        return {"message": f"User '{current_user}' joined room '{room['name']}' successfully."}
+        history = await get_room_history(room['name'], HISTORY_ON_JOIN) if HISTORY_ON_JOIN > 0 else []
+        return {
+            "message": f"User '{current_user}' joined room '{room['name']}' successfully.",
+            "history": [serialization.loads(envelope) for _, envelope in history],
+        }
     except Exception as e:
         logger.error(f"Error joining room {room_name}: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
     
+@router.get("/room_history/{room_name}")
+async def room_history(room_name: str, before: Optional[int] = None, limit: int = Query(50, ge=1, le=500),
+                       current_user: str = Depends(get_current_user)):
+    if room_name not in get_user_room_names(current_user):
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+    # Pages are pre-serialized envelopes, pass them through untouched
+    page = await get_room_history(room_name, limit, before)
+    return Response(content=history_frame(room_name, page), media_type="application/json")
+    
+@router.get("/room_online/{room_name}")
+async def room_online(room_name: str, current_user: str = Depends(get_current_user)):
+    if room_name not in get_user_room_names(current_user):
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+    return {"room": room_name, "online": presence.online(room_name)}
+
+@router.post("/mark_read")
+async def mark_read(marker: MarkReadRequest, current_user: str = Depends(get_current_user)):
+    if marker.room not in get_user_room_names(current_user):
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+    # Coalesced in memory and written in batches; markers only ever move forward
+    read_markers.mark(current_user, marker.room, marker.message_id)
+    return {"status": "accepted"}
+
+@router.get("/unread_counts")
+async def unread_counts(current_user: str = Depends(get_current_user)):
+    try:
+        return {"unread": await read_markers.get_unread_counts(current_user)}
+    except Exception as e:
+        logger.error(f"Error fetching unread counts for {current_user}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    
+@router.get("/search_messages")
+async def search_messages(q: str = Query(..., min_length=1, max_length=200), room: Optional[str] = None,
+                          limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0),
+                          current_user: str = Depends(get_current_user)):
+    try:
+        return await search_messages_service(current_user, q, room, limit, offset)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error searching messages for {current_user}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    
 @router.get("/get_users_in_room/{room_id}")
 async def get_users_in_room(room_id: str, current_user: str = Depends(get_current_user)):
     try:
@@ -0,0 +1,56 @@
+import math
+import time
+from fastapi import Depends, Header, HTTPException, Query
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import logging
+from app.auth.dependencies import get_current_user, get_current_user_sse
+from app.routers.models import PublishMessageRequest
+from app.services.chat_service import fanout, get_user_room_names, publish_room_message
+from app.services.rate_limit_service import publish_limiter
+from app.services.sse_service import room_event_stream
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/sse")
+async def sse_endpoint(current_user: str = Depends(get_current_user_sse),
+                       last_event_id: Optional[str] = Header(None),
+                       resume_from: Optional[str] = Query(None, alias="last_event_id")):
+    if fanout.draining:
+        # Shutting down: the client retries on another node
+        raise HTTPException(status_code=503, detail="Server restarting", headers={"Retry-After": "1"})
+    room_names = get_user_room_names(current_user)
+    return StreamingResponse(
+        room_event_stream(room_names, last_event_id or resume_from, current_user),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx and similar proxies from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+@router.post("/sse/publish")
+async def sse_publish(message: PublishMessageRequest, current_user: str = Depends(get_current_user)):
+    received_at = time.perf_counter()
+    if message.room not in get_user_room_names(current_user):
+        raise HTTPException(status_code=403, detail="Not subscribed to room")
+
+    retry_after = publish_limiter.check(current_user, message.room)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Publishing too fast",
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    try:
+        await publish_room_message(message.room, message.message, received_at, origin="sse", sender=current_user)
+    except ConnectionError as e:
+        logger.error(f"Error publishing to room {message.room}: {e}")
+        raise HTTPException(status_code=503, detail="Messaging service unavailable")
+    return {"status": "published"}
@@ -1,11 +1,12 @@
-from fastapi import Depends, WebSocket
+from fastapi import Depends, File, HTTPException, UploadFile, WebSocket
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
 from app.routers.models import CreateGroupRequest, CreateUserRequest, LoginRequest, SendMessageRequest
 from app.nats.client import ChatClient
 from nats.aio.client import Client as NATS
 from typing import Dict
 import logging
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_admin, get_current_user
 from app.services.user_service import (
     create_user as create_user_service,
     login_user as login_user_service
@@ -35,6 +36,34 @@ async def login_user(user: LoginRequest):
        "token_type": "bearer",
     }
 
+@router.post("/bulk_import_users", status_code=202)
+async def bulk_import_users(file: UploadFile = File(...), format: str = None,
+                            current_user = Depends(get_current_admin)):
+    from app.services.provisioning_service import account_name_of, detect_import_format, import_jobs, save_upload
+    fmt = format or detect_import_format(file.filename)
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Unsupported import format, expected csv or ndjson")
+
+    # Users are created in the administrator's own NATS account
+    account = await run_in_threadpool(account_name_of, current_user)
+    if account is None:
+        raise HTTPException(status_code=403, detail="No NATS account to import users into")
+
+    # The upload is closed with the request, so the job reads its own copy
+    path = await run_in_threadpool(save_upload, file.file, f".{fmt}")
+    job = import_jobs.start(path, fmt, account, current_user)
+    logger.info(f"Bulk import {job.id} started by {current_user}")
+    return job.to_dict()
+
+@router.get("/bulk_import_users/{job_id}")
+async def bulk_import_status(job_id: str, current_user = Depends(get_current_admin)):
+    from app.services.provisioning_service import import_jobs
+    job = import_jobs.get(job_id)
+    # Administrators only see their own imports
+    if job is None or job.owner != current_user:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
+
 @router.get("/me")
 async def get_user_info(current_user = Depends(get_current_user)):
     from app.services.user_service import get_user_information
@@ -1,6 +1,7 @@
+import asyncio
 import base64
 import datetime
-import json
+from typing import Dict, List
 from fastapi import FastAPI, WebSocket, HTTPException
 from nats.aio.client import Client as NATS
 import os
@@ -13,10 +14,25 @@ from app.querries.group_querries import GroupQueries
 from app.querries.user_querries import UserQueries
 from app.querries.message_querries import MessageQueries
 from app.querries.nats_room_querries import NatsRoomQueries
-from app.database.db import get_db
+from app.database.db import ScopedSession
+from app.nats.transport import new_client
+from app.services.fanout_service import QueueSubscriber, RoomEvent, RoomFanout
+from app.services.history_service import HISTORY_ON_JOIN, get_room_history, history_frame, room_history
+from app.services.message_writer import message_writer
+from app.services.presence_service import PresenceService
+from app.services.rate_limit_service import publish_limiter
+from app.services.read_marker_service import read_markers
+from app.shared.envelopes import RoomMessage, describe_error, parse_client_frame
+from app.shared.ids import next_message_id
+from app.shared.log import sampled, throttled
+from app.shared.metrics import NATS_RECONNECTS, ROOM_MESSAGES_IN, WEBSOCKETS_ACTIVE
+from app.shared import serialization, tracing
+import time
 from nacl.signing import SigningKey
+from pydantic import ValidationError
 
-db = next(get_db())
+# Queries share the scoped session, created on first use
+db = ScopedSession
 
 user_group_queries = UserGroupQueries(db)
 group_queries = GroupQueries(db)
@@ -34,13 +50,14 @@ nats_client = dict[str, NATS]()
 
 async def get_nats_client():
     """Connect to NATS server with authentication"""
-    nats_client = NATS()
-    
     # Get NATS server URL from environment variable
     nats_url = os.getenv("NATS_SERVER_URL")
     if not nats_url:
         logger.error("NATS_SERVER_URL not set in environment variables")
         raise ValueError("NATS server URL not configured")
+
+    # inproc:// URLs use the in-process broker instead of a server
+    nats_client = new_client(nats_url)
     
     logger.info(f"Attempting to connect to NATS server at {nats_url}")
 
@@ -55,6 +72,12 @@ async def get_nats_client():
     #     sig = kp.sign(nonce)
 
         # return base64.b64encode(sig)
+
+    reconnects = NATS_RECONNECTS.labels("chat")
+
+    async def reconnected_cb():
+        reconnects.inc()
+        logger.warning(f"Reconnected to NATS server at {nats_url}")
     
     try:
         await nats_client.connect(
@@ -68,6 +91,7 @@ async def get_nats_client():
             ping_interval=20,  # Keep connection alive
             max_outstanding_pings=5,
             allow_reconnect=True,
+            reconnected_cb=reconnected_cb,
             tls_hostname=None  # Set this if you need TLS
         )
         
@@ -80,78 +104,202 @@ async def get_nats_client():
         logger.error(f"Failed to connect to NATS server: {str(e)}")
         raise ConnectionError(f"Failed to connect to NATS server: {str(e)}")
 
-async def user_rooms_websocket(websocket: WebSocket, current_user: str):
+# One NATS connection and one subscription per room, shared by every client on this node
+fanout = RoomFanout(connect=get_nats_client, history=room_history)
+presence = PresenceService(fanout)
+
+def get_user_room_names(current_user: str) -> List[str]:
+    """
+    Names of the rooms a user belongs to
+    """
+    user_rooms = nats_room_queries.get_room_limits_for_user(current_user)
+    # Keep the rooms' publish limits at hand for the rate limiter
+    publish_limiter.remember_rooms(user_rooms)
+    return [room.name for room in user_rooms]
+
+async def publish_room_message(room: str, text: str, received_at: float = None,
+                               trace_debug: bool = False, origin: str = "ws", sender: str = None):
+    """
+    Publish a chat message to a room through the node's shared NATS connection.
+    The message is given a persistent id and queued for storage; text has
+    already been validated at the edge, so the envelope is built without checks.
+    """
+    message_id = next_message_id()
+    message = RoomMessage.model_construct(
+        id=message_id, room=room, sender=sender, message=text, timestamp=time.time(),
+    )
+
+    trace = tracing.start_trace(origin, force=trace_debug)
+    if trace is not None:
+        trace["hops"]["receive"] = time.perf_counter() - (received_at or time.perf_counter())
+        tracing.mark_sent(trace)
+        message.trace = trace
+
+    payload = message.to_json()
+    publish_started = time.perf_counter()
+    await fanout.publish(room, payload, message_id)
+    ROOM_MESSAGES_IN.labels(room).inc()
+    message_writer.enqueue(message_id, room, sender, text)
+    if sender:
+        # Your own messages are never unread
+        read_markers.mark(sender, room, message_id)
+    if trace is not None:
+        tracing.record(trace, "publish", {
+            "receive": trace["hops"]["receive"],
+            "publish": time.perf_counter() - publish_started,
+        })
+
+def _with_server_timings(event: RoomEvent, hops: Dict[str, float]) -> str:
+    # The envelope is shared by every subscriber, so never mutate it
+    envelope = event.envelope
+    if envelope is None:
+        try:
+            envelope = serialization.loads(event.text)
+        except ValueError:
+            return event.text
+        if not isinstance(envelope, dict):
+            return event.text
+
+    trace = dict(envelope.get(tracing.TRACE_FIELD) or {})
+    trace["hops"] = {**trace.get("hops", {}), **hops}
+    return serialization.dumps_text({**envelope, tracing.TRACE_FIELD: trace})
+
+async def forward_room_events(websocket: WebSocket, subscriber: QueueSubscriber, trace_debug: bool = False,
+                              history_until: Dict[str, int] = None):
+    """
+    Send queued room events to a WebSocket client until the subscriber is closed.
+    history_until maps rooms to the newest message id already sent as history.
+    """
+    history_until = history_until or {}
+    while True:
+        event = await subscriber.queue.get()
+        if event is None:
+            if subscriber.finished:
+                # The node is shutting down; everything queued has been sent
+                await websocket.close(code=1012, reason="Server restarting, reconnect")
+            else:
+                # The fan-out dropped us for falling behind
+                await websocket.close(code=1013, reason="Client is too slow, reconnect")
+            return
+        if event.uid is not None and event.uid <= history_until.get(event.room, 0):
+            continue
+
+        send_started = time.perf_counter()
+        hops = {"callback": send_started - event.received_at}
+        if event.nats_latency is not None:
+            hops["nats"] = event.nats_latency
+
+        data = _with_server_timings(event, hops) if trace_debug else event.text
+        await websocket.send_text(data)
+
+        if event.trace is not None and "id" in event.trace:
+            finished = time.perf_counter()
+            hops["send"] = finished - send_started
+            if "nats" in hops:
+                hops["total"] = hops["nats"] + (finished - event.received_at)
+            tracing.record(event.trace, "deliver", hops)
+
+async def user_rooms_websocket(websocket: WebSocket, current_user: str, trace_debug: bool = False):
+    subscriber = QueueSubscriber()
+    forwarder = None
+    accepted = False
+    online_rooms = []
+    # Throttle notices are sent at most once per wait period
+    throttle_notice_until = 0.0
+    if fanout.draining:
+        # Shutting down: send the client to another node
+        await websocket.close(code=1012, reason="Server restarting, reconnect")
+        return
     try:
         # Accept the WebSocket connection
         await websocket.accept()
-        logger.info(f"WebSocket connection accepted for user {current_user}")
+        accepted = True
+        WEBSOCKETS_ACTIVE.inc()
+        sampled(logger, "ws.connections").info("WebSocket connection accepted for user %s", current_user)
 
+        # Subscribe to the room channels through the node's shared fan-out
         try:
-            nc = await get_nats_client()
-        except Exception as e:
-            logger.error(f"NATS connection error: {str(e)}")
-            # Don't raise HTTPException here, use WebSocket close instead
+            room_names = get_user_room_names(current_user)
+            
+            # Check if the user has any rooms
+            if not room_names:
+                logger.warning("No rooms found for user %s", current_user)
+                await websocket.send_text(serialization.dumps_text({"type": "info", "message": "You don't have any rooms available."}))
+
+            await fanout.subscribe(subscriber, room_names)
+            history_until = {}
+            if HISTORY_ON_JOIN > 0:
+                # Sent before the forwarder starts so history always precedes live messages
+                for room in room_names:
+                    page = await get_room_history(room)
+                    if page:
+                        history_until[room] = page[-1][0]
+                    await websocket.send_text(history_frame(room, page))
+            forwarder = asyncio.create_task(forward_room_events(websocket, subscriber, trace_debug, history_until))
+            online_rooms = list(subscriber.rooms)
+            presence.connect(current_user, online_rooms)
+        except ConnectionError as e:
+            throttled(logger).error("NATS connection error: %s", e)
             await websocket.close(code=1011, reason=f"Failed to connect to NATS: {str(e)}")
             return
-
-        # Define message handler
-        async def message_handler(msg):
-            try:
-                data = msg.data.decode()
-                logger.debug(f"Received message on subject {msg.subject}: {data}")
-                # Forward message to WebSocket client
-                await websocket.send_text(data)
-                logger.debug(f"Forwarded message from {msg.subject} to WebSocket")
-            except Exception as e:
-                logger.error(f"Error handling message: {str(e)}")
-
-        # Subscribe to the room channels
-        try:
-            user_rooms = nats_room_queries.get_room_for_user_by_username(current_user)
-            
-            # Check if user_rooms is None or empty
-            if not user_rooms:
-                logger.warning(f"No rooms found for user {current_user}")
-                await websocket.send_text(json.dumps({"type": "info", "message": "You don't have any rooms available."}))
-                user_rooms = [] 
-            
-            for room in user_rooms:
-                room_topic = f"{room.subject_prefix}.{room.name}" if hasattr(room, 'subject_prefix') and hasattr(room, 'name') else f"room.{room.id}"
-                await nc.subscribe(room_topic, cb=message_handler)
-                logger.info(f"Subscribed to room {room_topic}")
         except Exception as e:
-            logger.error(f"Failed to subscribe to rooms for user {current_user}: {str(e)}")
+            throttled(logger).error("Failed to subscribe to rooms for user %s: %s", current_user, e)
             await websocket.close(code=1008, reason=f"Subscription failed: {str(e)}")
             return
 
         # Handle WebSocket messages
         try:
             while True:
-                message = await websocket.receive_json()
-                room = message.get("room")
-                if not room:
-                    logger.error("No room specified in message")
-                    await websocket.close(code=1008, reason="No room specified")
+                try:
+                    # Parsed and validated in one pass; never re-checked downstream
+                    frame = parse_client_frame(await websocket.receive_text())
+                except ValidationError as e:
+                    reason = describe_error(e)
+                    throttled(logger).warning("Invalid frame from user %s: %s", current_user, reason)
+                    await websocket.close(code=1008, reason=f"Invalid message: {reason}")
                     return
-                
-                if room not in [r.name for r in user_rooms]:
-                    logger.error(f"User {current_user} not subscribed to room {room}")
+                received_at = time.perf_counter()
+                room = frame.room
+
+                if room not in subscriber.rooms:
+                    throttled(logger).warning("User %s not subscribed to room %s", current_user, room)
                     await websocket.close(code=1008, reason="Not subscribed to room")
                     return
 
-                message_json = json.dumps(message)
-                await nc.publish(f"room.{room}", message_json.encode())
-                logger.debug(f"Published message to room.{room}")
+                if frame.type == "presence":
+                    # Who is online in the room, answered from memory
+                    await websocket.send_text(serialization.dumps_text({
+                        "type": "presence_snapshot", "room": room, "online": presence.online(room),
+                    }))
+                    continue
+
+                if frame.type == "read":
+                    # {"type": "read", "room": ..., "id": <newest message id seen>}, coalesced, never published
+                    read_markers.mark(current_user, room, frame.id)
+                    continue
+
+                retry_after = publish_limiter.check(current_user, room)
+                if retry_after:
+                    now = time.monotonic()
+                    if now >= throttle_notice_until:
+                        throttle_notice_until = now + retry_after
+                        await websocket.send_text(serialization.dumps_text({
+                            "type": "throttled", "room": room, "retry_after": round(retry_after, 3),
+                        }))
+                    continue
+
+                await publish_room_message(room, frame.message, received_at, trace_debug, sender=current_user)
+                sampled(logger, "ws.messages").debug("Published message to room.%s", room)
 
         except Exception as e:
-            logger.error(f"WebSocket connection error: {str(e)}")
+            throttled(logger).error("WebSocket connection error: %s", e)
             
     finally:
         # Clean up
-        logger.info(f"Disconnected from rooms for user {current_user}")
-        # Close NATS connection if it exists and is connected
-        if 'nc' in locals() and nc.is_connected:
-            try:
-                await nc.drain()
-            except:
-                pass
\ No newline at end of file
+        if forwarder is not None:
+            forwarder.cancel()
+        presence.disconnect(current_user, online_rooms)
+        await fanout.unsubscribe(subscriber)
+        if accepted:
+            WEBSOCKETS_ACTIVE.dec()
+        sampled(logger, "ws.connections").info("Disconnected from rooms for user %s", current_user)
@@ -0,0 +1,311 @@
+"""
+Per-node room fan-out shared by every transport (WebSocket and SSE).
+
+The node holds a single NATS connection and one subscription per room that has
+local subscribers. Each incoming message becomes a RoomEvent that is decoded
+and serialized once, then queued to every local subscriber of the room.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from app.shared import tracing
+from app.shared.log import throttled
+from app.shared.metrics import FORWARD_LATENCY, ROOM_MESSAGES_OUT, SUBSCRIPTIONS_ACTIVE
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Pending events per subscriber before it is considered too slow and dropped
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("FANOUT_SUBSCRIBER_QUEUE_SIZE", "1024"))
+# Recent events kept for Last-Event-ID resume
+REPLAY_BUFFER_SIZE = int(os.getenv("FANOUT_REPLAY_BUFFER_SIZE", "10000"))
+# Seconds a room subscription outlives its last local subscriber, so quick reconnects resume without gaps
+ROOM_LINGER_SECONDS = float(os.getenv("FANOUT_ROOM_LINGER_SECONDS", "30"))
+
+# Distinguishes event ids of this process from those of other nodes or earlier runs
+NODE_EPOCH = uuid.uuid4().hex[:8]
+
+# NATS header carrying the persistent message id, so subscribers need not parse the payload
+MESSAGE_ID_HEADER = "Chat-Message-Id"
+
+
+def room_subject(room_name: str) -> str:
+    return f"room.{room_name}"
+
+
+class RoomEvent:
+    """A message received on a room subject, shared by all local subscribers"""
+
+    __slots__ = ("seq", "room", "uid", "text", "received_at", "envelope", "trace", "nats_latency", "_sse_frame")
+
+    def __init__(self, seq: int, room: str, payload: bytes, headers: Optional[Dict[str, str]] = None):
+        self.seq = seq
+        self.room = room
+        self.uid = None
+        if headers and MESSAGE_ID_HEADER in headers:
+            try:
+                self.uid = int(headers[MESSAGE_ID_HEADER])
+            except ValueError:
+                pass
+        self.text = payload.decode()
+        self.received_at = time.perf_counter()
+        self.envelope, self.trace = tracing.extract(payload)
+        self.nats_latency = None
+        if self.trace is not None and "sent" in self.trace:
+            self.nats_latency = max(0.0, time.time() - self.trace["sent"])
+        self._sse_frame = None
+
+    @property
+    def event_id(self) -> str:
+        return f"{NODE_EPOCH}-{self.seq}"
+
+    def sse_frame(self) -> bytes:
+        """The Server-Sent Events frame for this event, built on first use"""
+        if self._sse_frame is None:
+            data = self.text.replace("\n", "\ndata: ")
+            self._sse_frame = f"id: {self.event_id}\ndata: {data}\n\n".encode()
+        return self._sse_frame
+
+
+class QueueSubscriber:
+    """
+    A local consumer of room events. Events are queued without blocking the
+    fan-out; a subscriber whose queue overflows is closed and receives None.
+    """
+
+    __slots__ = ("queue", "rooms", "closed", "finished")
+
+    def __init__(self, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.rooms: Set[str] = set()
+        self.closed = False
+        # Closed because the node is shutting down rather than for being slow
+        self.finished = False
+
+    def deliver(self, event: RoomEvent) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            throttled(logger).warning("Dropping slow subscriber with %d pending events", self.queue.qsize())
+            self.close()
+            return False
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Discard pending events so the sentinel always fits
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    def finish(self):
+        """Stop taking events; the ones already queued are still delivered before the sentinel"""
+        if self.closed:
+            return
+        self.closed = True
+        self.finished = True
+        if self.queue.full():
+            # Too far behind to catch up before shutdown anyway
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class RoomFanout:
+    def __init__(self, connect: Callable[[], Awaitable], replay_size: int = REPLAY_BUFFER_SIZE,
+                 linger_seconds: float = ROOM_LINGER_SECONDS, history=None):
+        self.connect = connect
+        # Optional HistoryBuffer fed with every persisted message of the subscribed rooms
+        self.history = history
+        self.linger_seconds = linger_seconds
+        self.nc = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self.rooms: Dict[str, Set[QueueSubscriber]] = {}
+        # Every local subscriber, including those in no room
+        self.subscribers: Set[QueueSubscriber] = set()
+        self.subscriptions: Dict[str, object] = {}
+        # Set when a room's NATS subscription attempt finishes, for joins arriving meanwhile
+        self._subscribing: Dict[str, asyncio.Event] = {}
+        # chat_room_messages_out_total child of each subscribed room, bound once
+        self._delivered_counters: Dict[str, object] = {}
+        # Sequence number at which each room's subscription started
+        self.room_started_at: Dict[str, int] = {}
+        self._release_handles: Dict[str, asyncio.TimerHandle] = {}
+        self.seq = 0
+        self.replay: Deque[RoomEvent] = deque(maxlen=replay_size)
+        # Set once the node starts shutting down; new subscribers are refused
+        self.draining = False
+
+    async def get_connection(self):
+        """The node's shared NATS connection, established on first use"""
+        if self.nc is None or self.nc.is_closed:
+            if self._connect_lock is None:
+                self._connect_lock = asyncio.Lock()
+            async with self._connect_lock:
+                if self.nc is None or self.nc.is_closed:
+                    self.nc = await self.connect()
+        return self.nc
+
+    async def publish(self, room_name: str, payload: bytes, message_id: Optional[int] = None):
+        nc = await self.get_connection()
+        headers = {MESSAGE_ID_HEADER: str(message_id)} if message_id is not None else None
+        await nc.publish(room_subject(room_name), payload, headers=headers)
+
+    async def subscribe(self, subscriber: QueueSubscriber, room_names: Iterable[str]):
+        nc = await self.get_connection()
+        self.subscribers.add(subscriber)
+        try:
+            await self._join(nc, subscriber, room_names)
+        except BaseException:
+            # Leave the rooms joined so far; other members are untouched
+            await self.unsubscribe(subscriber)
+            raise
+
+    async def _join(self, nc, subscriber: QueueSubscriber, room_names: Iterable[str]):
+        for room in room_names:
+            handle = self._release_handles.pop(room, None)
+            if handle is not None:
+                handle.cancel()
+
+            members = self.rooms.get(room)
+            if members is None:
+                # Register before awaiting so concurrent joins share one subscription
+                members = self.rooms[room] = set()
+                self.room_started_at[room] = self.seq
+                self._delivered_counters[room] = ROOM_MESSAGES_OUT.labels(room)
+                subscribed = self._subscribing[room] = asyncio.Event()
+                try:
+                    self.subscriptions[room] = await nc.subscribe(room_subject(room), cb=self._make_handler(room))
+                except BaseException:
+                    # Concurrent joins wait for this attempt before becoming members, so none are dropped
+                    self.rooms.pop(room, None)
+                    self.room_started_at.pop(room, None)
+                    self._delivered_counters.pop(room, None)
+                    raise
+                finally:
+                    del self._subscribing[room]
+                    subscribed.set()
+                SUBSCRIPTIONS_ACTIVE.inc()
+                if self.history is not None:
+                    self.history.track(room)
+                logger.info("Subscribed node to room %s", room)
+            elif room in self._subscribing:
+                await self._subscribing[room].wait()
+                if room not in self.subscriptions:
+                    raise ConnectionError(f"Failed to subscribe to room {room}")
+                members = self.rooms[room]
+
+            members.add(subscriber)
+            subscriber.rooms.add(room)
+
+    async def unsubscribe(self, subscriber: QueueSubscriber):
+        loop = asyncio.get_running_loop()
+        self.subscribers.discard(subscriber)
+        for room in list(subscriber.rooms):
+            members = self.rooms.get(room)
+            if members is None:
+                continue
+            members.discard(subscriber)
+            if not members and room not in self._release_handles:
+                self._release_handles[room] = loop.call_later(
+                    self.linger_seconds, lambda room=room: asyncio.ensure_future(self._release_room(room))
+                )
+        subscriber.rooms.clear()
+
+    async def _release_room(self, room: str):
+        self._release_handles.pop(room, None)
+        if self.rooms.get(room):
+            return
+
+        self.rooms.pop(room, None)
+        self.room_started_at.pop(room, None)
+        self._delivered_counters.pop(room, None)
+        if self.history is not None:
+            self.history.drop(room)
+        subscription = self.subscriptions.pop(room, None)
+        if subscription is not None:
+            SUBSCRIPTIONS_ACTIVE.dec()
+            try:
+                await subscription.unsubscribe()
+            except Exception as e:
+                logger.warning("Error unsubscribing from room %s: %s", room, e)
+        logger.info("Released node subscription to room %s", room)
+
+    def subscriber_count(self) -> int:
+        return len(self.subscribers)
+
+    def drain_subscribers(self):
+        """Finish every local subscriber so its transport sends what is queued and disconnects"""
+        self.draining = True
+        for subscriber in list(self.subscribers):
+            subscriber.finish()
+
+    def replay_since(self, last_event_id: str, room_names: Iterable[str]) -> Tuple[List[RoomEvent], List[str]]:
+        """
+        Events after last_event_id in the given rooms, plus the rooms for which
+        events may have been missed (unknown id, buffer overrun or the room was
+        not subscribed for the whole interval).
+        """
+        rooms = set(room_names)
+        try:
+            epoch, seq = last_event_id.rsplit("-", 1)
+            since = int(seq)
+        except ValueError:
+            return [], sorted(rooms)
+        if epoch != NODE_EPOCH:
+            return [], sorted(rooms)
+
+        gap_rooms = {room for room in rooms if self.room_started_at.get(room, self.seq + 1) > since}
+        if self.replay and self.replay[0].seq > since + 1:
+            gap_rooms = rooms
+
+        events = [event for event in self.replay if event.seq > since and event.room in rooms]
+        return events, sorted(gap_rooms)
+
+    def _dispatch(self, room: str, payload: bytes, headers: Optional[Dict[str, str]] = None) -> int:
+        started = time.perf_counter()
+        self.seq += 1
+        event = RoomEvent(self.seq, room, payload, headers)
+        self.replay.append(event)
+        if self.history is not None and event.uid is not None:
+            self.history.append(room, event.uid, event.text)
+
+        delivered = 0
+        for subscriber in self.rooms.get(room, ()):
+            if subscriber.deliver(event):
+                delivered += 1
+
+        counter = self._delivered_counters.get(room)
+        if counter is not None:
+            counter.inc(delivered)
+        FORWARD_LATENCY.observe(time.perf_counter() - started)
+        return delivered
+
+    def deliver_local(self, room: str, payload: bytes) -> int:
+        """Deliver a node-generated event (e.g. presence) to this node's subscribers of a room"""
+        return self._dispatch(room, payload)
+
+    def _make_handler(self, room: str):
+        async def message_handler(msg):
+            self._dispatch(room, msg.data, msg.headers)
+
+        return message_handler
+
+    async def close(self):
+        for handle in self._release_handles.values():
+            handle.cancel()
+        self._release_handles.clear()
+        if self.nc is not None and self.nc.is_connected:
+            await self.nc.drain()
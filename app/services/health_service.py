@@ -0,0 +1,125 @@
+"""
+Cached health of the node's dependencies, for /healthz and /readyz.
+
+Probes never open connections: a background task checks the database every
+HEALTH_CHECK_INTERVAL seconds (SELECT 1 on a pooled connection) and the
+endpoints report that result together with the state of the long-lived NATS
+connection and the database pool, all read from memory.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.database.db import engine
+from app.services.chat_service import fanout
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds between database pings
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+# Seconds a database ping may take before it counts as failed
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+# Consecutive intervals without a successful ping before the node reports not ready
+HEALTH_MAX_MISSED_CHECKS = int(os.getenv("HEALTH_MAX_MISSED_CHECKS", "3"))
+
+
+class HealthChecker:
+    def __init__(self, engine=engine, get_nats: Callable = lambda: fanout.nc,
+                 interval: float = HEALTH_CHECK_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT,
+                 max_missed: int = HEALTH_MAX_MISSED_CHECKS):
+        self.engine = engine
+        self.get_nats = get_nats
+        self.interval = interval
+        self.timeout = timeout
+        self.max_missed = max_missed
+        self.task: Optional[asyncio.Task] = None
+        # time.time() of the last successful database ping
+        self.db_last_ok: Optional[float] = None
+        self.db_last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def _ping(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    async def check(self):
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self._ping), self.timeout)
+            self.db_last_ok = time.time()
+            self.db_last_error = None
+        except asyncio.TimeoutError:
+            self.db_last_error = f"ping timed out after {self.timeout}s"
+        except Exception as e:
+            self.db_last_error = str(e)
+        if self.db_last_error:
+            logger.warning("Database health check failed: %s", self.db_last_error)
+        self.checked_at = time.time()
+
+    def nats_status(self) -> Dict:
+        nc = self.get_nats()
+        if nc is None:
+            return {"connected": False, "reconnecting": False, "pending_bytes": 0}
+        return {
+            "connected": nc.is_connected,
+            "reconnecting": nc.is_reconnecting,
+            "pending_bytes": nc.pending_data_size,
+        }
+
+    def db_status(self) -> Dict:
+        pool = self.engine.pool
+        status = {
+            "ok": self.db_ok(),
+            "last_ok": self.db_last_ok,
+            "last_error": self.db_last_error,
+        }
+        # Pools other than QueuePool (e.g. for SQLite) do not count connections
+        for name in ("size", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if method is not None:
+                status[name] = method()
+        return status
+
+    def db_ok(self) -> bool:
+        if self.db_last_ok is None:
+            return False
+        return time.time() - self.db_last_ok <= self.interval * self.max_missed
+
+    def readiness(self, draining: bool = False) -> Dict:
+        nats = self.nats_status()
+        db = self.db_status()
+        return {
+            "ready": not draining and nats["connected"] and db["ok"],
+            "draining": draining,
+            "checked_at": self.checked_at,
+            "nats": nats,
+            "db": db,
+        }
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+health = HealthChecker()
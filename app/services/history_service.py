@@ -0,0 +1,237 @@
+"""
+Recent room history served from memory.
+
+Each node keeps the last HISTORY_ROOM_SIZE messages of every room it is
+subscribed to, fed by the room's NATS subscription. A join is answered from
+that buffer; only pages older than the buffer go to Postgres, and those rows
+are kept to answer the next join. Whole rooms are evicted, least recently
+used first, when the buffers exceed HISTORY_MEMORY_BUDGET bytes.
+
+Entries are the raw JSON envelopes, so a history page is assembled by joining
+strings rather than re-serializing messages.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from app.database.db import SessionLocal
+from app.querries.message_querries import MessageQueries
+from app.querries.nats_room_querries import NatsRoomQueries
+from app.shared import serialization
+from app.shared.envelopes import RoomMessage
+from app.shared.metrics import Counter, Gauge
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Messages kept per room
+HISTORY_ROOM_SIZE = int(os.getenv("HISTORY_ROOM_SIZE", "200"))
+# Total bytes of buffered envelopes across all rooms on this node
+HISTORY_MEMORY_BUDGET = int(os.getenv("HISTORY_MEMORY_BUDGET", str(64 * 1024 * 1024)))
+# Messages sent to a client for each room when it subscribes (0 disables)
+HISTORY_ON_JOIN = int(os.getenv("HISTORY_ON_JOIN", "50"))
+
+HISTORY_READS = Counter("chat_history_reads_total", "History pages served, by source", ["source"])
+HISTORY_BYTES = Gauge("chat_history_buffer_bytes", "Bytes of room history held in memory")
+HISTORY_EVICTIONS = Counter("chat_history_evictions_total", "Rooms evicted from the history buffer")
+
+# Per-entry overhead beyond the envelope text (tuple, int, deque slot)
+ENTRY_OVERHEAD = 120
+
+
+class RoomHistory:
+    """Contiguous tail of a room's messages as (uid, envelope) pairs, oldest first"""
+
+    __slots__ = ("entries", "size", "complete")
+
+    def __init__(self):
+        self.entries: Deque[Tuple[int, str]] = deque()
+        self.size = 0
+        # True once the buffer is known to hold the room's very first message
+        self.complete = False
+
+
+class HistoryBuffer:
+    def __init__(self, room_size: int = HISTORY_ROOM_SIZE, budget: int = HISTORY_MEMORY_BUDGET):
+        self.room_size = room_size
+        self.budget = budget
+        self.rooms: "OrderedDict[str, RoomHistory]" = OrderedDict()
+        # Rooms with a live subscription on this node; only these are buffered
+        self.tracked: Set[str] = set()
+        self.total_size = 0
+
+    def track(self, room: str):
+        self.tracked.add(room)
+
+    def drop(self, room: str):
+        """Forget a room whose subscription ended, as its buffer would go stale"""
+        self.tracked.discard(room)
+        history = self.rooms.pop(room, None)
+        if history is not None:
+            self._account(-history.size)
+
+    def append(self, room: str, uid: int, envelope: str):
+        if room not in self.tracked:
+            return
+        history = self.rooms.get(room)
+        if history is None:
+            history = self.rooms[room] = RoomHistory()
+        else:
+            self.rooms.move_to_end(room)
+
+        history.entries.append((uid, envelope))
+        added = len(envelope) + ENTRY_OVERHEAD
+        history.size += added
+        if len(history.entries) > self.room_size:
+            _, oldest = history.entries.popleft()
+            history.size -= len(oldest) + ENTRY_OVERHEAD
+            added -= len(oldest) + ENTRY_OVERHEAD
+            history.complete = False
+        self._account(added)
+        self._enforce_budget(keep=room)
+
+    def recent(self, room: str, limit: int, before: Optional[int] = None) -> Tuple[List[Tuple[int, str]], bool]:
+        """
+        Up to limit messages older than before (newest first), and whether the
+        buffer can tell there is nothing older than what it returned.
+        """
+        history = self.rooms.get(room)
+        if history is None:
+            return [], False
+        self.rooms.move_to_end(room)
+
+        page = []
+        for uid, envelope in reversed(history.entries):
+            if before is not None and uid >= before:
+                continue
+            page.append((uid, envelope))
+            if len(page) == limit:
+                return page, True
+        return page, history.complete
+
+    def oldest(self, room: str) -> Optional[int]:
+        history = self.rooms.get(room)
+        if history is None or not history.entries:
+            return None
+        return history.entries[0][0]
+
+    def extend_older(self, room: str, entries: List[Tuple[int, str]], reached_start: bool, below: Optional[int]):
+        """
+        Add messages loaded from the database below the buffer's oldest entry.
+        entries are newest first; anything overlapping the buffer is skipped.
+        below is the oldest entry the rows were loaded under: if the buffer
+        was evicted or refilled meanwhile the rows would leave a hole, so they
+        are not kept.
+        """
+        if room not in self.tracked or self.oldest(room) != below:
+            return
+        history = self.rooms.get(room)
+        if history is None:
+            history = self.rooms[room] = RoomHistory()
+        oldest = below
+
+        added = 0
+        for uid, envelope in entries:
+            if len(history.entries) >= self.room_size:
+                reached_start = False
+                break
+            if oldest is not None and uid >= oldest:
+                continue
+            history.entries.appendleft((uid, envelope))
+            added += len(envelope) + ENTRY_OVERHEAD
+            oldest = uid
+        history.size += added
+        history.complete = history.complete or reached_start
+        self._account(added)
+        self._enforce_budget(keep=room)
+
+    def _account(self, delta: int):
+        self.total_size += delta
+        HISTORY_BYTES.set(self.total_size)
+
+    def _enforce_budget(self, keep: str):
+        while self.total_size > self.budget and len(self.rooms) > 1:
+            room, history = next(iter(self.rooms.items()))
+            if room == keep:
+                self.rooms.move_to_end(room)
+                continue
+            del self.rooms[room]
+            self._account(-history.size)
+            HISTORY_EVICTIONS.inc()
+
+
+room_history = HistoryBuffer()
+
+# Room ids never change, so lookups for the database fallback are cached
+_room_ids: Dict[str, int] = {}
+
+
+def _row_envelope(room: str, message, username: Optional[str]) -> str:
+    created_at = message.created_at
+    # Stored rows were validated when they were published
+    return RoomMessage.model_construct(
+        id=message.uid,
+        room=room,
+        sender=username,
+        message=message.content,
+        timestamp=created_at.timestamp() if isinstance(created_at, datetime.datetime) else None,
+    ).to_json().decode()
+
+
+def _load_from_db(room: str, before: Optional[int], limit: int) -> List[Tuple[int, str]]:
+    db = SessionLocal()
+    try:
+        room_id = _room_ids.get(room)
+        if room_id is None:
+            room_id = NatsRoomQueries(db).get_room_ids_by_names([room]).get(room)
+            if room_id is None:
+                return []
+            _room_ids[room] = room_id
+        rows = MessageQueries(db).get_room_messages_before(room_id, before, limit)
+        return [(message.uid, _row_envelope(room, message, username)) for message, username in rows]
+    finally:
+        db.close()
+
+
+async def get_room_history(room: str, limit: int = HISTORY_ON_JOIN,
+                           before: Optional[int] = None) -> List[Tuple[int, str]]:
+    """
+    The newest limit messages of a room older than before as (uid, envelope)
+    pairs, oldest first.
+    Served from memory when the buffer covers the page, otherwise topped up
+    from the database.
+    """
+    page, covered = room_history.recent(room, limit, before)
+    if covered or len(page) >= limit:
+        HISTORY_READS.labels("memory").inc()
+        page.reverse()
+        return page
+
+    # A partial page always ends at the buffer's oldest entry, continue below it
+    buffered_oldest = room_history.oldest(room)
+    db_before = page[-1][0] if page else before
+
+    wanted = limit - len(page)
+    rows = await asyncio.to_thread(_load_from_db, room, db_before, wanted)
+    HISTORY_READS.labels("database").inc()
+
+    # Rows directly below the buffer extend it, so the next join stays in memory
+    if db_before == buffered_oldest:
+        room_history.extend_older(room, rows, reached_start=len(rows) < wanted, below=buffered_oldest)
+
+    page.extend(rows)
+    page.reverse()
+    return page
+
+
+def history_frame(room: str, page: List[Tuple[int, str]]) -> str:
+    """A {"type": "history"} message built from the page without re-serializing it"""
+    envelopes = ",".join(envelope for _, envelope in page)
+    return f'{{"type": "history", "room": {serialization.dumps_text(room)}, "messages": [{envelopes}]}}'
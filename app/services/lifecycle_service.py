@@ -0,0 +1,152 @@
+"""
+Startup and graceful shutdown of the node's background services.
+
+start() runs from the application lifespan, on the app's event loop: the
+event-loop lag monitor, the NATS auth callout, the write-behind message
+writer, the read marker writer, the node's shared NATS connection (so the
+first client does not pay for it) and the health checks behind /readyz.
+
+Shutdown drains in two phases within one SHUTDOWN_DRAIN_TIMEOUT deadline:
+
+1. On SIGTERM/SIGINT, before uvicorn stops, the node stops accepting: new
+   WebSocket connections are closed with 1012 and new SSE streams get a 503.
+   Open connections are sent the events already queued for them, then
+   disconnected so clients reconnect elsewhere. uvicorn is told to exit
+   once they are gone (a second signal skips the wait).
+2. stop(), from the lifespan once uvicorn has stopped serving, flushes the
+   message writer and read markers, stops bulk imports after their current
+   batch, then drains the auth callout and the NATS subscriptions, with
+   whatever is left of the deadline.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import threading
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.services.auth_service import auth_callout
+from app.services.chat_service import fanout, presence
+from app.services.health_service import health
+from app.services.message_writer import message_writer
+from app.services.provisioning_service import import_jobs
+from app.services.read_marker_service import read_markers
+from app.shared.loop_monitor import loop_monitor
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Whether this process answers NATS auth callout requests
+AUTH_CALLOUT_ENABLED = os.getenv("AUTH_CALLOUT_ENABLED", "true").lower() == "true"
+# Seconds from the shutdown signal for connections to drain and buffers to be flushed
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+# Seconds between checks for open connections while draining
+DRAIN_POLL_INTERVAL = 0.05
+
+
+class Lifecycle:
+    def __init__(self, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        self.drain_timeout = drain_timeout
+        self.started = False
+        self.draining = False
+        # Loop time by which shutdown must be complete, set by the first of begin_drain and stop
+        self.deadline: Optional[float] = None
+        self.drain_task: Optional[asyncio.Task] = None
+        self.previous_handlers: Dict[int, object] = {}
+
+    async def start(self):
+        loop_monitor.start()
+        if AUTH_CALLOUT_ENABLED:
+            try:
+                await auth_callout.start()
+            except Exception as e:
+                logger.error(f"Failed to start the authentication service: {str(e)}")
+        message_writer.start()
+        read_markers.start()
+        try:
+            await fanout.get_connection()
+        except Exception as e:
+            # Connecting is retried on first use
+            logger.error(f"Failed to connect to NATS: {str(e)}")
+        health.start()
+        self._install_signal_handlers()
+        self.started = True
+
+    # Phase 1: connections
+
+    def _install_signal_handlers(self):
+        # Signals can only be handled in the main thread (not e.g. under TestClient)
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(sig)
+            self.previous_handlers[sig] = previous
+
+            def handler(signum, frame, previous=previous):
+                if self.drain_task is None and callable(previous):
+                    self.drain_task = loop.create_task(self.drain_connections(lambda: previous(signum, frame)))
+                elif callable(previous):
+                    # Second signal: stop waiting for connections
+                    previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def _restore_signal_handlers(self):
+        for sig, previous in self.previous_handlers.items():
+            signal.signal(sig, previous)
+        self.previous_handlers.clear()
+
+    def begin_drain(self):
+        """Refuse new connections and finish the open ones"""
+        if self.draining:
+            return
+        self.draining = True
+        self.deadline = asyncio.get_running_loop().time() + self.drain_timeout
+        logger.info("Draining: refusing new connections, finishing %d open ones", fanout.subscriber_count())
+        fanout.drain_subscribers()
+
+    async def drain_connections(self, then=None):
+        """Drain connections until none are left or the deadline passes, then call then"""
+        self.begin_drain()
+        loop = asyncio.get_running_loop()
+        while fanout.subscriber_count() and loop.time() < self.deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+        if fanout.subscriber_count():
+            logger.warning("Shutting down with %d connections still open", fanout.subscriber_count())
+        if then is not None:
+            then()
+
+    # Phase 2: services
+
+    async def stop(self):
+        """Drain NATS and flush the write-behind buffers, within the drain deadline"""
+        self._restore_signal_handlers()
+        self.begin_drain()
+        loop = asyncio.get_running_loop()
+        # Persistence first, so a stalled NATS drain cannot cost messages; presence goes
+        # before the fan-out, whose connection it announces the node's departure on
+        for name, close in (
+            ("health checks", health.close),
+            ("loop monitor", loop_monitor.close),
+            ("message writer", message_writer.close),
+            ("read markers", read_markers.close),
+            ("bulk imports", import_jobs.close),
+            ("auth callout", auth_callout.close),
+            ("presence", presence.close),
+            ("NATS subscriptions", fanout.close),
+        ):
+            try:
+                await asyncio.wait_for(close(), max(0.0, self.deadline - loop.time()))
+            except asyncio.TimeoutError:
+                logger.error("Shutdown: %s did not finish within the %.1fs drain deadline", name, self.drain_timeout)
+            except Exception as e:
+                logger.error(f"Shutdown: error closing {name}: {str(e)}")
+        self.started = False
+
+
+lifecycle = Lifecycle()
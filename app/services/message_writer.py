@@ -0,0 +1,151 @@
+"""
+Write-behind persistence of room messages.
+
+Messages are persisted by the node that published them: publish_room_message
+enqueues a row and returns without waiting for Postgres. A background task
+drains the queue in batches and inserts each batch with a single statement on
+a worker thread, so a slow database never stalls the event loop.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.database.db import SessionLocal
+from app.querries.message_querries import MessageQueries
+from app.querries.nats_room_querries import NatsRoomQueries
+from app.querries.user_querries import UserQueries
+from app.shared.ids import id_timestamp
+from app.shared.metrics import Counter, Gauge
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT
+MESSAGE_WRITER_BATCH_SIZE = int(os.getenv("MESSAGE_WRITER_BATCH_SIZE", "500"))
+# Seconds to wait for a batch to fill before writing what is queued
+MESSAGE_WRITER_FLUSH_INTERVAL = float(os.getenv("MESSAGE_WRITER_FLUSH_INTERVAL", "0.05"))
+# Rows held in memory before new messages are dropped instead of persisted
+MESSAGE_WRITER_MAX_PENDING = int(os.getenv("MESSAGE_WRITER_MAX_PENDING", "100000"))
+
+MESSAGES_PERSISTED = Counter("chat_messages_persisted_total", "Room messages written to the database")
+MESSAGES_DROPPED = Counter("chat_messages_persist_dropped_total", "Room messages not persisted, by reason", ["reason"])
+WRITER_PENDING = Gauge("chat_message_writer_pending", "Room messages queued for persistence")
+
+
+class MessageWriter:
+    def __init__(self, session_factory: Callable = SessionLocal, batch_size: int = MESSAGE_WRITER_BATCH_SIZE,
+                 flush_interval: float = MESSAGE_WRITER_FLUSH_INTERVAL, max_pending: int = MESSAGE_WRITER_MAX_PENDING):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        # Names are stable, so their ids are cached for the life of the process
+        self.room_ids: Dict[str, int] = {}
+        self.user_ids: Dict[str, int] = {}
+
+    def start(self):
+        if self.task is None or self.task.done():
+            if self.queue is None:
+                self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+
+    def enqueue(self, uid: int, room: str, sender: str, content: str) -> bool:
+        """Queue a message for persistence; False if the writer is saturated"""
+        self.start()
+        if self.queue.qsize() >= self.max_pending:
+            MESSAGES_DROPPED.labels("backlog").inc()
+            return False
+        self.queue.put_nowait((uid, room, sender, content))
+        WRITER_PENDING.inc()
+        return True
+
+    async def run(self):
+        # Runs until close() queues None, writing the batch it holds before returning
+        while True:
+            first = await self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[tuple]):
+        try:
+            await asyncio.to_thread(self.write_batch, batch)
+        except Exception as e:
+            logger.error("Failed to persist %d room messages: %s", len(batch), e)
+            MESSAGES_DROPPED.labels("error").inc(len(batch))
+        finally:
+            WRITER_PENDING.dec(len(batch))
+
+    def write_batch(self, batch: List[tuple]):
+        db = self.session_factory()
+        try:
+            self._resolve_ids(db, batch)
+            rows = []
+            for uid, room, sender, content in batch:
+                room_id = self.room_ids.get(room)
+                if room_id is None:
+                    MESSAGES_DROPPED.labels("unknown_room").inc()
+                    continue
+                rows.append({
+                    "uid": uid,
+                    "room_id": room_id,
+                    "user_id": self.user_ids.get(sender),
+                    "content": content,
+                    "created_at": datetime.datetime.fromtimestamp(id_timestamp(uid)),
+                })
+            MessageQueries(db).create_room_messages(rows)
+            MESSAGES_PERSISTED.inc(len(rows))
+        finally:
+            db.close()
+
+    def _resolve_ids(self, db, batch: List[tuple]):
+        rooms = {room for _, room, _, _ in batch if room not in self.room_ids}
+        if rooms:
+            self.room_ids.update(NatsRoomQueries(db).get_room_ids_by_names(list(rooms)))
+        senders = {sender for _, _, sender, _ in batch if sender and sender not in self.user_ids}
+        if senders:
+            self.user_ids.update(UserQueries(db).get_user_ids_by_usernames(list(senders)))
+
+    async def close(self):
+        """Write whatever is still queued, then stop the background task"""
+        if self.task is not None:
+            if not self.task.done():
+                # The task writes its current batch and stops at the sentinel
+                self.queue.put_nowait(None)
+                await self.task
+            self.task = None
+        if self.queue is not None:
+            # Rows queued behind the sentinel
+            pending = []
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+            for start in range(0, len(pending), self.batch_size):
+                await self._flush(pending[start:start + self.batch_size])
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,348 @@
+"""
+Room presence without per-connection broadcasts.
+
+Each node counts its own connections per room and user, with usernames
+interned to small ints (and forgotten once the user is in no room). Changes are not broadcast as they happen: every
+PRESENCE_INTERVAL seconds the node publishes one message on presence.<node>
+with the users that came online or went offline in each room. A user whose
+last connection drops is only reported offline after PRESENCE_DEBOUNCE
+seconds, so a reconnect (or a storm of them) inside that window sends nothing.
+
+Every node subscribes to presence.> and keeps the cluster view: which users
+each node reports online in each room. From it, a node derives the effective
+changes (a user online on two nodes has not left when one of them reports a
+leave), delivers them to its local subscribers of the room as one
+{"type": "presence"} frame, and answers "who is online in room X" from
+memory. Nodes publish their full state every PRESENCE_SYNC_INTERVAL seconds
+(and when a new node asks for it on presence._sync); a node not heard from
+for three intervals is dropped from the view.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from app.services.fanout_service import NODE_EPOCH, RoomFanout
+from app.shared import serialization
+from app.shared.log import throttled
+from app.shared.metrics import Counter, Gauge
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds between batched presence updates
+PRESENCE_INTERVAL = float(os.getenv("PRESENCE_INTERVAL", "1"))
+# Seconds a user stays online after their last connection closes
+PRESENCE_DEBOUNCE = float(os.getenv("PRESENCE_DEBOUNCE", "5"))
+# Seconds between full-state publications; nodes silent for three of these are dropped
+PRESENCE_SYNC_INTERVAL = float(os.getenv("PRESENCE_SYNC_INTERVAL", "30"))
+
+PRESENCE_SUBJECT_PREFIX = "presence"
+PRESENCE_SYNC_SUBJECT = f"{PRESENCE_SUBJECT_PREFIX}._sync"
+
+PRESENCE_UPDATES = Counter("chat_presence_updates_total", "Presence messages published by this node", ["kind"])
+PRESENCE_DEBOUNCED = Counter("chat_presence_debounced_total", "Disconnects absorbed by a reconnect within the debounce window")
+PRESENCE_ONLINE = Gauge("chat_presence_local_users", "Users with at least one connection to a room on this node")
+
+
+class Interner:
+    """
+    Maps usernames to dense ints so per-room state holds small ints, not strings.
+    Every room entry holding an id counts as a reference; a name is dropped
+    when its last reference is released and its id is reused.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[Optional[str]] = []
+        self.refs: List[int] = []
+        self.free: List[int] = []
+
+    def id(self, name: str) -> int:
+        index = self.ids.get(name)
+        if index is None:
+            if self.free:
+                index = self.free.pop()
+                self.names[index] = name
+            else:
+                index = len(self.names)
+                self.names.append(name)
+                self.refs.append(0)
+            self.ids[name] = index
+        return index
+
+    def name(self, index: int) -> str:
+        return self.names[index]
+
+    def acquire(self, index: int):
+        self.refs[index] += 1
+
+    def release(self, index: int):
+        self.refs[index] -= 1
+        self.forget_unused(index)
+
+    def forget_unused(self, index: int):
+        if self.refs[index] == 0 and self.names[index] is not None:
+            del self.ids[self.names[index]]
+            self.names[index] = None
+            self.free.append(index)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class PresenceService:
+    def __init__(self, fanout: RoomFanout, node_id: str = NODE_EPOCH, interval: float = PRESENCE_INTERVAL,
+                 debounce: float = PRESENCE_DEBOUNCE, sync_interval: float = PRESENCE_SYNC_INTERVAL):
+        self.fanout = fanout
+        self.node_id = node_id
+        self.interval = interval
+        self.debounce = debounce
+        self.sync_interval = sync_interval
+        self.users = Interner()
+
+        # Local connections: room -> user -> open connections
+        self.local: Dict[str, Dict[int, int]] = {}
+        # Users this node has reported online, per room
+        self.announced: Dict[str, Set[int]] = {}
+        # Rooms whose connections changed since the last tick
+        self.dirty: Set[str] = set()
+        # (room, user) -> loop time at which the user is reported offline
+        self.leaving: Dict[Tuple[str, int], float] = {}
+
+        # Cluster view: node -> room -> users, and room -> user -> number of nodes reporting them
+        self.nodes: Dict[str, Dict[str, Set[int]]] = {}
+        self.node_seen: Dict[str, float] = {}
+        self.cluster: Dict[str, Dict[int, int]] = {}
+
+        self.task = None
+        self.subscription = None
+        self.sync_requested = True
+        self.last_sync = 0.0
+
+    # Local connections
+
+    def connect(self, username: str, rooms: Iterable[str]):
+        user = self.users.id(username)
+        for room in rooms:
+            counts = self.local.setdefault(room, {})
+            if user not in counts:
+                self.users.acquire(user)
+            counts[user] = counts.get(user, 0) + 1
+            if self.leaving.pop((room, user), None) is not None:
+                PRESENCE_DEBOUNCED.inc()
+                self.users.release(user)
+            self.dirty.add(room)
+        # A connection without rooms leaves nothing to remember
+        self.users.forget_unused(user)
+        self.start()
+
+    def disconnect(self, username: str, rooms: Iterable[str]):
+        user = self.users.ids.get(username)
+        if user is None:
+            return
+        deadline = asyncio.get_running_loop().time() + self.debounce
+        for room in rooms:
+            counts = self.local.get(room)
+            if not counts or user not in counts:
+                continue
+            counts[user] -= 1
+            if counts[user] == 0:
+                del counts[user]
+                if not counts:
+                    del self.local[room]
+                if (room, user) not in self.leaving:
+                    self.users.acquire(user)
+                self.leaving[(room, user)] = deadline
+                self.users.release(user)
+
+    def online(self, room: str) -> List[str]:
+        """Usernames online in a room anywhere in the cluster, from memory"""
+        users = set(self.cluster.get(room, ()))
+        users.update(self.announced.get(room, ()))
+        return sorted(self.users.name(user) for user in users)
+
+    # Batched publication
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        nc = await self.fanout.get_connection()
+        self.subscription = await nc.subscribe(f"{PRESENCE_SUBJECT_PREFIX}.>", cb=self._on_message)
+        # Ask the other nodes for their state instead of waiting for their next sync
+        await nc.publish(PRESENCE_SYNC_SUBJECT, self.node_id.encode())
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error("Presence tick failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def collect_changes(self, now: float) -> Dict[str, Dict[str, List[str]]]:
+        """Local joins and debounced leaves since the last tick, per room"""
+        changes: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: {"joined": [], "left": []})
+
+        for room in self.dirty:
+            announced = self.announced.get(room, set())
+            for user in self.local.get(room, ()):
+                if user not in announced:
+                    announced.add(user)
+                    self.users.acquire(user)
+                    changes[room]["joined"].append(self.users.name(user))
+            if announced:
+                self.announced[room] = announced
+        self.dirty.clear()
+
+        for key, deadline in list(self.leaving.items()):
+            if deadline > now:
+                continue
+            del self.leaving[key]
+            room, user = key
+            announced = self.announced.get(room)
+            if announced is not None and user in announced and user not in self.local.get(room, ()):
+                announced.discard(user)
+                changes[room]["left"].append(self.users.name(user))
+                if not announced:
+                    del self.announced[room]
+                self.users.release(user)
+            self.users.release(user)
+
+        PRESENCE_ONLINE.set(sum(len(users) for users in self.local.values()))
+        return {room: change for room, change in changes.items() if change["joined"] or change["left"]}
+
+    async def tick(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        changes = self.collect_changes(now)
+        nc = await self.fanout.get_connection()
+        subject = f"{PRESENCE_SUBJECT_PREFIX}.{self.node_id}"
+
+        if self.sync_requested or now - self.last_sync >= self.sync_interval:
+            # The full state already includes this tick's changes
+            self.sync_requested = False
+            self.last_sync = now
+            rooms = {room: sorted(self.users.name(user) for user in users) for room, users in self.announced.items()}
+            await nc.publish(subject, serialization.dumps({"node": self.node_id, "full": True, "rooms": rooms}))
+            PRESENCE_UPDATES.labels("full").inc()
+        elif changes:
+            await nc.publish(subject, serialization.dumps({"node": self.node_id, "rooms": changes}))
+            PRESENCE_UPDATES.labels("diff").inc()
+
+        self.expire_nodes(now)
+
+    # Cluster view
+
+    async def _on_message(self, msg):
+        if msg.subject == PRESENCE_SYNC_SUBJECT:
+            if msg.data.decode() != self.node_id:
+                self.sync_requested = True
+            return
+        try:
+            update = serialization.loads(msg.data)
+        except ValueError:
+            throttled(logger).warning("Ignoring malformed presence update on %s", msg.subject)
+            return
+        self.apply(update, asyncio.get_running_loop().time())
+
+    def apply(self, update: Dict, now: float):
+        """Apply a node's update to the cluster view and notify local subscribers of effective changes"""
+        node = update.get("node")
+        if not node:
+            return
+        self.node_seen[node] = now
+        node_rooms = self.nodes.setdefault(node, {})
+        changes: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: {"joined": [], "left": []})
+
+        if update.get("full"):
+            reported = {room: {self.users.id(name) for name in names} for room, names in update.get("rooms", {}).items()}
+            for room in set(node_rooms) | set(reported):
+                current = node_rooms.get(room, set())
+                target = reported.get(room, set())
+                for user in target - current:
+                    self._add(node_rooms, room, user, changes)
+                for user in current - target:
+                    self._remove(node_rooms, room, user, changes)
+        else:
+            for room, change in update.get("rooms", {}).items():
+                for name in change.get("joined", ()):
+                    self._add(node_rooms, room, self.users.id(name), changes)
+                for name in change.get("left", ()):
+                    user = self.users.ids.get(name)
+                    if user is not None:
+                        self._remove(node_rooms, room, user, changes)
+
+        self._deliver(changes)
+
+    def expire_nodes(self, now: float):
+        changes: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: {"joined": [], "left": []})
+        for node, seen in list(self.node_seen.items()):
+            if node == self.node_id or now - seen < 3 * self.sync_interval:
+                continue
+            logger.warning("Presence: no update from node %s for %.0fs, dropping its users", node, now - seen)
+            node_rooms = self.nodes.pop(node, {})
+            del self.node_seen[node]
+            for room, users in list(node_rooms.items()):
+                for user in list(users):
+                    self._remove(node_rooms, room, user, changes)
+        self._deliver(changes)
+
+    def _add(self, node_rooms, room, user, changes):
+        users = node_rooms.setdefault(room, set())
+        if user in users:
+            return
+        users.add(user)
+        counts = self.cluster.setdefault(room, {})
+        counts[user] = counts.get(user, 0) + 1
+        if counts[user] == 1:
+            self.users.acquire(user)
+            changes[room]["joined"].append(self.users.name(user))
+
+    def _remove(self, node_rooms, room, user, changes):
+        users = node_rooms.get(room)
+        if not users or user not in users:
+            return
+        users.discard(user)
+        if not users:
+            del node_rooms[room]
+        counts = self.cluster.get(room, {})
+        counts[user] -= 1
+        if counts[user] == 0:
+            del counts[user]
+            if not counts:
+                del self.cluster[room]
+            changes[room]["left"].append(self.users.name(user))
+            self.users.release(user)
+
+    def _deliver(self, changes):
+        for room, change in changes.items():
+            if not (change["joined"] or change["left"]) or not self.fanout.rooms.get(room):
+                continue
+            frame = {"type": "presence", "room": room, "joined": change["joined"], "left": change["left"]}
+            self.fanout.deliver_local(room, serialization.dumps(frame))
+
+    async def close(self):
+        """Stop publishing, telling the other nodes this node's users are gone"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            nc = self.fanout.nc
+            if nc is not None and nc.is_connected:
+                subject = f"{PRESENCE_SUBJECT_PREFIX}.{self.node_id}"
+                await nc.publish(subject, serialization.dumps({"node": self.node_id, "full": True, "rooms": {}}))
+        if self.subscription is not None:
+            try:
+                await self.subscription.unsubscribe()
+            except Exception as e:
+                logger.warning("Error unsubscribing from presence updates: %s", e)
+            self.subscription = None
@@ -0,0 +1,460 @@
+import asyncio
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from dotenv import load_dotenv
+
+from app.database.db import SessionLocal
+from app.database.models import NatsPermission, NatsUserRoom, PermissionType, User
+from app.nats.ncs import delete_user_credentials, mint_user_credentials
+from app.querries.nats_account_querries import NatsAccountQueries
+from app.querries.nats_room_querries import NatsRoomQueries
+from app.querries.user_querries import UserQueries
+from app.shared.passwords import hash_password_sync
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+BULK_IMPORT_WORKERS = int(os.getenv("BULK_IMPORT_WORKERS", str(os.cpu_count() or 4)))
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "500"))
+# Finished import jobs kept in memory for the status endpoint
+BULK_IMPORT_JOBS_KEPT = int(os.getenv("BULK_IMPORT_JOBS_KEPT", "100"))
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# (line number, parsed row or None, parse error or None)
+ImportRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+class ImportReport:
+    """Running totals and per-row errors of a bulk user import"""
+
+    def __init__(self, max_errors: int = 1000):
+        self.max_errors = max_errors
+        self.processed = 0
+        self.created = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        # Whether the import was stopped before the last row
+        self.stopped = False
+
+    def add_error(self, line: int, username: Optional[str], error: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "username": username, "error": error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "failed": self.failed,
+            "errors": list(self.errors),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def detect_import_format(filename: Optional[str]) -> Optional[str]:
+    """
+    Guess the import format from a file name
+    """
+    if not filename:
+        return None
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    return None
+
+
+def _parse_rooms(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(";")
+    return [room.strip() for room in value if room and room.strip()]
+
+
+def iter_user_rows(stream: TextIO, fmt: str) -> Iterator[ImportRow]:
+    """
+    Stream users from a CSV or NDJSON text stream.
+
+    Expected fields are username, password, email (optional) and rooms
+    (optional; a list in NDJSON, ';'-separated in CSV). Rows that cannot be
+    parsed are yielded with an error instead of aborting the stream.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, {
+                "username": (record.get("username") or "").strip(),
+                "password": record.get("password") or "",
+                "email": (record.get("email") or "").strip() or None,
+                "rooms": _parse_rooms(record.get("rooms")),
+            }, None
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            yield line_no, None, f"Invalid JSON: {e}"
+            continue
+        yield line_no, {
+            "username": str(record.get("username") or "").strip(),
+            "password": str(record.get("password") or ""),
+            "email": record.get("email") or None,
+            "rooms": _parse_rooms(record.get("rooms")),
+        }, None
+
+
+def _provision_credentials(username: str, password: str, account: str) -> Dict[str, str]:
+    # Worker process entry point: both steps are CPU or subprocess bound
+    creds = mint_user_credentials(username, account)
+    creds["hashed_password"] = hash_password_sync(password)
+    return creds
+
+
+def _discard_credentials(username: str, account: str):
+    # Worker process entry point, for users minted but never stored
+    delete_user_credentials(username, account)
+
+
+def _batched(rows: Iterable[ImportRow], size: int) -> Iterator[List[ImportRow]]:
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _BulkImporter:
+    def __init__(self, db, executor, account_name: str, report: ImportReport):
+        self.db = db
+        self.executor = executor
+        self.account_name = account_name
+        self.report = report
+        self.user_queries = UserQueries(db)
+        self.room_queries = NatsRoomQueries(db)
+        self.account_queries = NatsAccountQueries(db)
+        self.seen_usernames = set()
+        self.rooms: Dict[str, Any] = {}
+        self.accounts: Dict[str, int] = {}
+
+    def _resolve_room(self, room_name: str):
+        if room_name not in self.rooms:
+            self.rooms[room_name] = self.room_queries.get_room_by_name(room_name)
+        return self.rooms[room_name]
+
+    def _resolve_account_id(self, account_public_key: str) -> int:
+        if account_public_key not in self.accounts:
+            account = self.account_queries.get_account_by_public_key(account_public_key)
+            if not account:
+                account = self.account_queries.create_account(
+                    name=self.account_name,
+                    public_key=account_public_key
+                )
+            self.accounts[account_public_key] = account.id
+        return self.accounts[account_public_key]
+
+    def _validate(self, batch: List[ImportRow]) -> List[Tuple[int, Dict[str, Any], List[Any]]]:
+        candidates = []
+        for line_no, row, error in batch:
+            self.report.processed += 1
+            if error:
+                self.report.add_error(line_no, None, error)
+                continue
+
+            username = row["username"]
+            if not username or not row["password"]:
+                self.report.add_error(line_no, username or None, "username and password are required")
+                continue
+            if username in self.seen_usernames:
+                self.report.add_error(line_no, username, "Duplicate username in import")
+                continue
+            self.seen_usernames.add(username)
+
+            rooms = [self._resolve_room(room_name) for room_name in row["rooms"]]
+            missing = [name for name, room in zip(row["rooms"], rooms) if room is None]
+            if missing:
+                self.report.add_error(line_no, username, f"Rooms not found: {', '.join(missing)}")
+                continue
+
+            candidates.append((line_no, row, rooms))
+
+        existing = self.user_queries.get_existing_usernames([row["username"] for _, row, _ in candidates])
+        valid = []
+        for line_no, row, rooms in candidates:
+            if row["username"] in existing:
+                self.report.add_error(line_no, row["username"], "User already exists")
+            else:
+                valid.append((line_no, row, rooms))
+        return valid
+
+    def _add_user(self, row: Dict[str, Any], creds: Dict[str, str], rooms: List[Any]):
+        user = User(
+            username=row["username"],
+            email=row["email"],
+            hashed_password=creds["hashed_password"],
+            nats_seed_hash=creds["seed"],
+            nats_jwt=creds["jwt"],
+            nats_public_key=creds["public_key"],
+            nats_account_public_key=creds["account_public_key"],
+            nats_account_id=self.accounts[creds["account_public_key"]],
+        )
+        self.db.add(user)
+        self.db.flush()
+
+        for room in rooms:
+            self.db.add(NatsUserRoom(user_id=user.id, room_id=room.id))
+            for permission_type in (PermissionType.PUB, PermissionType.SUB):
+                self.db.add(NatsPermission(
+                    user_id=user.id,
+                    room_id=room.id,
+                    permission_type=permission_type,
+                    subject=f"chat.{room.name}"
+                ))
+
+    def import_batch(self, batch: List[ImportRow]):
+        valid = self._validate(batch)
+
+        # Mint NATS credentials and hash passwords in parallel worker processes
+        futures = [
+            (line_no, row, rooms, self.executor.submit(_provision_credentials, row["username"], row["password"],
+                                                       self.account_name))
+            for line_no, row, rooms in valid
+        ]
+        minted = []
+        # Users that may exist in nsc but are not stored
+        orphans = []
+        for line_no, row, rooms, future in futures:
+            try:
+                minted.append((line_no, row, rooms, future.result()))
+            except Exception as e:
+                self.report.add_error(line_no, row["username"], f"Failed to mint NATS credentials: {e}")
+                orphans.append(row["username"])
+
+        try:
+            if minted:
+                orphans.extend(self._store(minted))
+        finally:
+            self._discard(orphans)
+
+    def _store(self, minted) -> List[str]:
+        """Insert minted users; returns the usernames that could not be stored"""
+        # Account lookups commit on their own, so resolve them before the batch is staged
+        for _, _, _, creds in minted:
+            self._resolve_account_id(creds["account_public_key"])
+
+        # Insert the whole batch in one transaction
+        try:
+            for line_no, row, rooms, creds in minted:
+                self._add_user(row, creds, rooms)
+            self.db.commit()
+            self.report.created += len(minted)
+            return []
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"Batch insert failed, retrying rows individually: {e}")
+
+        # Isolate the failing rows with one savepoint per user
+        failed = []
+        for line_no, row, rooms, creds in minted:
+            try:
+                with self.db.begin_nested():
+                    self._add_user(row, creds, rooms)
+                self.report.created += 1
+            except Exception as e:
+                self.report.add_error(line_no, row["username"], f"Database insert failed: {e}")
+                failed.append(row["username"])
+        self.db.commit()
+        return failed
+
+    def _discard(self, usernames: List[str]):
+        # Without a database row nobody can get these users' credentials, so delete them
+        futures = [(username, self.executor.submit(_discard_credentials, username, self.account_name))
+                   for username in usernames]
+        for username, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Failed to delete NATS user {username} after a failed import: {e}")
+
+
+def account_name_of(username: str) -> Optional[str]:
+    """Name of the NATS account a user belongs to, or None"""
+    db = SessionLocal()
+    try:
+        return UserQueries(db).get_account_name(username)
+    finally:
+        db.close()
+
+
+def import_users(
+    rows: Iterable[ImportRow],
+    account_name: str = "chat-app",
+    workers: int = BULK_IMPORT_WORKERS,
+    batch_size: int = BULK_IMPORT_BATCH_SIZE,
+    progress_cb: Optional[Callable[[ImportReport], None]] = None,
+    max_errors: int = 1000,
+    stop: Optional[threading.Event] = None
+) -> ImportReport:
+    """
+    Provision users in bulk.
+
+    Rows are consumed in batches of batch_size: credentials for each batch are
+    minted by a pool of worker processes, then users, room memberships and
+    permissions are inserted in a single transaction. Row-level failures are
+    recorded on the report and never abort the import; NATS users minted for
+    rows that could not be stored are deleted again.
+
+    Args:
+        rows: Parsed rows, as produced by iter_user_rows
+        account_name: NATS account the users are created in
+        workers: Number of credential minting processes
+        batch_size: Number of rows per database transaction
+        progress_cb: Called with the report after every batch
+        max_errors: Maximum number of per-row errors kept on the report
+        stop: When set, the import stops before the next batch
+
+    Returns:
+        ImportReport: Totals and per-row errors
+    """
+    report = ImportReport(max_errors=max_errors)
+    db = SessionLocal()
+    try:
+        # Spawned workers only import app.nats.ncs and never inherit DB connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            importer = _BulkImporter(db, executor, account_name, report)
+            for batch in _batched(rows, batch_size):
+                if stop is not None and stop.is_set():
+                    report.stopped = True
+                    break
+                importer.import_batch(batch)
+                if progress_cb:
+                    progress_cb(report)
+    finally:
+        db.close()
+
+    logger.info(f"Bulk import finished: {report.created} created, {report.failed} failed "
+                f"out of {report.processed} rows")
+    return report
+
+
+def save_upload(source, suffix: str = "") -> str:
+    """Copy an uploaded file to a temporary file that outlives the request; returns its path"""
+    with tempfile.NamedTemporaryFile("wb", suffix=suffix, delete=False) as target:
+        shutil.copyfileobj(source, target)
+    return target.name
+
+
+class ImportJob:
+    """A bulk import running in the background, polled through its id"""
+
+    def __init__(self, owner: str):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = "running"
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.report: Dict[str, Any] = ImportReport().to_dict()
+        self.error: Optional[str] = None
+        self.stop = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "report": self.report,
+            "error": self.error,
+        }
+
+
+class ImportJobs:
+    """
+    Bulk imports started from the API. Each runs import_users in a worker
+    thread and publishes its report after every batch; finished jobs are
+    kept, oldest dropped first, up to kept.
+    """
+
+    def __init__(self, kept: int = BULK_IMPORT_JOBS_KEPT):
+        self.kept = kept
+        self.jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, path: str, fmt: str, account_name: str, owner: str) -> ImportJob:
+        """Import the users in the file at path, which is deleted once the job is done"""
+        job = ImportJob(owner)
+        self.jobs[job.id] = job
+        self._prune()
+        self.tasks[job.id] = asyncio.create_task(self._run(job, path, fmt, account_name))
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status != "running"]
+        for job_id in finished[:max(0, len(finished) - self.kept)]:
+            del self.jobs[job_id]
+
+    async def _run(self, job: ImportJob, path: str, fmt: str, account_name: str):
+        def publish(report: ImportReport):
+            job.report = report.to_dict()
+
+        def run():
+            with open(path, "r", encoding="utf-8", newline="") as stream:
+                return import_users(iter_user_rows(stream, fmt), account_name=account_name,
+                                    progress_cb=publish, stop=job.stop)
+
+        try:
+            report = await asyncio.to_thread(run)
+            publish(report)
+            job.status = "stopped" if report.stopped else "finished"
+        except Exception as e:
+            logger.error(f"Bulk import {job.id} by {job.owner} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self.tasks.pop(job.id, None)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        logger.info(f"Bulk import {job.id} by {job.owner} {job.status}: {job.report['created']} created, "
+                    f"{job.report['failed']} failed")
+
+    async def close(self):
+        """Stop running imports after their current batch and wait for them"""
+        for job_id in list(self.tasks):
+            self.jobs[job_id].stop.set()
+        if self.tasks:
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+
+import_jobs = ImportJobs()
@@ -0,0 +1,94 @@
+"""
+Publish rate limits per user and per room.
+
+Every message published through the server takes a token from two buckets:
+the sender's (per NATS account) and the room's. Rates and bursts come from
+the room's NatsAccount, falling back to the PUBLISH_* settings; limits are
+cached when a user's rooms are loaded, so the check itself never touches the
+database.
+"""
+
+import os
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from app.shared.metrics import Counter
+from app.shared.rate_limit import RateLimiter
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Messages per second and burst size, per user and per room (rate 0 disables the limit)
+PUBLISH_USER_RATE = float(os.getenv("PUBLISH_USER_RATE", "5"))
+PUBLISH_USER_BURST = int(os.getenv("PUBLISH_USER_BURST", "20"))
+PUBLISH_ROOM_RATE = float(os.getenv("PUBLISH_ROOM_RATE", "200"))
+PUBLISH_ROOM_BURST = int(os.getenv("PUBLISH_ROOM_BURST", "400"))
+# Upper bound on the number of buckets kept in memory
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+MESSAGES_THROTTLED = Counter("chat_messages_throttled_total", "Messages rejected by publish rate limits", ["scope"])
+
+
+class PublishLimits(NamedTuple):
+    account_id: Optional[int]
+    user_rate: float
+    user_burst: int
+    room_rate: float
+    room_burst: int
+
+
+DEFAULT_LIMITS = PublishLimits(None, PUBLISH_USER_RATE, PUBLISH_USER_BURST, PUBLISH_ROOM_RATE, PUBLISH_ROOM_BURST)
+
+
+def _pick(value, default):
+    return default if value is None else value
+
+
+class PublishLimiter:
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.limiter = RateLimiter(max_keys)
+        self.room_limits: Dict[str, PublishLimits] = {}
+        self._throttled = {scope: MESSAGES_THROTTLED.labels(scope) for scope in ("user", "room")}
+
+    def remember_rooms(self, rooms: Iterable):
+        """Cache the limits of rows from NatsRoomQueries.get_room_limits_for_user"""
+        for room in rooms:
+            if room.account_id is None:
+                self.room_limits[room.name] = DEFAULT_LIMITS
+                continue
+            self.room_limits[room.name] = PublishLimits(
+                room.account_id,
+                _pick(room.user_publish_rate, PUBLISH_USER_RATE),
+                _pick(room.user_publish_burst, PUBLISH_USER_BURST),
+                _pick(room.room_publish_rate, PUBLISH_ROOM_RATE),
+                _pick(room.room_publish_burst, PUBLISH_ROOM_BURST),
+            )
+
+    def check(self, username: str, room: str) -> float:
+        """
+        Take a token for a message from username to room. Returns 0 if it may
+        be published, otherwise the seconds to wait before trying again.
+        """
+        limits = self.room_limits.get(room, DEFAULT_LIMITS)
+        # Check both before taking either, so a rejected message costs nothing.
+        # Tokens are taken from the bucket objects: looking up the room's bucket
+        # may evict the user's from a full limiter
+        user_bucket = self.limiter.bucket(("user", limits.account_id, username), limits.user_rate, limits.user_burst)
+        user_wait = 0.0 if user_bucket is None else user_bucket.wait_time(limits.user_rate)
+        if user_wait:
+            self._throttled["user"].inc()
+            return user_wait
+        room_bucket = self.limiter.bucket(("room", room), limits.room_rate, limits.room_burst)
+        room_wait = 0.0 if room_bucket is None else room_bucket.wait_time(limits.room_rate)
+        if room_wait:
+            self._throttled["room"].inc()
+            return room_wait
+
+        for bucket in (user_bucket, room_bucket):
+            if bucket is not None:
+                bucket.take()
+        return 0.0
+
+
+publish_limiter = PublishLimiter()
@@ -0,0 +1,163 @@
+"""
+Read markers and unread counts.
+
+Clients report the newest message they have seen on every scroll, so marks
+are coalesced in memory (only the newest per user and room is kept) and
+written every READ_MARKER_FLUSH_INTERVAL seconds in one executemany UPDATE.
+
+Clients mark by message id, and ids are only roughly in persist order: every
+node's writer stores its own batches, so a room's seq numbers can interleave
+ids from different nodes. Markers therefore move forward by id and a member's
+unread count is the number of the room's messages with a newer id than the
+marker, an index range count on (room_id, uid) capped at UNREAD_COUNT_LIMIT.
+The counts for all of a user's rooms are one query.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.database.db import SessionLocal
+from app.querries.message_querries import MessageQueries
+from app.querries.nats_room_querries import NatsRoomQueries
+from app.querries.user_querries import UserQueries
+from app.shared.metrics import Counter
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds between read marker writes
+READ_MARKER_FLUSH_INTERVAL = float(os.getenv("READ_MARKER_FLUSH_INTERVAL", "2"))
+# Flushes a mark waits for its message to be persisted by the write-behind writer
+READ_MARKER_MAX_ATTEMPTS = int(os.getenv("READ_MARKER_MAX_ATTEMPTS", "5"))
+# Unread counts stop at this many messages per room
+UNREAD_COUNT_LIMIT = int(os.getenv("UNREAD_COUNT_LIMIT", "1000"))
+
+READ_MARKS_RECEIVED = Counter("chat_read_marks_received_total", "Read marks reported by clients")
+READ_MARKERS_WRITTEN = Counter("chat_read_markers_written_total", "Read markers written to the database")
+
+
+class ReadMarkers:
+    def __init__(self, session_factory: Callable = SessionLocal, flush_interval: float = READ_MARKER_FLUSH_INTERVAL):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        # (username, room) -> newest message id reported since the last flush
+        self.pending: Dict[Tuple[str, str], int] = {}
+        self.attempts: Dict[Tuple[str, str], int] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.user_ids: Dict[str, int] = {}
+        self.room_ids: Dict[str, int] = {}
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def mark(self, username: str, room: str, message_id: int):
+        """Record that a user has read a room up to message_id"""
+        READ_MARKS_RECEIVED.inc()
+        key = (username, room)
+        if message_id > self.pending.get(key, 0):
+            self.pending[key] = message_id
+        self.start()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        try:
+            unresolved = await asyncio.to_thread(self.write_markers, batch)
+        except Exception as e:
+            logger.error("Failed to write %d read markers: %s", len(batch), e)
+            unresolved = batch
+
+        # Messages not persisted yet are retried on the next flush, unless a newer mark arrived
+        for key, message_id in unresolved.items():
+            attempts = self.attempts.get(key, 0) + 1
+            if attempts >= READ_MARKER_MAX_ATTEMPTS:
+                self.attempts.pop(key, None)
+                logger.warning("Dropping read marker for %s in %s: message %s not found", key[0], key[1], message_id)
+                continue
+            if message_id > self.pending.get(key, 0):
+                self.pending[key] = message_id
+                self.attempts[key] = attempts
+        for key in batch:
+            if key not in unresolved:
+                self.attempts.pop(key, None)
+
+    def write_markers(self, batch: Dict[Tuple[str, str], int]) -> Dict[Tuple[str, str], int]:
+        """Write a batch of marks; returns those whose message is not persisted yet"""
+        db = self.session_factory()
+        try:
+            usernames = {username for username, _ in batch if username not in self.user_ids}
+            if usernames:
+                self.user_ids.update(UserQueries(db).get_user_ids_by_usernames(list(usernames)))
+            rooms = {room for _, room in batch if room not in self.room_ids}
+            if rooms:
+                self.room_ids.update(NatsRoomQueries(db).get_room_ids_by_names(list(rooms)))
+            seqs = MessageQueries(db).get_seqs_by_uids(list(set(batch.values())))
+
+            markers = []
+            unresolved = {}
+            for (username, room), message_id in batch.items():
+                user_id = self.user_ids.get(username)
+                room_id = self.room_ids.get(room)
+                if user_id is None or room_id is None:
+                    continue
+                if message_id not in seqs:
+                    unresolved[(username, room)] = message_id
+                    continue
+                message_room_id, seq = seqs[message_id]
+                # Ignore ids from other rooms
+                if message_room_id == room_id and seq is not None:
+                    markers.append({"user_id": user_id, "room_id": room_id, "seq": seq, "uid": message_id})
+
+            NatsRoomQueries(db).update_read_markers(markers)
+            READ_MARKERS_WRITTEN.inc(len(markers))
+            return unresolved
+        finally:
+            db.close()
+
+    def _unread_counts(self, username: str) -> Dict[str, int]:
+        db = self.session_factory()
+        try:
+            user = UserQueries(db).get_user_by_username(username)
+            if not user:
+                return {}
+            counts = {}
+            for room, unread, last_message_uid, last_read_uid in NatsRoomQueries(db).get_unread_counts(
+                    user.id, UNREAD_COUNT_LIMIT):
+                # A mark still waiting to be flushed that covers the newest message means nothing is unread
+                pending = self.pending.get((username, room))
+                if pending is not None and last_message_uid is not None and pending >= last_message_uid:
+                    unread = 0
+                counts[room] = max(0, unread or 0)
+            return counts
+        finally:
+            db.close()
+
+    async def get_unread_counts(self, username: str) -> Dict[str, int]:
+        """Unread messages per room for all of a user's rooms"""
+        return await asyncio.to_thread(self._unread_counts, username)
+
+    async def close(self):
+        """Write pending marks, then stop the flush task"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+
+read_markers = ReadMarkers()
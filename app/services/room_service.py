@@ -4,11 +4,12 @@ import uuid
 
 from fastapi import HTTPException
 
-from app.database.db import get_db
+from app.database.db import ScopedSession
 from app.querries.nats_room_querries import NatsRoomQueries
 from app.querries.user_querries import UserQueries
 
-db = next(get_db())
+# Queries share the scoped session, created on first use
+db = ScopedSession
 nats_room_queries = NatsRoomQueries(db)
 user_queries = UserQueries(db)
 
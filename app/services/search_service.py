@@ -0,0 +1,69 @@
+"""
+Full-text search over persisted room messages.
+
+Matches come from the GIN index on messages.search_vector, restricted to the
+rooms the caller belongs to, and are ordered by ts_rank_cd with the newest
+message first among equal ranks.
+"""
+
+import asyncio
+import datetime
+import os
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.database.db import SessionLocal
+from app.querries.message_querries import MessageQueries
+from app.querries.nats_room_querries import NatsRoomQueries
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Deepest result offset served; ranking has to sort every match before it
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))
+
+
+def _search(username: str, query: str, room: Optional[str], limit: int, offset: int) -> List[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        rooms = NatsRoomQueries(db).get_room_for_user_by_username(username) or []
+        room_ids = [r.id for r in rooms if room is None or r.name == room]
+        if room is not None and not room_ids:
+            raise HTTPException(status_code=403, detail="Not a member of this room")
+
+        rows = MessageQueries(db).search_room_messages(room_ids, query, limit, offset)
+        return [
+            {
+                "id": message.uid,
+                "room": room_name,
+                "sender": sender,
+                "message": message.content,
+                "snippet": snippet,
+                "rank": rank,
+                "timestamp": message.created_at.timestamp()
+                if isinstance(message.created_at, datetime.datetime) else None,
+            }
+            for message, sender, room_name, rank, snippet in rows
+        ]
+    finally:
+        db.close()
+
+
+async def search_messages(username: str, query: str, room: Optional[str] = None,
+                          limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """One page of search results for the user's rooms (or one of them)"""
+    query = query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    if offset > SEARCH_MAX_OFFSET:
+        raise HTTPException(status_code=400, detail=f"offset may not exceed {SEARCH_MAX_OFFSET}")
+
+    results = await asyncio.to_thread(_search, username, query, room, limit, offset)
+    return {
+        "query": query,
+        "results": results,
+        # A full page means there may be more
+        "next_offset": offset + limit if len(results) == limit else None,
+    }
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.services.chat_service import fanout, presence
+from app.services.fanout_service import QueueSubscriber
+from app.services.history_service import HISTORY_ON_JOIN, get_room_history, history_frame
+from app.shared import serialization
+from app.shared.metrics import Gauge
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeat comments on an idle stream
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+# Reconnect delay suggested to EventSource clients, in milliseconds
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+SSE_CLIENTS_ACTIVE = Gauge("chat_sse_clients_active", "Open Server-Sent Events streams on this node")
+
+HEARTBEAT_FRAME = b": heartbeat\n\n"
+
+
+def _gap_frame(rooms: List[str]) -> bytes:
+    return f"event: gap\ndata: {serialization.dumps_text({'rooms': rooms})}\n\n".encode()
+
+
+def _history_frame(room: str, page) -> bytes:
+    data = history_frame(room, page).replace("\n", "\ndata: ")
+    return f"event: history\ndata: {data}\n\n".encode()
+
+
+async def room_event_stream(room_names: List[str], last_event_id: Optional[str] = None,
+                            username: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    Stream room events as Server-Sent Events frames.
+
+    A fresh stream starts with a 'history' event per room. On reconnect, events
+    after last_event_id are replayed from the fan-out buffer instead; if some
+    may have been missed a 'gap' event names the affected rooms so the client
+    can reload their history. Idle streams get heartbeat comments.
+    """
+    subscriber = QueueSubscriber()
+    await fanout.subscribe(subscriber, room_names)
+    SSE_CLIENTS_ACTIVE.inc()
+    if username:
+        presence.connect(username, room_names)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+
+        # Live events already queued may overlap the replay or history, skip those
+        last_seq = 0
+        history_until: Dict[str, int] = {}
+        if last_event_id:
+            events, gap_rooms = fanout.replay_since(last_event_id, room_names)
+            if gap_rooms:
+                yield _gap_frame(gap_rooms)
+            for event in events:
+                yield event.sse_frame()
+                last_seq = event.seq
+        elif HISTORY_ON_JOIN > 0:
+            for room in room_names:
+                page = await get_room_history(room)
+                if page:
+                    history_until[room] = page[-1][0]
+                yield _history_frame(room, page)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME
+                continue
+
+            if event is None:
+                # Dropped for falling behind; the client resumes with Last-Event-ID
+                return
+            if event.seq <= last_seq or (event.uid is not None and event.uid <= history_until.get(event.room, 0)):
+                continue
+            yield event.sse_frame()
+    finally:
+        SSE_CLIENTS_ACTIVE.dec()
+        if username:
+            presence.disconnect(username, room_names)
+        await fanout.unsubscribe(subscriber)
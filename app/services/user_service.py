@@ -15,12 +15,15 @@ from app.querries.nats_room_querries import NatsRoomQueries
 from app.querries.nats_permission_querries import NatsPermissionQueries
 from app.database.models import PermissionType
 from app.services.auth_service import verify_user_credentials
-from app.database.db import get_db
+from app.database.db import ScopedSession
 from datetime import datetime, timedelta
 
 from app.utils.nats_helpers import extract_jwt_and_nkeys_seed_from_file
+from app.shared.credential_cache import NatsCredentials, credential_cache
+from app.shared.passwords import hash_password
 
-db = next(get_db())
+# Queries share the scoped session, created on first use
+db = ScopedSession
 
 # Initialize queries
 user_group_queries = UserGroupQueries(db)
@@ -76,11 +79,15 @@ async def create_user(username: str, password: str, email: str = None):
     # Create user in database with NATS credentials
     user = user_queries.create_user_with_nats_credentials(
         username=username,
-        hashed_password=password,  # In a real app, this should be hashed
+        hashed_password=await hash_password(password),
         email=email,
         seed_hash= seed,
+        jwt=jwt,
+        public_key=public_key,
+        account_public_key=account_public_key,
         account_id=account.id,
     )
+    credential_cache.put(username, NatsCredentials.from_jwt(jwt, expires_at=user.nats_expires_at))
     # Extract permissions from JWT to identify rooms
     permissions = []
     if 'nats' in user_info and 'pub' in user_info['nats'] and 'allow' in user_info['nats']['pub']:
@@ -106,30 +113,27 @@ async def create_user(username: str, password: str, email: str = None):
     return jwt
     
 async def login_user(username: str, password: str, client_id: str = None, ip_address: str = None, user_agent: str = None):
-    from app.nats.ncs import get_creds_path    
     # Verify credentials (this would check the hashed password in a real app)
     isVerified = await verify_user_credentials(username, password)
     if not isVerified:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Get the user from database
-    db_user = user_queries.get_user_by_username(username)
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get jwt from credentials file
-    creds_file = get_creds_path(username)
-    if not creds_file:
-        logger.error(f"Credentials file for user {username} not found")
-        raise HTTPException(status_code=404, detail="Credentials file not found")
-    jwt, seed, public_key, account_public_key = extract_jwt_and_nkeys_seed_from_file(creds_file)
+    # Serve the JWT from the credential cache, falling back to the stored credentials
+    creds = credential_cache.get(username)
+    if creds is None:
+        db_user = user_queries.get_user_by_username(username)
+        if not db_user:
+            raise HTTPException(status_code=404, detail="User not found")
 
-    if not jwt or not seed or not public_key or not account_public_key:
-        logger.error(f"Failed to extract JWT or seed from credentials file for user {username}")
-        raise HTTPException(status_code=404, detail="Failed to extract JWT or seed")
+        creds = NatsCredentials.from_user(db_user)
+        if creds is None or creds.is_expired():
+            logger.error(f"No valid NATS credentials stored for user {username}")
+            raise HTTPException(status_code=404, detail="NATS credentials not found")
+
+        credential_cache.put(username, creds)
 
     return {
-        "jwt": jwt,
+        "jwt": creds.jwt,
     }
 
 # Remaining functions
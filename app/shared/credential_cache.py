@@ -0,0 +1,111 @@
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from app.utils.nats_helpers import decode_jwt_payload
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CREDENTIAL_CACHE_SIZE = int(os.getenv("CREDENTIAL_CACHE_SIZE", "10000"))
+
+
+class NatsCredentials:
+    """Parsed NATS credentials of a single user"""
+
+    __slots__ = ("jwt", "public_key", "account_public_key", "expires_at")
+
+    def __init__(self, jwt: str, public_key: str, account_public_key: str,
+                 expires_at: Optional[datetime] = None):
+        self.jwt = jwt
+        self.public_key = public_key
+        self.account_public_key = account_public_key
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_jwt(cls, jwt: str, expires_at: Optional[datetime] = None) -> 'NatsCredentials':
+        """
+        Build credentials from a user JWT, taking the earliest of the JWT 'exp'
+        claim and the given expiry.
+        """
+        claims = decode_jwt_payload(jwt)
+        if claims.get("exp"):
+            jwt_expires_at = datetime.fromtimestamp(claims["exp"])
+            if expires_at is None or jwt_expires_at < expires_at:
+                expires_at = jwt_expires_at
+
+        return cls(
+            jwt=jwt,
+            public_key=claims.get("sub"),
+            account_public_key=claims.get("iss"),
+            expires_at=expires_at
+        )
+
+    @classmethod
+    def from_user(cls, user) -> Optional['NatsCredentials']:
+        """
+        Build credentials from the columns of a User row. Returns None when the
+        user has no stored JWT or the credentials were explicitly expired.
+        """
+        if not user.nats_jwt or user.nats_expired_at is not None:
+            return None
+
+        try:
+            return cls.from_jwt(user.nats_jwt, expires_at=user.nats_expires_at)
+        except Exception as e:
+            logger.error(f"Error parsing stored NATS JWT for user {user.username}: {e}")
+            return None
+
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
+        if self.expires_at is None:
+            return False
+        return (now or datetime.now()) >= self.expires_at
+
+
+class CredentialCache:
+    """
+    In-memory LRU of parsed NATS credentials keyed by username.
+
+    Entries are dropped when they expire, and must be invalidated whenever the
+    underlying credentials are rotated or revoked.
+    """
+
+    def __init__(self, max_size: int = CREDENTIAL_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, NatsCredentials]" = OrderedDict()
+
+    def get(self, username: str) -> Optional[NatsCredentials]:
+        creds = self._entries.get(username)
+        if creds is None:
+            return None
+
+        if creds.is_expired():
+            self._entries.pop(username, None)
+            return None
+
+        self._entries.move_to_end(username)
+        return creds
+
+    def put(self, username: str, creds: NatsCredentials):
+        self._entries[username] = creds
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+credential_cache = CredentialCache()
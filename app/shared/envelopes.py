@@ -0,0 +1,122 @@
+"""
+Versioned chat envelopes.
+
+Every JSON message the app and ChatClient exchange has a schema here, as
+pydantic models compiled once at import. Frames are validated where they
+enter, straight from the raw text or bytes (pydantic-core parses and
+validates in one pass), and later stages pass on the validated object or the
+bytes it was published as, without parsing them again.
+
+    ClientFrame     what a browser sends on /ws: a chat message, a presence
+                    query or a read mark, told apart by "type"
+    RoomMessage     what is published on room.<name> and stored in history
+    ChatEnvelope    what ChatClient publishes on chat.<group> and chat.private.<id>
+
+Envelopes carry "v": ENVELOPE_VERSION. A frame without "v" is read as version
+1; a frame from a newer version fails validation instead of being half
+understood. Unknown fields are ignored.
+"""
+
+from typing import Annotated, Any, Dict, Literal, Optional, Union
+
+from pydantic import AliasChoices, BaseModel, ConfigDict, Discriminator, Field, Tag, TypeAdapter, ValidationError
+from pydantic_core import to_json
+
+ENVELOPE_VERSION = 1
+# Longest chat message text accepted, in characters
+MAX_MESSAGE_LENGTH = 8000
+
+Version = Literal[1]
+
+
+class Envelope(BaseModel):
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+
+    v: Version = ENVELOPE_VERSION
+
+    def to_json(self) -> bytes:
+        """Compact JSON without the fields that are not set"""
+        return to_json(self, by_alias=True, exclude_none=True)
+
+
+# Inbound on /ws
+
+class ClientMessage(Envelope):
+    type: Literal["message"] = "message"
+    room: str = Field(min_length=1)
+    # Older clients send the text as "content"
+    message: str = Field(max_length=MAX_MESSAGE_LENGTH, validation_alias=AliasChoices("message", "content"))
+
+
+class PresenceRequest(Envelope):
+    type: Literal["presence"]
+    room: str = Field(min_length=1)
+
+
+class ReadMark(Envelope):
+    type: Literal["read"]
+    room: str = Field(min_length=1)
+    # Newest message id the client has seen
+    id: int
+
+
+def _frame_type(value: Any) -> str:
+    # Frames without a type are chat messages
+    if isinstance(value, dict):
+        return value.get("type", "message")
+    return getattr(value, "type", "message")
+
+
+ClientFrame = Annotated[
+    Union[
+        Annotated[ClientMessage, Tag("message")],
+        Annotated[PresenceRequest, Tag("presence")],
+        Annotated[ReadMark, Tag("read")],
+    ],
+    Discriminator(_frame_type),
+]
+
+_client_frames: TypeAdapter = TypeAdapter(ClientFrame)
+
+
+def parse_client_frame(raw: Union[str, bytes]) -> Union[ClientMessage, PresenceRequest, ReadMark]:
+    """Validate a /ws frame; raises ValidationError (a ValueError) if it does not match the schema"""
+    return _client_frames.validate_json(raw)
+
+
+def describe_error(error: ValidationError, limit: int = 120) -> str:
+    """The first problem of a failed validation, short enough for a WebSocket close reason"""
+    first = error.errors(include_url=False)[0]
+    location = ".".join(str(part) for part in first["loc"])
+    text = f"{location}: {first['msg']}" if location else first["msg"]
+    return text[:limit]
+
+
+# Published on room.<name>
+
+class RoomMessage(Envelope):
+    type: Literal["message"] = "message"
+    # Persistent message id, when the message is stored
+    id: Optional[int] = None
+    room: str
+    sender: Optional[str] = None
+    message: str
+    timestamp: Optional[float] = None
+    trace: Optional[Dict[str, Any]] = Field(None, alias="_trace")
+
+
+# ChatClient, on chat.<group> and chat.private.<id>
+
+class ChatEnvelope(Envelope):
+    type: Literal["message", "join", "leave", "private"]
+    sender: str
+    sender_id: Optional[str] = None
+    message: Optional[str] = None
+    timestamp: Optional[float] = None
+
+
+_chat_envelopes: TypeAdapter = TypeAdapter(ChatEnvelope)
+
+
+def parse_chat_envelope(raw: Union[str, bytes]) -> ChatEnvelope:
+    return _chat_envelopes.validate_json(raw)
@@ -0,0 +1,51 @@
+"""
+Time-ordered 64-bit message ids.
+
+    | 41 bits: milliseconds since ID_EPOCH | 10 bits: node | 12 bits: sequence |
+
+Ids from one node are strictly increasing; ids from different nodes are
+ordered by their millisecond timestamp, so "older than id X" is a plain
+integer comparison usable for keyset pagination.
+"""
+
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# 2024-01-01T00:00:00Z in milliseconds
+ID_EPOCH_MS = 1704067200000
+
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Set NODE_ID per node when running several; a random id is used otherwise
+NODE_ID = int(os.getenv("NODE_ID", random.randrange(1 << NODE_BITS))) & ((1 << NODE_BITS) - 1)
+
+_last_ms = 0
+_sequence = 0
+
+
+def next_message_id() -> int:
+    global _last_ms, _sequence
+    now = int(time.time() * 1000)
+    if now <= _last_ms:
+        # Same millisecond (or the clock stepped back): keep counting from the last one
+        now = _last_ms
+        _sequence = (_sequence + 1) & MAX_SEQUENCE
+        if _sequence == 0:
+            now += 1
+    else:
+        _sequence = 0
+    _last_ms = now
+    return ((now - ID_EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | (NODE_ID << SEQUENCE_BITS) | _sequence
+
+
+def id_timestamp(message_id: int) -> float:
+    """Unix time (seconds) at which an id was generated"""
+    return ((message_id >> (NODE_BITS + SEQUENCE_BITS)) + ID_EPOCH_MS) / 1000
@@ -0,0 +1,203 @@
+"""
+Logging setup and helpers for hot paths.
+
+configure_logging() gives the root logger a single QueueHandler: records are
+queued as they are by the calling thread, and their message and any
+traceback are formatted and written by a QueueListener thread, so neither
+formatting nor log I/O runs on the event loop. Arguments are therefore
+rendered after the call returns; log values, not objects that change later. When the queue is full,
+records are dropped and counted in chat_log_records_dropped_total rather
+than waited for. LOG_FORMAT=json writes one JSON object per line, including
+the fields passed with extra=; the default is plain text.
+
+Log calls use %-style arguments, so nothing is formatted for disabled
+levels. For events that happen per message or per connection:
+
+    sampled(logger, "ws.connections").info("Accepted %s", user)
+        logs the first and then every Nth call, N for the subsystem coming
+        from LOG_SAMPLE_RATES (e.g. "ws.connections=100,ws.messages=1000")
+    throttled(logger).error("Send failed: %s", e)
+        logs a message (keyed by its format string) at most once every
+        LOG_ERROR_INTERVAL seconds, reporting how many were suppressed
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.shared.metrics import Counter
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Root log level
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" or "json"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Comma-separated subsystem=N pairs: log 1 in N calls of sampled(logger, subsystem)
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+# Seconds between two logs of the same throttled message
+LOG_ERROR_INTERVAL = float(os.getenv("LOG_ERROR_INTERVAL", "10"))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+LOG_RECORDS_DROPPED = Counter("chat_log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_sample_rates(spec: str) -> Dict[str, int]:
+    rates = {}
+    for item in spec.split(","):
+        name, _, every = item.partition("=")
+        if name.strip() and every.strip():
+            rates[name.strip()] = max(1, int(every))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records instead of blocking or raising when the queue is full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare formats the message and traceback here so records
+        # can be pickled; the queue is in-process, so leave that to the listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None):
+    """Route all logging through a queue to a writer thread; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    records: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(records))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write the records still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class SampledLog:
+    """Logs the first and then every Nth call"""
+
+    def __init__(self, logger: logging.Logger, every: int):
+        self.logger = logger
+        self.every = every
+        self.calls = 0
+
+    def log(self, level: int, msg: str, *args, **kwargs):
+        self.calls += 1
+        if (self.calls - 1) % self.every or not self.logger.isEnabledFor(level):
+            return
+        if self.every > 1:
+            kwargs.setdefault("extra", {})["sample_every"] = self.every
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg: str, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg: str, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg: str, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+
+class ThrottledLog:
+    """Logs each message (by format string) at most once per interval"""
+
+    def __init__(self, logger: logging.Logger, interval: float):
+        self.logger = logger
+        self.interval = interval
+        # Format string -> [monotonic time of the next allowed log, calls suppressed since the last]
+        self.windows: Dict[str, List] = {}
+
+    def log(self, level: int, msg: str, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        window = self.windows.get(msg)
+        if window is not None and now < window[0]:
+            window[1] += 1
+            return
+        suppressed = window[1] if window is not None else 0
+        self.windows[msg] = [now + self.interval, 0]
+        if suppressed:
+            msg, args = msg + " (%d similar suppressed)", args + (suppressed,)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def warning(self, msg: str, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg: str, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+_sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+_sampled: Dict[Tuple[str, str], SampledLog] = {}
+_throttled: Dict[str, ThrottledLog] = {}
+
+
+def sampled(logger: logging.Logger, subsystem: str) -> SampledLog:
+    key = (logger.name, subsystem)
+    log = _sampled.get(key)
+    if log is None:
+        log = _sampled[key] = SampledLog(logger, _sample_rates.get(subsystem, 1))
+    return log
+
+
+def throttled(logger: logging.Logger) -> ThrottledLog:
+    log = _throttled.get(logger.name)
+    if log is None:
+        log = _throttled[logger.name] = ThrottledLog(logger, LOG_ERROR_INTERVAL)
+    return log
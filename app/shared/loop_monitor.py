@@ -0,0 +1,102 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+A task sleeps for LOOP_LAG_INTERVAL seconds at a time and records how late
+it wakes up in chat_event_loop_lag_seconds: anything above a few
+milliseconds is time during which no WebSocket on the worker was served.
+
+With LOOP_BLOCK_THRESHOLD set (seconds, 0 disables), a watchdog thread also
+watches the task's heartbeat. When the loop has not run it for longer than
+the threshold, the watchdog logs the stack of the loop's thread while it is
+still blocked, which points at the synchronous call (a database query, a
+subprocess, a file read) holding it up. Each stall is logged once.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from app.shared.metrics import Counter, Histogram
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds between lag samples
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+# Seconds the loop may be blocked before its stack is logged; 0 disables the watchdog
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0"))
+
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+EVENT_LOOP_LAG = Histogram("chat_event_loop_lag_seconds", "How late the event loop runs a scheduled wake-up",
+                           buckets=LOOP_LAG_BUCKETS)
+EVENT_LOOP_BLOCKS = Counter("chat_event_loop_blocks_total", "Stalls longer than LOOP_BLOCK_THRESHOLD")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, block_threshold: float = LOOP_BLOCK_THRESHOLD):
+        # Beat often enough that a stall of block_threshold stands out from the sleeps between beats
+        self.interval = min(interval, block_threshold / 2) if block_threshold > 0 else interval
+        self.block_threshold = block_threshold
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        self.loop_thread_id: Optional[int] = None
+        # time.monotonic() of the last time the loop ran the monitor
+        self.last_beat = time.monotonic()
+        self.blocks = 0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.loop_thread_id = threading.get_ident()
+            self.last_beat = time.monotonic()
+            self.task = asyncio.create_task(self.run())
+        if self.block_threshold > 0 and (self.watchdog is None or not self.watchdog.is_alive()):
+            self.stopped.clear()
+            self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self.watchdog.start()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+            self.last_beat = time.monotonic()
+
+    def _watch(self):
+        reported_beat = None
+        while not self.stopped.wait(self.block_threshold / 4):
+            beat = self.last_beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.block_threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            self.blocks += 1
+            EVENT_LOOP_BLOCKS.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no stack)\n"
+            logger.warning("Event loop blocked for over %.3fs, currently in:\n%s", stalled, stack)
+
+    async def close(self):
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.watchdog is not None:
+            self.watchdog.join()
+            self.watchdog = None
+
+
+loop_monitor = LoopMonitor()
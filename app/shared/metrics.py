@@ -0,0 +1,288 @@
+"""
+Minimal Prometheus-style metrics.
+
+Recording takes no lock: query timings are also recorded from worker
+threads (asyncio.to_thread, the message writer), so every thread adds to its
+own cell of a child and collection merges the cells. Label children are
+cached, so callers on hot paths should bind them once with .labels(...).
+"""
+
+import functools
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """A child holding the values of one label combination"""
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values):
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    def _unlabelled(self):
+        return self._children[()]
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._collect_child(key, child))
+        return lines
+
+    def _collect_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _ThreadCells:
+    """Per-thread accumulators; each cell is only ever written by the thread that owns it"""
+    __slots__ = ("local", "cells", "size")
+
+    def __init__(self, size: int):
+        self.local = threading.local()
+        self.cells: List[list] = []
+        self.size = size
+
+    def mine(self) -> list:
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = self.local.cell = [0] * self.size
+            self.cells.append(cell)
+            return cell
+
+    def merged(self) -> list:
+        totals = [0] * self.size
+        for cell in list(self.cells):
+            for index, value in enumerate(list(cell)):
+                totals[index] += value
+        return totals
+
+
+class _ValueChild:
+    __slots__ = ("cells", "offset")
+
+    def __init__(self):
+        self.cells = _ThreadCells(1)
+        self.offset = 0.0
+
+    def inc(self, amount: float = 1):
+        self.cells.mine()[0] += amount
+
+    def dec(self, amount: float = 1):
+        self.cells.mine()[0] -= amount
+
+    def set(self, value: float):
+        # Gauges that are set are not also changed from other threads
+        self.offset = value - self.cells.merged()[0]
+
+    @property
+    def value(self) -> float:
+        return self.offset + self.cells.merged()[0]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1):
+        self._unlabelled().inc(amount)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._unlabelled().dec(amount)
+
+    def set(self, value: float):
+        self._unlabelled().set(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "cells")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One count per bucket, then the sum
+        self.cells = _ThreadCells(len(bounds) + 2)
+
+    def observe(self, value: float):
+        cell = self.cells.mine()
+        cell[bisect_left(self.bounds, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Bucket counts, sum and count; the count is always the total of the buckets"""
+        merged = self.cells.merged()
+        counts = merged[:-1]
+        return counts, float(merged[-1]), sum(counts)
+
+    @property
+    def count(self) -> int:
+        return self.snapshot()[2]
+
+    @property
+    def sum(self) -> float:
+        return self.snapshot()[1]
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return _Timer(self._unlabelled())
+
+    def _collect_child(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        counts, total, observations = child.snapshot()
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {observations}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Shared application metrics
+WEBSOCKETS_ACTIVE = Gauge("chat_websockets_active", "Open WebSocket connections on this node")
+SUBSCRIPTIONS_ACTIVE = Gauge("chat_nats_subscriptions_active", "Active NATS room subscriptions on this node")
+ROOM_MESSAGES_IN = Counter("chat_room_messages_in_total", "Messages published to a room by clients on this node", ["room"])
+ROOM_MESSAGES_OUT = Counter("chat_room_messages_out_total", "Messages delivered to clients on this node", ["room"])
+FORWARD_LATENCY = Histogram("chat_forward_latency_seconds", "Time to forward a NATS message to a client")
+AUTH_REQUEST_LATENCY = Histogram("nats_auth_request_latency_seconds", "Auth callout handling time")
+AUTH_REQUESTS = Counter("nats_auth_requests_total", "Auth callout requests by outcome", ["outcome"])
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Query time by query-class method", ["query"])
+NATS_RECONNECTS = Counter("nats_reconnects_total", "NATS client reconnections", ["client"])
+
+
+def instrument_queries(cls=None, *, histogram: Histogram = None):
+    """
+    Class decorator timing every public method of a query class in
+    db_query_duration_seconds (or histogram, labelled by query), labelled
+    ClassName.method.
+    """
+    if cls is None:
+        return functools.partial(instrument_queries, histogram=histogram)
+    histogram = histogram if histogram is not None else DB_QUERY_LATENCY
+    for attr_name, attr in list(vars(cls).items()):
+        if attr_name.startswith("_") or not callable(attr):
+            continue
+        setattr(cls, attr_name, _timed(attr, histogram.labels(f"{cls.__name__}.{attr_name}")))
+    return cls
+
+
+def _timed(func, child):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            child.observe(time.perf_counter() - started)
+    return wrapper
@@ -0,0 +1,113 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# scrypt cost parameters; raising N makes every hash proportionally slower
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+# Upper bound on concurrent hash computations, so a login flood can't take every core
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+SCHEME = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=256 * n * r * p,
+        dklen=KEY_BYTES
+    )
+
+
+def hash_password_sync(password: str, n: int = None, r: int = None, p: int = None) -> str:
+    """
+    Hash a password with scrypt.
+
+    Returns:
+        str: Encoded hash in the form scrypt$n$r$p$salt$key
+    """
+    n = n or PASSWORD_SCRYPT_N
+    r = r or PASSWORD_SCRYPT_R
+    p = p or PASSWORD_SCRYPT_P
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return f"{SCHEME}${n}${r}${p}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def verify_password_sync(password: str, stored: str) -> bool:
+    """
+    Check a password against a stored hash. Passwords stored before hashing
+    was introduced are compared as plain text; see needs_rehash.
+    """
+    if not stored:
+        return False
+
+    if not stored.startswith(f"{SCHEME}$"):
+        return hmac.compare_digest(password.encode(), stored.encode())
+
+    try:
+        _, n, r, p, salt, key = stored.split("$")
+        expected = base64.b64decode(key)
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except Exception as e:
+        logger.error(f"Malformed password hash: {e}")
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+    Whether a stored hash is plain text or uses outdated cost parameters
+    """
+    if not stored or not stored.startswith(f"{SCHEME}$"):
+        return True
+    try:
+        _, n, r, p, _, _ = stored.split("$")
+    except ValueError:
+        return True
+    return (int(n), int(r), int(p)) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    # hashlib.scrypt releases the GIL, so a thread pool runs hashes in parallel
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _executor
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the bounded worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), hash_password_sync, password)
+
+
+async def verify_password(password: str, stored: str) -> bool:
+    """Verify a password on the bounded worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), verify_password_sync, password, stored)
@@ -0,0 +1,83 @@
+"""
+In-process token buckets.
+
+All calls happen on the event loop thread, so buckets are plain objects
+updated without locks. The number of buckets is capped: the least recently
+used one is dropped first, and as an idle bucket refills to its burst size,
+dropping it is indistinguishable from keeping it once it has been idle long
+enough.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = float(burst)
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float) -> float:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(float(burst), self.tokens + elapsed * rate)
+            self.updated = now
+        return self.tokens
+
+    def wait_time(self, rate: float, cost: float = 1) -> float:
+        """Seconds until cost tokens are available (0 if they are now)"""
+        missing = cost - self.tokens
+        return 0.0 if missing <= 0 else missing / rate
+
+    def take(self, cost: float = 1):
+        self.tokens -= cost
+
+
+class RateLimiter:
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def _bucket(self, key: Hashable, burst: float, now: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(burst, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def bucket(self, key: Hashable, rate: float, burst: float, now: Optional[float] = None) -> Optional[TokenBucket]:
+        """
+        The refilled bucket of key, None if rate <= 0 (unlimited). Take tokens
+        from the returned object: it stays valid even if a later lookup evicts
+        key from the limiter.
+        """
+        if rate <= 0:
+            return None
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(key, burst, now)
+        bucket.refill(rate, burst, now)
+        return bucket
+
+    def peek(self, key: Hashable, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Seconds until one token is available for key, without taking it; rate <= 0 means unlimited"""
+        bucket = self.bucket(key, rate, burst, now)
+        return 0.0 if bucket is None else bucket.wait_time(rate)
+
+    def acquire(self, key: Hashable, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Take one token if available; returns 0 on success, else seconds to wait"""
+        bucket = self.bucket(key, rate, burst, now)
+        if bucket is None:
+            return 0.0
+        wait = bucket.wait_time(rate)
+        if wait == 0:
+            bucket.take()
+        return wait
+
+    def __len__(self):
+        return len(self.buckets)
@@ -0,0 +1,95 @@
+"""
+JSON encoding for REST responses, WebSocket frames and NATS payloads.
+
+One serializer is picked at import: JSON_BACKEND names it (orjson, msgspec or
+json); by default the fastest installed one is used, orjson first, with the
+standard library as the fallback. Every backend writes compact UTF-8 JSON
+(no spaces after separators, non-ASCII characters unescaped), so output only
+differs between backends in float formatting.
+
+    dumps(obj) -> bytes         for NATS payloads and HTTP bodies
+    dumps_text(obj) -> str      for WebSocket text frames
+    loads(bytes or str)         for anything received
+
+JSONResponse is FastAPI's default response class for the app.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Callable, Tuple, Union
+
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse as BaseJSONResponse
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# orjson, msgspec or json; empty for the fastest one installed
+JSON_BACKEND = os.getenv("JSON_BACKEND", "")
+
+
+def _orjson() -> Tuple[Callable[[Any], bytes], Callable]:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        # Non-string keys (e.g. int room ids) are accepted like the standard library does
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    return dumps, orjson.loads
+
+
+def _msgspec() -> Tuple[Callable[[Any], bytes], Callable]:
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def loads(data):
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # Callers catch ValueError, as raised by the other backends
+            raise ValueError(str(e)) from e
+
+    return encoder.encode, loads
+
+
+def _stdlib() -> Tuple[Callable[[Any], bytes], Callable]:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    return dumps, json.loads
+
+
+_BACKENDS = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+
+def _select(name: str) -> Tuple[str, Callable[[Any], bytes], Callable]:
+    if name:
+        if name not in _BACKENDS:
+            raise ValueError(f"Unknown JSON_BACKEND {name!r}, expected one of {', '.join(_BACKENDS)}")
+        return (name, *_BACKENDS[name]())
+    for candidate in ("orjson", "msgspec"):
+        try:
+            return (candidate, *_BACKENDS[candidate]())
+        except ImportError:
+            continue
+    return ("json", *_stdlib())
+
+
+BACKEND, dumps, _loads = _select(JSON_BACKEND)
+
+
+def dumps_text(obj: Any) -> str:
+    return dumps(obj).decode()
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    return _loads(data)
+
+
+class JSONResponse(BaseJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,127 @@
+"""
+Content-hashed, precompressed static assets.
+
+scripts/build_static.py copies every file under app/static to
+app/static/dist/ with a content hash in its name (css/style.css ->
+dist/css/style.1a2b3c4d5e6f.css), writes gzip and brotli variants next to
+it when they are smaller, and records both in dist/manifest.json.
+
+Templates call asset_url("css/style.css"), which resolves the hashed name from
+the manifest (read once, when this module is imported) or falls back to the
+plain file when the build step has not been run. PrecompressedStaticFiles
+serves a hashed asset's variant for the client's Accept-Encoding and marks it
+immutable; plain files are revalidated with their ETag on every use.
+"""
+
+import json
+import logging
+import mimetypes
+import os
+from typing import Dict, List, Optional
+
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+STATIC_URL = "/static"
+DIST_DIR = "dist"
+MANIFEST_FILE = "manifest.json"
+
+# Preferred first when the client accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def load_manifest(static_dir: str = STATIC_DIR) -> Dict[str, Dict]:
+    """Source path -> {"path": hashed path under dist/, "encodings": [...]}; empty before a build"""
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error("Ignoring unreadable static manifest: %s", e)
+        return {}
+
+
+manifest = load_manifest()
+
+
+def asset_url(path: str) -> str:
+    """URL of a static asset, content-hashed when the assets have been built"""
+    path = path.lstrip("/")
+    entry = manifest.get(path)
+    if entry is None:
+        return f"{STATIC_URL}/{path}"
+    return f"{STATIC_URL}/{DIST_DIR}/{entry['path']}"
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """Encodings from an Accept-Encoding header with a non-zero q-value"""
+    accepted = []
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.append(name.strip().lower())
+    return accepted
+
+
+def negotiate(accept_encoding: str, available: List[str]) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    for encoding, _ in ENCODINGS:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles serving the precompressed variants and cache headers of built assets"""
+
+    def __init__(self, *, directory: str = STATIC_DIR, manifest: Optional[Dict[str, Dict]] = None, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        entries = load_manifest(directory) if manifest is None else manifest
+        # Path under the mount -> encodings it was precompressed with
+        self.variants = {f"{DIST_DIR}/{entry['path']}": entry.get("encodings", []) for entry in entries.values()}
+
+    async def get_response(self, path: str, scope: Scope):
+        path = path.replace(os.sep, "/")
+        encodings = self.variants.get(path)
+        if encodings is None:
+            response = await super().get_response(path, scope)
+            if response.status_code in (200, 304):
+                response.headers["Cache-Control"] = REVALIDATE
+            return response
+
+        headers = dict(scope["headers"])
+        encoding = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"), encodings)
+        if encoding is None:
+            response = await super().get_response(path, scope)
+        else:
+            response = await super().get_response(path + dict(ENCODINGS)[encoding], scope)
+            if response.status_code in (200, 304):
+                response.headers["Content-Encoding"] = encoding
+                if response.status_code == 200:
+                    response.headers["Content-Type"] = self._media_type(path)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE
+            if encodings:
+                response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    @staticmethod
+    def _media_type(path: str) -> str:
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type.endswith("javascript"):
+            media_type += "; charset=utf-8"
+        return media_type
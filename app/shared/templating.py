@@ -0,0 +1,91 @@
+"""
+The application's single Jinja2 environment and a cache for static pages.
+
+Every router renders through `templates`. Compiled templates are kept in
+memory and their bytecode in TEMPLATE_CACHE_DIR (a per-user temp directory
+by default), and precompile() compiles them all at startup, so no request
+parses a template.
+
+Pages whose output does not depend on the request are rendered once by
+pages.response(): the body and its ETag are cached, and a request with a
+matching If-None-Match gets a 304. With TEMPLATE_AUTO_RELOAD=true (for
+development) templates are reloaded when they change and pages are not cached.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from app.shared.static_assets import asset_url
+
+# Load environment variables from .env file
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+# Directory for compiled template bytecode; empty for a per-user temp directory
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "")
+# Check templates for changes on every render and skip the page cache
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "false").lower() == "true"
+
+
+def make_environment(directory: str = TEMPLATES_DIR, cache_dir: str = TEMPLATE_CACHE_DIR,
+                     auto_reload: bool = TEMPLATE_AUTO_RELOAD) -> Environment:
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(directory),
+        autoescape=select_autoescape(),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir or None),
+        auto_reload=auto_reload,
+        # Keep every compiled template in memory
+        cache_size=-1,
+    )
+    # Resolves content-hashed asset names from the build manifest
+    env.globals["asset_url"] = asset_url
+    return env
+
+
+def precompile(env: Environment) -> int:
+    """Compile every template now rather than on its first request"""
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+class PageCache:
+    """Rendered bodies and ETags of pages that are the same for every request"""
+
+    def __init__(self, templates: Jinja2Templates, enabled: bool = not TEMPLATE_AUTO_RELOAD):
+        self.templates = templates
+        self.enabled = enabled
+        self.pages: Dict[str, Tuple[bytes, str]] = {}
+
+    def render(self, name: str, context: Optional[Dict[str, Any]] = None) -> Tuple[bytes, str]:
+        page = self.pages.get(name)
+        if page is None:
+            body = self.templates.get_template(name).render(context or {}).encode()
+            page = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+            if self.enabled:
+                self.pages[name] = page
+        return page
+
+    def response(self, request: Request, name: str, context: Optional[Dict[str, Any]] = None) -> Response:
+        """The page as a response; context must be the same on every call for a name"""
+        body, etag = self.render(name, context)
+        # Revalidated on every use, as the page changes with the deployed assets
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="text/html", headers=headers)
+
+
+templates = Jinja2Templates(env=make_environment())
+pages = PageCache(templates)
@@ -0,0 +1,88 @@
+"""
+Optional end-to-end tracing of chat messages.
+
+A sampled message carries a small trace context under the "_trace" key of its
+JSON envelope. Each hop between the client's publish and the WebSocket send is
+timed into chat_trace_hop_seconds{hop=...} and written to the "app.trace" log:
+
+    receive   WebSocket frame received -> NATS publish started (origin node)
+    publish   nc.publish call (origin node)
+    nats      publish timestamp -> subscriber callback (wall clock, across nodes)
+    callback  subscriber callback started -> WebSocket send started
+    send      websocket.send_text call
+    total     publish timestamp -> WebSocket send finished
+"""
+
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.shared import serialization
+from app.shared.metrics import Histogram
+
+# Load environment variables
+load_dotenv()
+
+# Fraction of published messages that get a trace context (0 disables tracing)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+TRACE_FIELD = "_trace"
+# Cheap pre-check on raw payloads before paying for a JSON parse
+TRACE_MARKER = b'"_trace"'
+
+HOPS = ("receive", "publish", "nats", "callback", "send", "total")
+HOP_LATENCY = Histogram("chat_trace_hop_seconds", "Per-hop latency of traced messages", ["hop"])
+_hop_children = {hop: HOP_LATENCY.labels(hop) for hop in HOPS}
+
+trace_logger = logging.getLogger("app.trace")
+
+
+def start_trace(origin: str, force: bool = False) -> Optional[Dict]:
+    """
+    Start a trace for a message about to be published, or return None if the
+    message is not sampled. force=True always traces (debug clients).
+    """
+    if not force and (TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE):
+        return None
+    return {"id": uuid.uuid4().hex[:16], "origin": origin, "hops": {}}
+
+
+def mark_sent(ctx: Dict):
+    """Stamp the wall-clock publish time, right before the envelope is serialized"""
+    ctx["sent"] = time.time()
+
+
+def record(ctx: Dict, stage: str, hops: Dict[str, float]):
+    """Observe hop timings and write the sampled trace log entry"""
+    for hop, seconds in hops.items():
+        child = _hop_children.get(hop)
+        if child is not None:
+            child.observe(seconds)
+
+    if trace_logger.isEnabledFor(logging.INFO):
+        trace_logger.info(serialization.dumps_text({
+            "trace_id": ctx.get("id"),
+            "origin": ctx.get("origin"),
+            "stage": stage,
+            "hops_ms": {hop: round(seconds * 1000, 3) for hop, seconds in {**ctx.get("hops", {}), **hops}.items()},
+        }))
+
+
+def extract(payload: bytes):
+    """
+    Return (envelope, trace context) for a traced payload, or (None, None)
+    when the payload carries no trace.
+    """
+    if TRACE_MARKER not in payload:
+        return None, None
+    try:
+        envelope = serialization.loads(payload)
+    except ValueError:
+        return None, None
+    ctx = envelope.get(TRACE_FIELD) if isinstance(envelope, dict) else None
+    return (envelope, ctx) if isinstance(ctx, dict) else (None, None)
@@ -3,6 +3,12 @@ class SSEHandler {
         this.onMessageCallback = options.onMessage || this.defaultMessageHandler;
         this.onConnectCallback = options.onConnect || (() => console.log('SSE connected'));
         this.onErrorCallback = options.onError || ((error) => console.error('SSE error:', error));
+        // Called with the rooms whose history may have been missed while disconnected
+        this.onGapCallback = options.onGap || ((rooms) => console.warn('SSE missed messages in rooms:', rooms));
+        // Called once per room on a fresh connection with its recent messages, oldest first
+        this.onHistoryCallback = options.onHistory || ((room, messages) => messages.forEach((message) => this.handleMessage(message)));
+        this.token = options.token || null;
+        this.lastEventId = null;
         this.autoReconnect = options.autoReconnect !== false;
         this.reconnectInterval = options.reconnectInterval || 5000;
         this.maxReconnectAttempts = options.maxReconnectAttempts || 10;
@@ -17,7 +23,17 @@ class SSEHandler {
         }
         
         try {
-            this.eventSource = new EventSource('/sse');
+            // EventSource cannot send headers, so the token and the resume position travel
+            // in the query string (a new EventSource does not send Last-Event-ID by itself).
+            const params = new URLSearchParams();
+            if (this.token) {
+                params.set('token', this.token);
+            }
+            if (this.lastEventId) {
+                params.set('last_event_id', this.lastEventId);
+            }
+            const query = params.toString();
+            this.eventSource = new EventSource(query ? `/sse?${query}` : '/sse');
             
             this.eventSource.onopen = () => {
                 console.log('SSE connection established');
@@ -26,6 +42,7 @@ class SSEHandler {
             };
             
             this.eventSource.onmessage = (event) => {
+                this.lastEventId = event.lastEventId || this.lastEventId;
                 try {
                     const data = JSON.parse(event.data);
                     this.handleMessage(data);
@@ -34,6 +51,23 @@ class SSEHandler {
                 }
             };
             
+            this.eventSource.addEventListener('gap', (event) => {
+                try {
+                    this.onGapCallback(JSON.parse(event.data).rooms);
+                } catch (error) {
+                    console.error('Error parsing SSE gap event:', error);
+                }
+            });
+            
+            this.eventSource.addEventListener('history', (event) => {
+                try {
+                    const data = JSON.parse(event.data);
+                    this.onHistoryCallback(data.room, data.messages);
+                } catch (error) {
+                    console.error('Error parsing SSE history event:', error);
+                }
+            });
+            
             this.eventSource.onerror = (error) => {
                 this.onErrorCallback(error);
                 
@@ -1,8 +1,8 @@
 import base64
-import json
-
 import nkeys
 
+from app.shared import serialization
+
 
 def verify_jwt_and_seed(user_jwt, user_seed):
     try:
@@ -15,7 +15,7 @@ def verify_jwt_and_seed(user_jwt, user_seed):
         # Add padding if needed
         padding = '=' * (4 - len(payload_b64) % 4) if len(payload_b64) % 4 != 0 else ''
         payload_json = base64.urlsafe_b64decode(payload_b64 + padding).decode('utf-8')
-        payload = json.loads(payload_json)
+        payload = serialization.loads(payload_json)
         
         # Lấy subject (khóa công khai của user)
         if 'sub' not in payload:
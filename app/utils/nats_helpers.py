@@ -6,6 +6,24 @@ import tempfile
 
 logger = logging.getLogger(__name__)
 
+def decode_jwt_payload(jwt: str) -> dict:
+    """
+    Decode the (unverified) payload section of a NATS JWT
+
+    Args:
+        jwt: The NATS JWT
+
+    Returns:
+        dict: The decoded claims
+    """
+    jwt_parts = jwt.split('.')
+    if len(jwt_parts) < 2:
+        raise ValueError("Invalid JWT format")
+
+    # Add padding if needed for base64 decoding
+    padded = jwt_parts[1] + '=' * (-len(jwt_parts[1]) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))
+
 def extract_jwt_and_nkeys_seed_from_file(creds_file: str):
     try:
         # Expand the tilde in the path to the user's home directory
@@ -39,16 +57,12 @@ def extract_jwt_and_nkeys_seed_from_file(creds_file: str):
         seed = content[seed_start:seed_end].strip()
         
         # Extract public key and account public key from JWT
-        jwt_parts = jwt.split('.')
-        if len(jwt_parts) < 2:
+        if len(jwt.split('.')) < 2:
             logger.error(f"Invalid JWT format in credentials file: {expanded_path}")
             return jwt, seed, None, None
             
         try:
-            # Add padding if needed for base64 decoding
-            padded = jwt_parts[1] + '=' * (-len(jwt_parts[1]) % 4)
-            payload = base64.urlsafe_b64decode(padded)
-            jwt_data = json.loads(payload)
+            jwt_data = decode_jwt_payload(jwt)
                 
             # Extract public key (sub field in JWT)
             public_key = jwt_data.get('sub')
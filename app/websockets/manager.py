@@ -2,7 +2,9 @@ from fastapi import WebSocket, WebSocketDisconnect, status
 from typing import List, Dict, Any
 import logging
 import asyncio
-import traceback
+
+from app.shared import serialization
+from app.shared.log import sampled, throttled
 
 logger = logging.getLogger(__name__)
 
@@ -12,19 +14,18 @@ class ConnectionManager:
 
     async def connect(self, websocket: WebSocket):
         self.active_connections.append(websocket)
-        logger.info(f"New connection added. Total connections: {len(self.active_connections)}")
+        sampled(logger, "ws.connections").info("New connection added. Total connections: %d", len(self.active_connections))
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
-            logger.info(f"Connection removed. Total connections: {len(self.active_connections)}")
+            sampled(logger, "ws.connections").info("Connection removed. Total connections: %d", len(self.active_connections))
 
     async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
         try:
-            await websocket.send_json(message)
+            await websocket.send_text(serialization.dumps_text(message))
         except Exception as e:
-            logger.error(f"Error sending personal message: {str(e)}")
-            logger.error(traceback.format_exc())
+            throttled(logger).error("Error sending personal message: %s", e, exc_info=True)
             self.disconnect(websocket)
 
     async def broadcast(self, message: Dict[str, Any]):
@@ -49,10 +50,10 @@ class ConnectionManager:
                                  disconnected_websockets: List[WebSocket]):
         """Helper method to send a message to a single connection."""
         try:
-            await connection.send_json(message)
+            await connection.send_text(serialization.dumps_text(message))
         except Exception as e:
-            logger.error(f"Error during broadcast to a connection: {str(e)}")
-            logger.error(traceback.format_exc())
+            # One failing socket per broadcast is common; its traceback is only worth logging once in a while
+            throttled(logger).error("Error during broadcast to a connection: %s", e, exc_info=True)
             disconnected_websockets.append(connection)
 
     async def send_to_connections(self, message: Dict[str, Any], connections: List[WebSocket]):
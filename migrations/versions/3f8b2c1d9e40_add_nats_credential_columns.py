@@ -0,0 +1,40 @@
+"""add_nats_credential_columns
+
+Revision ID: 3f8b2c1d9e40
+Revises: 7a71e5786c6d
+Create Date: 2026-10-19 09:12:41.203118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8b2c1d9e40'
+down_revision: Union[str, None] = '7a71e5786c6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('users')]
+
+    # Store the parsed credentials so login never has to read .creds files
+    if 'nats_jwt' not in columns:
+        op.add_column('users', sa.Column('nats_jwt', sa.Text(), nullable=True))
+    if 'nats_public_key' not in columns:
+        op.add_column('users', sa.Column('nats_public_key', sa.String(length=100), nullable=True))
+    if 'nats_account_public_key' not in columns:
+        op.add_column('users', sa.Column('nats_account_public_key', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'nats_account_public_key')
+    op.drop_column('users', 'nats_public_key')
+    op.drop_column('users', 'nats_jwt')
@@ -0,0 +1,43 @@
+"""add_room_message_columns
+
+Revision ID: 5c9d2e7f1a83
+Revises: 3f8b2c1d9e40
+Create Date: 2026-10-19 11:02:17.448213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c9d2e7f1a83'
+down_revision: Union[str, None] = '3f8b2c1d9e40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('messages')]
+
+    # Room messages are persisted with the id they were published under
+    if 'room_id' not in columns:
+        op.add_column('messages', sa.Column('room_id', sa.Integer(), nullable=True))
+        op.create_foreign_key('fk_messages_room_id', 'messages', 'nats_rooms', ['room_id'], ['id'])
+    if 'uid' not in columns:
+        op.add_column('messages', sa.Column('uid', sa.BigInteger(), nullable=True))
+        op.create_unique_constraint('uq_messages_uid', 'messages', ['uid'])
+    op.create_index('ix_messages_room_id_uid', 'messages', ['room_id', 'uid'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_room_id_uid', table_name='messages')
+    op.drop_constraint('uq_messages_uid', 'messages', type_='unique')
+    op.drop_column('messages', 'uid')
+    op.drop_constraint('fk_messages_room_id', 'messages', type_='foreignkey')
+    op.drop_column('messages', 'room_id')
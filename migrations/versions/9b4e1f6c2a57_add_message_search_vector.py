@@ -0,0 +1,76 @@
+"""add_message_search_vector
+
+Revision ID: 9b4e1f6c2a57
+Revises: 5c9d2e7f1a83
+Create Date: 2026-10-19 13:40:05.917362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4e1f6c2a57'
+down_revision: Union[str, None] = '5c9d2e7f1a83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Messages updated per backfill transaction
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('messages')]
+
+    # A nullable column without a default is a catalog change: the ACCESS
+    # EXCLUSIVE lock is only held for an instant and the table is not rewritten
+    # (a GENERATED ... STORED column would rewrite it under that lock)
+    if 'search_vector' not in columns:
+        op.execute("ALTER TABLE messages ADD COLUMN search_vector tsvector")
+
+    # New and edited messages get their vector from a trigger
+    op.execute("""
+        CREATE OR REPLACE FUNCTION messages_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := to_tsvector('english', coalesce(NEW.content, ''));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS messages_search_vector_update ON messages")
+    op.execute(
+        "CREATE TRIGGER messages_search_vector_update BEFORE INSERT OR UPDATE OF content ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update()"
+    )
+
+    with op.get_context().autocommit_block():
+        # The block switches the context to an autocommit connection; use that one
+        connection = op.get_bind()
+        # Existing messages are filled in by id range, one short transaction per
+        # batch, so only the rows of the current batch are locked at a time
+        max_id = connection.execute(sa.text("SELECT max(id) FROM messages")).scalar() or 0
+        for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            connection.execute(sa.text(
+                "UPDATE messages SET search_vector = to_tsvector('english', coalesce(content, '')) "
+                "WHERE id >= :start AND id < :end AND search_vector IS NULL"
+            ), {"start": start, "end": start + BACKFILL_BATCH_SIZE})
+
+        # Build the index without blocking message inserts
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_search_vector "
+            "ON messages USING gin (search_vector)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_search_vector', table_name='messages')
+    op.execute("DROP TRIGGER IF EXISTS messages_search_vector_update ON messages")
+    op.execute("DROP FUNCTION IF EXISTS messages_search_vector_update()")
+    op.drop_column('messages', 'search_vector')
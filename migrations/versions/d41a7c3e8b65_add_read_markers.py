@@ -0,0 +1,72 @@
+"""add_read_markers
+
+Revision ID: d41a7c3e8b65
+Revises: 9b4e1f6c2a57
+Create Date: 2026-10-19 15:21:48.660391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a7c3e8b65'
+down_revision: Union[str, None] = '9b4e1f6c2a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+
+    message_columns = [col['name'] for col in inspector.get_columns('messages')]
+    if 'seq' not in message_columns:
+        op.add_column('messages', sa.Column('seq', sa.BigInteger(), nullable=True))
+
+    room_columns = [col['name'] for col in inspector.get_columns('nats_rooms')]
+    if 'message_count' not in room_columns:
+        op.add_column('nats_rooms', sa.Column('message_count', sa.BigInteger(), nullable=False, server_default='0'))
+    if 'last_message_uid' not in room_columns:
+        op.add_column('nats_rooms', sa.Column('last_message_uid', sa.BigInteger(), nullable=True))
+
+    member_columns = [col['name'] for col in inspector.get_columns('nats_user_rooms')]
+    if 'last_read_uid' not in member_columns:
+        op.add_column('nats_user_rooms', sa.Column('last_read_uid', sa.BigInteger(), nullable=True))
+    if 'last_read_seq' not in member_columns:
+        op.add_column('nats_user_rooms', sa.Column('last_read_seq', sa.BigInteger(), nullable=False, server_default='0'))
+
+    # Number existing room messages and start every member's marker at the end,
+    # so the upgrade does not turn the whole history unread
+    op.execute("""
+        UPDATE messages m SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY room_id ORDER BY uid) AS seq
+            FROM messages WHERE room_id IS NOT NULL
+        ) numbered
+        WHERE m.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE nats_rooms r SET message_count = counts.total, last_message_uid = counts.last_uid
+        FROM (
+            SELECT room_id, count(*) AS total, max(uid) AS last_uid
+            FROM messages WHERE room_id IS NOT NULL GROUP BY room_id
+        ) counts
+        WHERE r.id = counts.room_id
+    """)
+    op.execute("""
+        UPDATE nats_user_rooms ur SET last_read_seq = r.message_count, last_read_uid = r.last_message_uid
+        FROM nats_rooms r WHERE r.id = ur.room_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('nats_user_rooms', 'last_read_seq')
+    op.drop_column('nats_user_rooms', 'last_read_uid')
+    op.drop_column('nats_rooms', 'last_message_uid')
+    op.drop_column('nats_rooms', 'message_count')
+    op.drop_column('messages', 'seq')
@@ -0,0 +1,43 @@
+"""add_account_publish_limits
+
+Revision ID: e8f3b6a1d902
+Revises: d41a7c3e8b65
+Create Date: 2026-10-19 16:58:12.035714
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8f3b6a1d902'
+down_revision: Union[str, None] = 'd41a7c3e8b65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('nats_accounts')]
+
+    # NULL keeps the PUBLISH_* defaults from the environment
+    if 'user_publish_rate' not in columns:
+        op.add_column('nats_accounts', sa.Column('user_publish_rate', sa.Float(), nullable=True))
+    if 'user_publish_burst' not in columns:
+        op.add_column('nats_accounts', sa.Column('user_publish_burst', sa.Integer(), nullable=True))
+    if 'room_publish_rate' not in columns:
+        op.add_column('nats_accounts', sa.Column('room_publish_rate', sa.Float(), nullable=True))
+    if 'room_publish_burst' not in columns:
+        op.add_column('nats_accounts', sa.Column('room_publish_burst', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('nats_accounts', 'room_publish_burst')
+    op.drop_column('nats_accounts', 'room_publish_rate')
+    op.drop_column('nats_accounts', 'user_publish_burst')
+    op.drop_column('nats_accounts', 'user_publish_rate')
@@ -0,0 +1,100 @@
+"""
+Benchmark ChatClient publish throughput: send_message per message versus
+send_many with pre-built envelope templates and periodic flushes.
+
+Each mode publishes --messages messages to one group (with the client-side
+send limit disabled) and waits for the server to acknowledge them with a final
+flush. A subscriber on the same connection counts deliveries so both modes do
+the same work end to end.
+
+Usage:
+    python scripts/bench/chat_client_publish.py --nats-url inproc:// --messages 100000
+    python scripts/bench/chat_client_publish.py --nats-url nats://127.0.0.1:4222 --flush-every 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Add the repository root to the path to allow importing from app
+sys.path.append(REPO_ROOT)
+
+from app.nats.client import ChatClient
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_mode(mode, args):
+    client = ChatClient(server_url=args.nats_url, username=f"bench-{mode}")
+    await client.connect()
+    await client.join_group("bench")
+    expected = args.messages
+    delivered = asyncio.Event()
+    count = 0
+
+    async def on_message(msg):
+        nonlocal count
+        count += 1
+        if count == expected:
+            delivered.set()
+
+    await client.nc.subscribe("chat.bench", cb=on_message)
+    texts = [f"message {i} " + "x" * args.size for i in range(args.messages)]
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    if mode == "send_message":
+        for text in texts:
+            await client.send_message("bench", text)
+        await client.flush()
+    else:
+        await client.send_many("bench", texts, flush_every=args.flush_every)
+    published = time.perf_counter() - started
+    await asyncio.wait_for(delivered.wait(), args.timeout)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    await client.close()
+
+    return {
+        "mode": mode,
+        "publish_s": round(published, 3),
+        "publish_per_s": round(args.messages / published, 1),
+        "delivered_s": round(elapsed, 3),
+        "delivered_per_s": round(args.messages / elapsed, 1),
+        "cpu_us_per_message": round(cpu / args.messages * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nats-url", default="inproc://", help="inproc:// (default) or a NATS server URL")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--size", type=int, default=64, help="Padding characters per message")
+    parser.add_argument("--flush-every", type=int, default=1000, help="send_many: messages between flushes")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    results = [asyncio.run(run_mode(mode, args)) for mode in ("send_message", "send_many")]
+    print(json.dumps({
+        "commit": git_commit(),
+        "nats_url": args.nats_url,
+        "messages": args.messages,
+        "size": args.size,
+        "flush_every": args.flush_every,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
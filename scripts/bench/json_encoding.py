@@ -0,0 +1,130 @@
+"""
+Micro-benchmark JSON encoding and decoding of the app's real payload shapes
+with each available serializer backend.
+
+Shapes:
+    message     client message as published to a room (type, id, room, sender, text)
+    traced      the same with a trace context, as sent to trace_debug clients
+    presence    full presence state a node publishes (50 rooms x 20 users)
+    history     a 50-message history page as returned by GET /rooms/{room}/history
+    auth        an auth callout request from the NATS server (decoded only)
+
+"stdlib" is json.dumps/json.loads with default arguments, as the app used
+before the serializer layer; the others go through app.shared.serialization.
+Results are microseconds per operation (best of --repeat), as JSON tagged
+with the commit.
+
+Usage:
+    python scripts/bench/json_encoding.py --number 20000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Add the repository root to the path to allow importing from app
+sys.path.append(REPO_ROOT)
+
+from app.shared.serialization import _BACKENDS
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def message_envelope(i):
+    return {
+        "type": "message",
+        "message": f"Message number {i}, with a bit of text to make it look like chat",
+        "id": 7234567890123456 + i,
+        "room": "general",
+        "sender": "alice",
+    }
+
+
+def shapes():
+    traced = message_envelope(1)
+    traced["_trace"] = {
+        "id": "4f1c2a9b8d7e6f50", "origin": "ws", "sent": 1760000000.123456,
+        "hops": {"receive": 0.000213, "publish": 0.000051, "nats": 0.000412, "callback": 0.000034},
+    }
+    presence = {
+        "node": "a1b2c3d4", "full": True,
+        "rooms": {f"room-{r}": [f"user-{r}-{u}" for u in range(20)] for r in range(50)},
+    }
+    history = {
+        "room": "general",
+        "history": [{**message_envelope(i), "timestamp": 1760000000.0 + i} for i in range(50)],
+        "has_more": True,
+    }
+    auth = {
+        "type": "authorization_request",
+        "nats": {
+            "server_id": {"name": "chat-nats", "host": "0.0.0.0", "id": "NCHAT" + "X" * 51, "version": "2.10.22"},
+            "user_nkey": "U" + "A" * 55,
+            "client_info": {"host": "10.0.0.12", "id": 42, "user": "alice;general;random", "kind": "Client", "type": "nats"},
+            "connect_opts": {
+                "auth_token": json.dumps({"user": "alice", "timestamp": 1760000000, "signature": "s" * 88}),
+                "user": "alice;general;random", "lang": "python3", "version": "2.9.0", "protocol": 1,
+            },
+            "client_ip": "10.0.0.12",
+        },
+    }
+    return {"message": message_envelope(0), "traced": traced, "presence": presence, "history": history, "auth": auth}
+
+
+def backends():
+    available = {"stdlib": (lambda obj: json.dumps(obj).encode(), json.loads)}
+    for name, factory in _BACKENDS.items():
+        try:
+            _, dumps, loads = (name, *factory())
+        except ImportError:
+            continue
+        available[name] = (dumps, loads)
+    return available
+
+
+def per_op_us(func, arg, number, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func(arg)
+        best = min(best, time.perf_counter() - started)
+    return round(best / number * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="Operations per timing run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for shape, obj in shapes().items():
+        encoded = json.dumps(obj).encode()
+        results[shape] = {"bytes": len(encoded)}
+        for name, (dumps, loads) in backends().items():
+            entry = {"decode_us": per_op_us(loads, encoded, args.number, args.repeat)}
+            if shape != "auth":
+                entry["encode_us"] = per_op_us(dumps, obj, args.number, args.repeat)
+            results[shape][name] = entry
+
+    print(json.dumps({
+        "commit": git_commit(),
+        "number": args.number,
+        "repeat": args.repeat,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
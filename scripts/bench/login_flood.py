@@ -0,0 +1,106 @@
+"""
+Benchmark login latency and WebSocket delivery latency under a concurrent login flood.
+
+A delivery ticker stands in for the WebSocket fan-out: it expects to run every
+--tick-ms milliseconds and records how late each tick fires. Meanwhile
+--logins password verifications run with --concurrency in flight, either
+inline on the event loop (the old behaviour) or on the bounded hashing pool.
+
+Usage:
+    python scripts/bench/login_flood.py --mode both --logins 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Add the repository root to the path to allow importing from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.shared import passwords
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+async def delivery_ticker(interval, stop, lateness):
+    expected = time.perf_counter() + interval
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, expected - time.perf_counter()))
+        now = time.perf_counter()
+        lateness.append(max(0.0, now - expected))
+        expected = now + interval
+
+
+async def run_flood(mode, logins, concurrency, tick_ms):
+    stored = passwords.hash_password_sync("correct horse battery staple")
+    semaphore = asyncio.Semaphore(concurrency)
+    login_latency = []
+    lateness = []
+    stop = asyncio.Event()
+
+    async def login():
+        # Latency includes time spent queued behind other logins
+        started = time.perf_counter()
+        async with semaphore:
+            if mode == "inline":
+                ok = passwords.verify_password_sync("correct horse battery staple", stored)
+            else:
+                ok = await passwords.verify_password("correct horse battery staple", stored)
+            assert ok
+            login_latency.append(time.perf_counter() - started)
+            # Yield like a real request handler would between awaits
+            await asyncio.sleep(0)
+
+    ticker = asyncio.create_task(delivery_ticker(tick_ms / 1000, stop, lateness))
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    return {
+        "mode": mode,
+        "logins": logins,
+        "concurrency": concurrency,
+        "workers": passwords.PASSWORD_HASH_WORKERS,
+        "scrypt": {"n": passwords.PASSWORD_SCRYPT_N, "r": passwords.PASSWORD_SCRYPT_R, "p": passwords.PASSWORD_SCRYPT_P},
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_s": round(logins / elapsed, 1),
+        "login_latency": summarize(login_latency),
+        "delivery_lateness": summarize(lateness),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inline", "pool", "both"), default="both")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tick-ms", type=float, default=5.0, help="Expected delivery interval")
+    args = parser.parse_args()
+
+    modes = ("inline", "pool") if args.mode == "both" else (args.mode,)
+    results = [asyncio.run(run_flood(mode, args.logins, args.concurrency, args.tick_ms)) for mode in modes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark full-text message search over a large seeded messages table.
+
+Seeding runs server-side (INSERT ... SELECT generate_series) in chunks, into
+--rooms rooms of a "bench" account. Words follow a Zipf-like distribution
+over a vocabulary of common English words followed by synthetic topic words,
+so queries can be picked by how many rows they match. Rebuilding the GIN
+index after the load (--rebuild-index) is much faster than maintaining it row
+by row.
+
+The query phase calls MessageQueries.search_room_messages, as the
+/search_messages endpoint does, for a user belonging to --member-rooms rooms,
+and reports p50/p99 latency per query class.
+
+Usage (against a migrated database, see POSTGRES_* in .env):
+    python scripts/bench/search_bench.py seed --rows 50000000 --rebuild-index
+    python scripts/bench/search_bench.py query --member-rooms 20 --runs 50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Add the repository root to the path to allow importing from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import text
+
+from app.database.db import SessionLocal, engine
+from app.querries.message_querries import MessageQueries
+from app.shared.ids import ID_EPOCH_MS, NODE_BITS, SEQUENCE_BITS
+
+BENCH_ACCOUNT = "bench"
+BENCH_ROOM_PREFIX = "bench-room-"
+
+COMMON_WORDS = (
+    "hello thanks meeting today tomorrow deploy release build review merge branch issue ticket "
+    "customer support question answer update status server database cache latency error warning "
+    "coffee lunch weekend holiday project design document schedule call team sprint demo plan "
+    "test failing passing green red urgent later please check link fixed broken config migration"
+).split()
+
+
+def vocabulary(size):
+    words = list(COMMON_WORDS)
+    words.extend(f"topic{i}" for i in range(size - len(words)))
+    return words
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def ensure_rooms(conn, count):
+    account_id = conn.execute(text("SELECT id FROM nats_accounts WHERE name = :name"), {"name": BENCH_ACCOUNT}).scalar()
+    if account_id is None:
+        account_id = conn.execute(
+            text("INSERT INTO nats_accounts (name, public_key) VALUES (:name, 'ABENCH') RETURNING id"),
+            {"name": BENCH_ACCOUNT},
+        ).scalar()
+    conn.execute(text(
+        "INSERT INTO nats_rooms (name, subject_prefix, account_id, is_public) "
+        "SELECT :prefix || g, 'room', :account_id, false FROM generate_series(1, :count) g "
+        "ON CONFLICT (name) DO NOTHING"
+    ), {"prefix": BENCH_ROOM_PREFIX, "account_id": account_id, "count": count})
+    rows = conn.execute(
+        text("SELECT id FROM nats_rooms WHERE name LIKE :pattern ORDER BY id"),
+        {"pattern": BENCH_ROOM_PREFIX + "%"},
+    ).all()
+    return [row.id for row in rows][:count]
+
+
+def seed(args):
+    words = vocabulary(args.vocabulary)
+    # Ids far in the past so they never collide with live traffic
+    base_uid = ((int(time.time() * 1000) - 400 * 86400 * 1000 - ID_EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS))
+
+    with engine.begin() as conn:
+        room_ids = ensure_rooms(conn, args.rooms)
+        start = conn.execute(text("SELECT count(*) FROM messages WHERE room_id = ANY(:ids)"), {"ids": room_ids}).scalar()
+        if args.rebuild_index:
+            conn.execute(text("DROP INDEX IF EXISTS ix_messages_search_vector"))
+
+    insert = text(
+        "INSERT INTO messages (content, room_id, uid, created_at) "
+        "SELECT array_to_string(ARRAY("
+        "    SELECT (:words)[ceil(exp(random() * ln(:vocab)))::int]"
+        "    FROM generate_series(1, 6 + (g % 15))"
+        "), ' '), "
+        "(:room_ids)[1 + (g % :room_count)], "
+        ":base_uid + g, "
+        "now() - make_interval(secs => (:total - g) * 0.5) "
+        "FROM generate_series(:first, :last) g"
+    )
+    started = time.perf_counter()
+    for first in range(start + 1, args.rows + 1, args.chunk):
+        last = min(args.rows, first + args.chunk - 1)
+        with engine.begin() as conn:
+            conn.execute(insert, {
+                "words": words, "vocab": len(words), "room_ids": room_ids, "room_count": len(room_ids),
+                "base_uid": base_uid, "total": args.rows, "first": first, "last": last,
+            })
+        elapsed = time.perf_counter() - started
+        print(f"seeded {last}/{args.rows} rows ({(last - start) / elapsed:,.0f} rows/s)", file=sys.stderr)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if args.rebuild_index:
+            print("building ix_messages_search_vector", file=sys.stderr)
+            conn.execute(text("SET maintenance_work_mem = '1GB'"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING gin (search_vector)"))
+        conn.execute(text("VACUUM ANALYZE messages"))
+    print(json.dumps({"rows": args.rows, "rooms": len(room_ids), "seconds": round(time.perf_counter() - started, 1)}))
+
+
+def query(args):
+    words = vocabulary(args.vocabulary)
+    queries = {
+        "common_word": [words[i] for i in range(5)],
+        "mid_word": [words[i] for i in range(100, 110)],
+        "rare_word": [words[i] for i in range(len(words) - 10, len(words))],
+        "two_words": [f"{words[i]} {words[i + 1]}" for i in range(20, 30)],
+        "phrase": [f'"{words[i]} {words[i + 1]}"' for i in range(0, 10)],
+    }
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            text("SELECT id FROM nats_rooms WHERE name LIKE :pattern ORDER BY id LIMIT :n"),
+            {"pattern": BENCH_ROOM_PREFIX + "%", "n": args.member_rooms},
+        ).all()
+        room_ids = [row.id for row in rows]
+        if not room_ids:
+            sys.exit("No bench rooms found, run the seed command first")
+        message_queries = MessageQueries(db)
+
+        results = {}
+        for name, terms in queries.items():
+            # Warm the cache once per term so runs measure steady state
+            for term in terms:
+                message_queries.search_room_messages(room_ids, term, args.limit)
+            samples = []
+            matched = 0
+            for _ in range(args.runs):
+                term = random.choice(terms)
+                started = time.perf_counter()
+                matched += len(message_queries.search_room_messages(room_ids, term, args.limit))
+                samples.append(time.perf_counter() - started)
+            results[name] = {**summarize(samples), "avg_results": round(matched / args.runs, 1)}
+
+        total = db.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'messages'")).scalar()
+    finally:
+        db.close()
+
+    print(json.dumps({
+        "messages_estimate": total,
+        "member_rooms": len(room_ids),
+        "limit": args.limit,
+        "queries": results,
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vocabulary", type=int, default=20000, help="Distinct words in seeded messages")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed")
+    seed_parser.add_argument("--rows", type=int, default=50_000_000)
+    seed_parser.add_argument("--rooms", type=int, default=1000)
+    seed_parser.add_argument("--chunk", type=int, default=1_000_000, help="Rows per INSERT transaction")
+    seed_parser.add_argument("--rebuild-index", action="store_true", help="Drop the GIN index during the load")
+
+    query_parser = commands.add_parser("query")
+    query_parser.add_argument("--member-rooms", type=int, default=20, help="Rooms the searching user belongs to")
+    query_parser.add_argument("--runs", type=int, default=50)
+    query_parser.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed(args)
+    else:
+        query(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark application cold start: import time of app.main and time until a
+uvicorn worker answers HTTP.
+
+Each run starts a fresh interpreter, so nothing is cached in memory (Python's
+bytecode cache on disk is, as on a real deploy after the first start):
+
+    import   python -c "import app.main", timed inside the child
+    ready    uvicorn app.main:app started -> first response to --path
+
+The slowest modules of the last import run come from python -X importtime
+(cumulative microseconds). Results are JSON tagged with the commit.
+
+Usage:
+    python scripts/bench/startup_time.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_output, count):
+    modules = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative), name.rstrip()))
+    modules.sort(reverse=True)
+    return [{"module": name.strip(), "cumulative_ms": round(us / 1000, 1)} for us, name in modules[:count]]
+
+
+def time_ready(path, timeout):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline:
+            if server.poll() is not None:
+                sys.exit(f"uvicorn exited with code {server.returncode}:\n{server.stderr.read().decode()}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1):
+                    return time.perf_counter() - started
+            except urllib.error.HTTPError:
+                # Any HTTP answer means the app is serving
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        sys.exit(f"No answer on {path} within {timeout}s")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/metrics", help="Endpoint polled until the app answers")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to report")
+    args = parser.parse_args()
+
+    import_times = []
+    importtime_output = ""
+    for _ in range(args.runs):
+        seconds, importtime_output = time_import()
+        import_times.append(seconds)
+    ready_times = [time_ready(args.path, args.timeout) for _ in range(args.runs)]
+
+    print(json.dumps({
+        "commit": git_commit(),
+        "runs": args.runs,
+        "import": summarize(import_times),
+        "ready": summarize(ready_times),
+        "slowest_imports": slowest_imports(importtime_output, args.top),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Load test for the WebSocket -> NATS -> WebSocket path.
+
+The run command starts the chat app in a child process (the server command),
+opens --connections /ws connections spread over --rooms rooms, then publishes
+--rate messages per second for --duration seconds through random
+connections. Bench messages are ordinary chat messages whose text carries the
+send time, and every connection timestamps the ones it receives, so delivery
+latency covers the whole path: client -> app -> NATS -> app fan-out -> every
+member's socket.
+
+The server only mounts the chat router. Authentication is replaced by the
+bench user named in the X-User-JWT header and room membership is derived from
+the user's index, and persistence and read markers are switched off, so the
+database is never touched. History on join and the publish rate limits are
+disabled unless set in the environment.
+
+NATS is --nats-url if given (inproc:// runs the in-process broker inside the
+app, with no server at all), otherwise nats-server from the PATH is started on
+a free port for the run.
+
+Results are printed as JSON with the commit and the configuration, so runs
+can be compared across commits:
+    python scripts/bench/ws_load.py run --connections 5000 --rooms 200 --rate 2000 > before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Add the repository root to the path to allow importing from app
+sys.path.append(REPO_ROOT)
+
+BENCH_USER_PREFIX = "bench"
+BENCH_ROOM_PREFIX = "bench-room-"
+# Start of the text of bench messages, followed by the send time and a counter
+BENCH_TEXT_PREFIX = "bench "
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def rooms_for(index, rooms, rooms_per_connection):
+    """Rooms of the index-th bench user; the server and the client derive them the same way"""
+    count = min(rooms, rooms_per_connection)
+    return [f"{BENCH_ROOM_PREFIX}{(index + k * (rooms // count)) % rooms}" for k in range(count)]
+
+
+def bench_frame(room, sent, n):
+    """A chat message frame whose text survives the server's envelope unchanged"""
+    return json.dumps({"type": "message", "room": room, "message": f"{BENCH_TEXT_PREFIX}{sent!r} {n}"})
+
+
+def bench_sent_at(data):
+    """Send time of a bench message received from the server, None for any other frame"""
+    if BENCH_TEXT_PREFIX not in data:
+        return None
+    frame = json.loads(data)
+    text = frame.get("message")
+    if frame.get("type") != "message" or not isinstance(text, str) or not text.startswith(BENCH_TEXT_PREFIX):
+        return None
+    return float(text[len(BENCH_TEXT_PREFIX):].split(" ", 1)[0])
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def nats_transport(nats_url):
+    if not nats_url:
+        return "nats-server"
+    return "inproc" if nats_url.startswith("inproc://") else "external"
+
+
+def process_usage(pid):
+    """CPU seconds and resident memory (bytes) of a process, from /proc"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = int(fields[21]) * resource.getpagesize()
+    return cpu, rss
+
+
+# Server side
+
+def serve(args):
+    raise_fd_limit()
+    os.environ["NATS_SERVER_URL"] = args.nats_url
+    os.environ.setdefault("HISTORY_ON_JOIN", "0")
+    os.environ.setdefault("PUBLISH_USER_RATE", "0")
+    os.environ.setdefault("PUBLISH_ROOM_RATE", "0")
+
+    import uvicorn
+    from fastapi import FastAPI, WebSocket
+
+    from app.auth.dependencies import get_current_user_ws
+    from app.routers import chat_router
+    from app.services import chat_service
+
+    def bench_room_names(current_user):
+        return rooms_for(int(current_user[len(BENCH_USER_PREFIX):]), args.rooms, args.rooms_per_connection)
+
+    async def bench_user(websocket: WebSocket):
+        return websocket.headers.get("X-User-JWT", "")
+
+    def not_persisted(*message):
+        return True
+
+    def not_marked(*marker):
+        pass
+
+    chat_service.get_user_room_names = bench_room_names
+    # Bench rooms and users are not in the database
+    chat_service.message_writer.enqueue = not_persisted
+    chat_service.read_markers.mark = not_marked
+    app = FastAPI()
+    app.include_router(chat_router.router)
+    app.dependency_overrides[get_current_user_ws] = bench_user
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await chat_service.presence.close()
+        await chat_service.fanout.close()
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", backlog=4096)
+
+
+# Client side
+
+class Connection:
+    def __init__(self, index, rooms):
+        self.index = index
+        self.rooms = rooms
+        self.ws = None
+        self.reader = None
+
+
+async def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Bench server exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    sys.exit(f"Bench server did not listen on port {port} within {timeout}s")
+
+
+async def open_connection(url, conn, connect_latency, errors):
+    from websockets.asyncio.client import connect
+
+    started = time.perf_counter()
+    try:
+        conn.ws = await connect(url, additional_headers={"X-User-JWT": f"{BENCH_USER_PREFIX}{conn.index}"},
+                                max_queue=None, open_timeout=60)
+        # The server answers presence requests only once the connection is subscribed to its rooms
+        await conn.ws.send(json.dumps({"type": "presence", "room": conn.rooms[0]}))
+        while True:
+            frame = json.loads(await conn.ws.recv())
+            if frame.get("type") == "presence_snapshot":
+                break
+        connect_latency.append(time.perf_counter() - started)
+    except Exception as e:
+        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        conn.ws = None
+
+
+async def read_frames(conn, latencies):
+    try:
+        async for data in conn.ws:
+            sent = bench_sent_at(data)
+            if sent is not None:
+                latencies.append(time.perf_counter() - sent)
+    except Exception:
+        pass
+
+
+async def publish(connections, rate, duration, sent):
+    """Send rate messages per second from random connections, catching up if the loop falls behind"""
+    interval = 1 / rate
+    started = time.perf_counter()
+    due = started
+    end = started + duration
+    while due < end:
+        now = time.perf_counter()
+        if due > now:
+            await asyncio.sleep(due - now)
+        while due <= time.perf_counter() and due < end:
+            conn = random.choice(connections)
+            room = random.choice(conn.rooms)
+            try:
+                await conn.ws.send(bench_frame(room, time.perf_counter(), len(sent)))
+                sent.append(room)
+            except Exception:
+                pass
+            due += interval
+    return time.perf_counter() - started
+
+
+async def run_load(args, url, server_pid):
+    members = {}
+    connections = []
+    for index in range(args.connections):
+        conn = Connection(index, rooms_for(index, args.rooms, args.rooms_per_connection))
+        connections.append(conn)
+        for room in conn.rooms:
+            members[room] = members.get(room, 0) + 1
+
+    idle_cpu, idle_rss = process_usage(server_pid)
+    connect_latency = []
+    errors = {}
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+    async def connect_one(conn):
+        async with semaphore:
+            await open_connection(url, conn, connect_latency, errors)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connect_one(conn) for conn in connections))
+    connect_elapsed = time.perf_counter() - started
+    connected = [conn for conn in connections if conn.ws is not None]
+    if not connected:
+        sys.exit(f"No connection succeeded: {errors}")
+
+    # Let presence settle so its traffic does not count as publish load
+    await asyncio.sleep(args.settle)
+    connected_cpu, connected_rss = process_usage(server_pid)
+
+    latencies = []
+    for conn in connected:
+        conn.reader = asyncio.create_task(read_frames(conn, latencies))
+
+    sent = []
+    client_cpu_started = resource.getrusage(resource.RUSAGE_SELF)
+    publish_elapsed = await publish(connected, args.rate, args.duration, sent)
+    await asyncio.sleep(args.drain)
+    loaded_cpu, loaded_rss = process_usage(server_pid)
+    client_cpu_finished = resource.getrusage(resource.RUSAGE_SELF)
+
+    for conn in connected:
+        await conn.ws.close()
+        conn.reader.cancel()
+
+    # Only connections that are open receive messages
+    open_members = {}
+    for conn in connected:
+        for room in conn.rooms:
+            open_members[room] = open_members.get(room, 0) + 1
+    expected = sum(open_members.get(room, 0) for room in sent)
+    client_cpu = (client_cpu_finished.ru_utime + client_cpu_finished.ru_stime
+                  - client_cpu_started.ru_utime - client_cpu_started.ru_stime)
+    server_cpu = loaded_cpu - connected_cpu
+    load_seconds = publish_elapsed + args.drain
+
+    return {
+        "connections": {
+            "requested": args.connections,
+            "open": len(connected),
+            "errors": errors,
+            "elapsed_s": round(connect_elapsed, 3),
+            "per_s": round(len(connected) / connect_elapsed, 1),
+            "latency": summarize(connect_latency),
+        },
+        "publish": {
+            "sent": len(sent),
+            "elapsed_s": round(publish_elapsed, 3),
+            "per_s": round(len(sent) / publish_elapsed, 1),
+        },
+        "delivery": {
+            "expected": expected,
+            "received": len(latencies),
+            "ratio": round(len(latencies) / expected, 4) if expected else None,
+            "per_s": round(len(latencies) / load_seconds, 1),
+            "latency": summarize(latencies),
+        },
+        "server": {
+            "rss_idle_mb": round(idle_rss / 2**20, 1),
+            "rss_loaded_mb": round(loaded_rss / 2**20, 1),
+            "rss_per_connection_kb": round((connected_rss - idle_rss) / len(connected) / 1024, 2),
+            "cpu_connect_s": round(connected_cpu - idle_cpu, 3),
+            "cpu_ms_per_connection": round((connected_cpu - idle_cpu) / len(connected) * 1000, 3),
+            "cpu_load_s": round(server_cpu, 3),
+            "cpu_utilization": round(server_cpu / load_seconds, 3),
+            "cpu_us_per_delivery": round(server_cpu / len(latencies) * 1e6, 2) if latencies else None,
+        },
+        "client": {
+            "cpu_load_s": round(client_cpu, 3),
+            "cpu_utilization": round(client_cpu / load_seconds, 3),
+        },
+        "room_members": {"min": min(members.values()), "max": max(members.values())},
+    }
+
+
+def run(args):
+    fd_limit = raise_fd_limit()
+    if fd_limit < args.connections + 100:
+        print(f"warning: open file limit {fd_limit} is below --connections", file=sys.stderr)
+
+    children = []
+    nats_url = args.nats_url
+    try:
+        if not nats_url:
+            nats_server = shutil.which("nats-server")
+            if not nats_server:
+                sys.exit("Pass --nats-url or put nats-server on the PATH")
+            nats_port = free_port()
+            children.append(subprocess.Popen([nats_server, "-a", "127.0.0.1", "-p", str(nats_port)],
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            nats_url = f"nats://127.0.0.1:{nats_port}"
+
+        port = args.port or free_port()
+        server = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "server",
+            "--port", str(port), "--nats-url", nats_url,
+            "--rooms", str(args.rooms), "--rooms-per-connection", str(args.rooms_per_connection),
+        ], cwd=REPO_ROOT)
+        children.append(server)
+
+        async def main_async():
+            await wait_for_port(port, server)
+            return await run_load(args, f"ws://127.0.0.1:{port}/ws", server.pid)
+
+        results = asyncio.run(main_async())
+    finally:
+        for child in reversed(children):
+            child.terminate()
+            try:
+                child.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                child.kill()
+
+    print(json.dumps({
+        "commit": git_commit(),
+        "config": {
+            "connections": args.connections,
+            "rooms": args.rooms,
+            "rooms_per_connection": args.rooms_per_connection,
+            "rate": args.rate,
+            "duration_s": args.duration,
+            "nats": nats_transport(args.nats_url),
+            "cpus": os.cpu_count(),
+        },
+        **results,
+    }, indent=2))
+
+
+def main():
+    # Options the run command passes on to the server it starts
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--rooms", type=int, default=100)
+    common.add_argument("--rooms-per-connection", type=int, default=1)
+    common.add_argument("--nats-url", help="NATS server to use instead of starting nats-server")
+    common.add_argument("--port", type=int, default=0, help="Port of the app (default: a free one)")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", parents=[common], help="Start the app and run the load")
+    run_parser.add_argument("--connections", type=int, default=2000)
+    run_parser.add_argument("--connect-concurrency", type=int, default=200, help="Handshakes in flight")
+    run_parser.add_argument("--rate", type=float, default=500, help="Messages published per second, in total")
+    run_parser.add_argument("--duration", type=float, default=10, help="Seconds of publishing")
+    run_parser.add_argument("--settle", type=float, default=2, help="Seconds to wait after connecting")
+    run_parser.add_argument("--drain", type=float, default=2, help="Seconds to wait for deliveries after publishing")
+
+    commands.add_parser("server", parents=[common], help="Run the app for the bench (started by run)")
+
+    args = parser.parse_args()
+    if args.command == "server":
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Build the static assets: content-hashed copies of every file under
+app/static in app/static/dist/, gzip and brotli variants of those that
+compress, and dist/manifest.json mapping source paths to the hashed ones.
+
+Brotli variants need the brotli package; without it only gzip is written.
+The output only depends on the sources, so building twice gives identical
+files. Run it before starting the app (e.g. in the image build):
+
+    python scripts/build_static.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the repository root to the path to allow importing from app
+sys.path.append(REPO_ROOT)
+
+from app.shared.static_assets import DIST_DIR, MANIFEST_FILE, STATIC_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller files gain nothing from compression
+MIN_COMPRESS_SIZE = 256
+# Already compressed formats
+SKIP_COMPRESSION = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2", ".gz", ".br", ".zip"}
+
+
+def source_files(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir and DIST_DIR in dirs:
+            dirs.remove(DIST_DIR)
+        dirs.sort()
+        for name in sorted(files):
+            if not name.startswith("."):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, static_dir).replace(os.sep, "/"), path
+
+
+def hashed_name(relative_path, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = os.path.splitext(relative_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def compressed_variants(relative_path, data):
+    if len(data) < MIN_COMPRESS_SIZE or os.path.splitext(relative_path)[1].lower() in SKIP_COMPRESSION:
+        return {}
+    variants = {"gzip": (".gz", gzip.compress(data, compresslevel=9, mtime=0))}
+    if brotli is not None:
+        variants["br"] = (".br", brotli.compress(data, quality=11))
+    return {encoding: variant for encoding, variant in variants.items() if len(variant[1]) < len(data)}
+
+
+def build(static_dir=STATIC_DIR):
+    dist = os.path.join(static_dir, DIST_DIR)
+    # Start clean so assets removed from the sources disappear from dist/
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    sizes = {}
+    for relative_path, path in source_files(static_dir):
+        with open(path, "rb") as f:
+            data = f.read()
+        hashed = hashed_name(relative_path, data)
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+        variants = compressed_variants(relative_path, data)
+        for suffix, compressed in variants.values():
+            with open(target + suffix, "wb") as f:
+                f.write(compressed)
+        manifest[relative_path] = {"path": hashed, "encodings": sorted(variants)}
+        sizes[relative_path] = {"bytes": len(data), **{encoding: len(v[1]) for encoding, v in variants.items()}}
+    with open(os.path.join(dist, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("brotli is not installed, writing gzip variants only", file=sys.stderr)
+    manifest, sizes = build(args.static_dir)
+    print(json.dumps({path: {"hashed": entry["path"], **sizes[path]} for path, entry in manifest.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
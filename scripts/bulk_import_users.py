@@ -0,0 +1,92 @@
+"""
+Bulk-import users from a CSV or NDJSON file.
+
+Each row needs a username and password; email and rooms are optional. Rooms
+are ';'-separated in CSV and a JSON list in NDJSON. Per-row errors are
+reported (and optionally written to an NDJSON file) without aborting the import.
+
+Usage:
+    python scripts/bulk_import_users.py users.csv --workers 8 --batch-size 500
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add the parent directory to the path to allow importing from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.provisioning_service import (
+    BULK_IMPORT_BATCH_SIZE,
+    BULK_IMPORT_WORKERS,
+    IMPORT_FORMATS,
+    detect_import_format,
+    import_users,
+    iter_user_rows,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk-import users from a CSV or NDJSON file")
+    parser.add_argument("path", help="Path to the CSV or NDJSON file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Input format (detected from the extension by default)")
+    parser.add_argument("--account", default="chat-app", help="NATS account to create the users in")
+    parser.add_argument("--workers", type=int, default=BULK_IMPORT_WORKERS, help="Credential minting processes")
+    parser.add_argument("--batch-size", type=int, default=BULK_IMPORT_BATCH_SIZE, help="Rows per database transaction")
+    parser.add_argument("--errors-file", help="Write per-row errors to this NDJSON file")
+    return parser.parse_args()
+
+
+def run_import(args):
+    """Run the import and return the final report"""
+    fmt = args.format or detect_import_format(args.path)
+    if not fmt:
+        raise ValueError(f"Cannot detect the format of {args.path}, use --format")
+
+    def log_progress(report):
+        logger.info(f"Processed {report.processed} rows: {report.created} created, {report.failed} failed")
+
+    # Keep every error when they are written to a file
+    max_errors = sys.maxsize if args.errors_file else 1000
+
+    with open(args.path, "r", encoding="utf-8", newline="") as stream:
+        report = import_users(
+            iter_user_rows(stream, fmt),
+            account_name=args.account,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            progress_cb=log_progress,
+            max_errors=max_errors
+        )
+
+    if args.errors_file:
+        with open(args.errors_file, "w") as f:
+            for error in report.errors:
+                f.write(json.dumps(error) + "\n")
+        logger.info(f"Wrote {len(report.errors)} errors to {args.errors_file}")
+    else:
+        for error in report.errors:
+            logger.warning(f"Line {error['line']} ({error['username']}): {error['error']}")
+
+    return report
+
+
+if __name__ == "__main__":
+    try:
+        report = run_import(parse_args())
+    except Exception as e:
+        logger.error(f"Bulk import failed: {e}")
+        sys.exit(1)
+
+    print(f"Imported {report.created} users, {report.failed} failed.")
+    sys.exit(0 if report.failed == 0 else 2)
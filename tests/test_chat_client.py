@@ -0,0 +1,194 @@
+import asyncio
+import base64
+import json
+
+from app.nats.client import ChatClient, ChatMessage, EnvelopeTemplate, MessageOverflowError, sub_allow_from_jwt
+from app.shared import serialization
+
+
+def test_envelope_template_matches_serialization_dumps():
+    template = EnvelopeTemplate("message", "alice \"a\"", "id-1")
+    expected = serialization.dumps({
+        "v": 1, "type": "message", "sender": "alice \"a\"", "sender_id": "id-1", "message": "hé\nllo", "timestamp": 1.25,
+    })
+    assert template.render("hé\nllo", 1.25) == expected
+    assert expected.startswith(b'{"v":1,"type":"message",')
+    assert json.loads(EnvelopeTemplate("join", "a", "b").render(timestamp=2.0)) == {
+        "v": 1, "type": "join", "sender": "a", "sender_id": "b", "timestamp": 2.0,
+    }
+
+
+async def connected_client(url, **kwargs):
+    client = ChatClient(server_url=url, username="bot", **kwargs)
+    await client.connect()
+    await client.join_group("load")
+    return client
+
+
+def test_send_many_publishes_in_order_and_flushes():
+    async def scenario():
+        client = await connected_client("inproc://send-many", publish_rate=0)
+        received = []
+        sub = await client.nc.subscribe("chat.load")
+        flushes = []
+        flush = client.nc.flush
+
+        async def counting_flush(timeout=10):
+            flushes.append(timeout)
+            await flush(timeout)
+
+        client.nc.flush = counting_flush
+        sent = await client.send_many("load", (f"m{i}" for i in range(10)), flush_every=4)
+        while len(received) < 10:
+            received.append(json.loads((await sub.next_msg(timeout=1)).data)["message"])
+        await client.close()
+        return sent, received, len(flushes)
+
+    sent, received, flushes = asyncio.run(scenario())
+    assert sent == 10
+    assert received == [f"m{i}" for i in range(10)]
+    # After 4 and 8 messages, and once for the last 2
+    assert flushes == 3
+
+
+def test_send_many_stops_at_the_send_limit():
+    async def scenario():
+        client = await connected_client("inproc://send-limit", publish_rate=1, publish_burst=3)
+        sent = await client.send_many("load", ["a"] * 10)
+        refused = await client.send_many("elsewhere", ["a"])
+        await client.close()
+        return sent, refused
+
+    assert asyncio.run(scenario()) == (3, 0)
+
+
+def test_flush_interval_flushes_in_the_background():
+    async def scenario():
+        client = await connected_client("inproc://flush-interval", publish_rate=0, flush_interval=0.01)
+        await client.send_message("load", "hi")
+        assert client.unflushed
+        await asyncio.sleep(0.05)
+        unflushed = client.unflushed
+        await client.close()
+        return unflushed
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_chat_message_decodes_lazily():
+    message = ChatMessage("chat.load", b'{"type": "message", "sender": "bob", "message": "hi"}')
+    assert message._payload is None
+    assert (message.type, message.sender, message.text) == ("message", "bob", "hi")
+    assert ChatMessage("chat.load", b"not json").get("sender") is None
+
+
+def test_messages_iterates_with_a_bounded_buffer():
+    async def scenario(overflow):
+        client = await connected_client(f"inproc://stream-{overflow}", publish_rate=0)
+        stream = await client.messages("chat.load", max_msgs=3, overflow=overflow).start()
+        await client.send_many("load", [f"m{i}" for i in range(5)])
+        # Let the subscription deliver into the stream's buffer without consuming it
+        await asyncio.sleep(0.01)
+        received = []
+        try:
+            async for message in stream:
+                received.append(message.text)
+                if len(received) == 3 and overflow != "error":
+                    break
+        except MessageOverflowError:
+            received.append("overflow")
+        # With drop_new the subscription itself drops the burst
+        dropped = stream.dropped or stream.subscription.dropped
+        await client.close()
+        return received, dropped
+
+    assert asyncio.run(scenario("drop_new")) == (["m0", "m1", "m2"], 2)
+    assert asyncio.run(scenario("drop_oldest")) == (["m2", "m3", "m4"], 2)
+    assert asyncio.run(scenario("error")) == (["m0", "m1", "m2", "overflow"], 1)
+
+
+def test_messages_byte_limit_and_close_ends_iteration():
+    async def scenario():
+        client = await connected_client("inproc://stream-bytes", publish_rate=0)
+        stream = await client.messages("chat.load", max_bytes=300, overflow="drop_new").start()
+        await client.send_many("load", ["x" * 100] * 3)
+        await asyncio.sleep(0.01)
+        subscription = stream.subscription
+        await stream.close()
+        received = [message.text async for message in stream]
+        await client.close()
+        # With drop_new the subscription applies the byte limit too, before the stream sees the messages
+        return len(received), stream.dropped + subscription.dropped
+
+    # Envelopes are ~200 bytes, so only one fits
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_wildcard_mode_uses_one_subscription_for_all_groups():
+    async def scenario():
+        client = ChatClient(server_url="inproc://wildcard", username="bot", publish_rate=0, wildcard="chat.>")
+        other = ChatClient(server_url="inproc://wildcard", username="other", publish_rate=0)
+        await client.connect()
+        await other.connect()
+        # Connections hold a subscription to their private channel
+        before = len(client.nc._subscriptions)
+
+        received = []
+
+        def handler(name):
+            async def on_message(msg):
+                received.append((name, json.loads(msg.data).get("message")))
+            return on_message
+
+        for i in range(300):
+            await client.subscribe_to_channel(f"chat.room{i}", handler(f"room{i}"))
+        subscriptions_added = len(client.nc._subscriptions) - before
+
+        await other.join_group("room7")
+        await other.join_group("not-joined")
+        await other.send_message("room7", "hello")
+        await other.send_message("not-joined", "ignored")
+        await asyncio.sleep(0.01)
+        unrouted = client.unrouted
+        # Also matches chat.>, but is only delivered through the private subscription
+        await other.send_private_message(client.client_id, "psst")
+        await asyncio.sleep(0.01)
+        private_unrouted = client.unrouted - unrouted
+
+        for i in range(300):
+            await client.unsubscribe_from_channel(f"chat.room{i}")
+        after_leaving = len(client.nc._subscriptions) - before
+        await client.close()
+        await other.close()
+        return subscriptions_added, after_leaving, received, unrouted, private_unrouted
+
+    added, after_leaving, received, unrouted, private_unrouted = asyncio.run(scenario())
+    assert added == 1
+    assert after_leaving == 0
+    assert ("room7", "hello") in received
+    assert all(name == "room7" for name, _ in received)
+    assert unrouted >= 1
+    assert private_unrouted == 0
+
+
+def test_wildcard_mode_respects_jwt_permissions():
+    header = base64.urlsafe_b64encode(b'{"alg":"none"}').decode().rstrip("=")
+    claims = {"name": "bot", "nats": {"sub": {"allow": ["chat.room1", "chat.private.*"]}}}
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    allow = sub_allow_from_jwt(f"{header}.{payload}.sig")
+    assert allow == ["chat.room1", "chat.private.*"]
+
+    async def scenario():
+        client = ChatClient(server_url="inproc://permissions", username="bot", wildcard="chat.>", sub_allow=allow)
+        # chat.> is not covered, so the client falls back to one subscription per channel
+        assert client.wildcard is None
+        await client.connect()
+        await client.join_group("room1")
+        await client.join_group("room2")
+        joined = set(client.subscriptions)
+        groups = set(client.joined_groups)
+        await client.close()
+        return joined, groups
+
+    assert asyncio.run(scenario()) == ({"chat.room1"}, {"chat.room1"})
+    assert ChatClient(server_url="inproc://", wildcard="chat.>", sub_allow=["chat.>"]).wildcard == "chat.>"
@@ -0,0 +1,55 @@
+import base64
+import json
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.shared.credential_cache import CredentialCache, NatsCredentials
+
+
+def make_jwt(claims):
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"eyJ0eXAiOiJKV1QifQ.{payload}.signature"
+
+
+def test_from_jwt_extracts_keys():
+    creds = NatsCredentials.from_jwt(make_jwt({"sub": "UABC", "iss": "AXYZ"}))
+    assert creds.public_key == "UABC"
+    assert creds.account_public_key == "AXYZ"
+    assert creds.expires_at is None
+    assert not creds.is_expired()
+
+
+def test_from_jwt_uses_earliest_expiry():
+    db_expiry = datetime.now() + timedelta(days=30)
+    creds = NatsCredentials.from_jwt(make_jwt({"sub": "U", "iss": "A", "exp": int(time.time()) + 60}),
+                                     expires_at=db_expiry)
+    assert creds.expires_at < db_expiry
+
+
+def test_from_user_skips_revoked_credentials():
+    user = SimpleNamespace(username="alice", nats_jwt=make_jwt({"sub": "U", "iss": "A"}),
+                           nats_expires_at=None, nats_expired_at=datetime.now())
+    assert NatsCredentials.from_user(user) is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CredentialCache(max_size=2)
+    cache.put("alice", NatsCredentials("jwt-a", "UA", "A"))
+    cache.put("bob", NatsCredentials("jwt-b", "UB", "A"))
+    assert cache.get("alice").jwt == "jwt-a"
+
+    cache.put("carol", NatsCredentials("jwt-c", "UC", "A"))
+    assert cache.get("bob") is None
+    assert cache.get("alice") is not None
+    assert len(cache) == 2
+
+
+def test_cache_drops_expired_and_invalidated_entries():
+    cache = CredentialCache()
+    cache.put("alice", NatsCredentials("jwt-a", "UA", "A", expires_at=datetime.now() - timedelta(seconds=1)))
+    assert cache.get("alice") is None
+
+    cache.put("bob", NatsCredentials("jwt-b", "UB", "A"))
+    cache.invalidate("bob")
+    assert cache.get("bob") is None
@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+
+import pytest
+from pydantic import ValidationError
+
+from app.nats.client import ChatMessage, EnvelopeTemplate
+from app.shared import tracing
+from app.shared.envelopes import (
+    ClientMessage, PresenceRequest, ReadMark, RoomMessage, describe_error, parse_chat_envelope, parse_client_frame,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "bench"))
+
+from ws_load import bench_frame, bench_sent_at
+
+
+def test_client_frames_are_told_apart_by_type():
+    assert parse_client_frame(b'{"room": "general", "message": "hi"}') == ClientMessage(room="general", message="hi")
+    # Older clients send the text as "content"
+    assert parse_client_frame('{"v": 1, "room": "general", "content": "hi"}').message == "hi"
+    assert parse_client_frame('{"type": "presence", "room": "general"}') == PresenceRequest(type="presence", room="general")
+    assert parse_client_frame('{"type": "read", "room": "general", "id": 7, "extra": 1}') == ReadMark(
+        type="read", room="general", id=7)
+
+
+@pytest.mark.parametrize("raw", [
+    b"not json",
+    b"[1, 2]",
+    b'{"room": "general"}',
+    b'{"room": "", "message": "hi"}',
+    b'{"type": "read", "room": "general", "id": "newest"}',
+    b'{"type": "typing", "room": "general"}',
+    b'{"v": 2, "room": "general", "message": "hi"}',
+    json.dumps({"room": "general", "message": "x" * 8001}).encode(),
+])
+def test_invalid_client_frames_are_rejected(raw):
+    with pytest.raises(ValueError) as info:
+        parse_client_frame(raw)
+    assert isinstance(info.value, ValidationError)
+    assert 0 < len(describe_error(info.value)) <= 120
+
+
+def test_room_message_json_is_compact_and_keeps_the_trace_field():
+    message = RoomMessage.model_construct(id=7, room="général", sender=None, message="hi", timestamp=1.5)
+    assert message.to_json() == '{"v":1,"type":"message","id":7,"room":"général","message":"hi","timestamp":1.5}'.encode()
+
+    message.trace = {"id": "abc", "hops": {}}
+    envelope, trace = tracing.extract(message.to_json())
+    assert trace == {"id": "abc", "hops": {}}
+    assert RoomMessage.model_validate(envelope) == message
+
+
+def test_chat_envelopes_from_the_template_validate():
+    envelope = parse_chat_envelope(EnvelopeTemplate("private", "alice", "id-1").render("hé", 2.0))
+    assert (envelope.v, envelope.type, envelope.sender, envelope.sender_id, envelope.message) == (
+        1, "private", "alice", "id-1", "hé")
+    with pytest.raises(ValidationError):
+        parse_chat_envelope(b'{"type": "message", "message": "no sender"}')
+
+
+def test_chat_message_fields_need_a_valid_envelope():
+    message = ChatMessage("chat.load", b'{"type": "shout", "sender": "bob", "message": "hi"}')
+    assert (message.envelope, message.type, message.text) == (None, None, None)
+    # The raw payload is still there for consumers that want it
+    assert message.get("type") == "shout"
+
+
+def test_bench_frames_are_valid_chat_messages():
+    frame = parse_client_frame(bench_frame("bench-room-3", 12.5, 7))
+    assert (frame.type, frame.room) == ("message", "bench-room-3")
+    # The send time comes back in the text of the room message the server publishes
+    delivered = RoomMessage.model_construct(id=1, room=frame.room, sender="bench0", message=frame.message, timestamp=1.0)
+    assert bench_sent_at(delivered.to_json().decode()) == 12.5
+    assert bench_sent_at('{"type": "presence_snapshot", "room": "bench-room-3", "online": ["bench"]}') is None
@@ -0,0 +1,190 @@
+import asyncio
+
+from app.services import fanout_service
+from app.services.fanout_service import QueueSubscriber, RoomFanout
+from app.services.history_service import HistoryBuffer
+
+
+class FakeMsg:
+    def __init__(self, data, headers=None):
+        self.data = data
+        self.headers = headers
+
+
+class FakeSubscription:
+    def __init__(self, nc, subject):
+        self.nc = nc
+        self.subject = subject
+
+    async def unsubscribe(self):
+        self.nc.handlers.pop(self.subject, None)
+
+
+class FakeNats:
+    is_closed = False
+    is_connected = True
+
+    def __init__(self):
+        self.handlers = {}
+        self.subscribe_calls = 0
+
+    async def subscribe(self, subject, cb):
+        self.subscribe_calls += 1
+        self.handlers[subject] = cb
+        return FakeSubscription(self, subject)
+
+    async def publish(self, subject, payload, headers=None):
+        handler = self.handlers.get(subject)
+        if handler is not None:
+            await handler(FakeMsg(payload, headers))
+
+
+def make_fanout(nc, **kwargs):
+    async def connect():
+        return nc
+    return RoomFanout(connect=connect, **kwargs)
+
+
+def test_one_subscription_per_room_shared_by_subscribers():
+    async def scenario():
+        nc = FakeNats()
+        fanout = make_fanout(nc)
+        first, second = QueueSubscriber(), QueueSubscriber()
+        await fanout.subscribe(first, ["general"])
+        await fanout.subscribe(second, ["general"])
+        await fanout.publish("general", b'{"message": "hi"}')
+
+        assert nc.subscribe_calls == 1
+        a, b = first.queue.get_nowait(), second.queue.get_nowait()
+        # The same event object, so the frame is serialized once for both
+        assert a is b
+        assert a.sse_frame() is b.sse_frame()
+        assert a.sse_frame() == f"id: {fanout_service.NODE_EPOCH}-1\ndata: {{\"message\": \"hi\"}}\n\n".encode()
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_is_closed():
+    async def scenario():
+        fanout = make_fanout(FakeNats())
+        slow = QueueSubscriber(maxsize=2)
+        await fanout.subscribe(slow, ["general"])
+        for _ in range(3):
+            await fanout.publish("general", b"{}")
+
+        assert slow.closed
+        assert slow.queue.get_nowait() is None
+
+    asyncio.run(scenario())
+
+
+def test_room_released_after_linger():
+    async def scenario():
+        nc = FakeNats()
+        fanout = make_fanout(nc, linger_seconds=0)
+        subscriber = QueueSubscriber()
+        await fanout.subscribe(subscriber, ["general"])
+        await fanout.unsubscribe(subscriber)
+        await asyncio.sleep(0.01)
+
+        assert "general" not in fanout.subscriptions
+        assert "room.general" not in nc.handlers
+
+    asyncio.run(scenario())
+
+
+def test_replay_since_reports_gaps():
+    async def scenario():
+        fanout = make_fanout(FakeNats(), replay_size=2)
+        subscriber = QueueSubscriber()
+        await fanout.subscribe(subscriber, ["general", "random"])
+        await fanout.publish("general", b"1")
+        await fanout.publish("random", b"2")
+        first_id = f"{fanout_service.NODE_EPOCH}-1"
+
+        events, gaps = fanout.replay_since(first_id, ["general", "random"])
+        assert [event.text for event in events] == ["2"] and gaps == []
+
+        # Unknown epochs and overrun buffers both report every room as a gap
+        assert fanout.replay_since("other-1", ["general"]) == ([], ["general"])
+        await fanout.publish("general", b"3")
+        await fanout.publish("general", b"4")
+        _, gaps = fanout.replay_since(first_id, ["general", "random"])
+        assert gaps == ["general", "random"]
+
+    asyncio.run(scenario())
+
+
+def test_persisted_messages_feed_history():
+    async def scenario():
+        history = HistoryBuffer(room_size=10, budget=1 << 20)
+        fanout = make_fanout(FakeNats(), history=history, linger_seconds=0)
+        subscriber = QueueSubscriber()
+        await fanout.subscribe(subscriber, ["general"])
+        await fanout.publish("general", b'{"id": 7}', message_id=7)
+        await fanout.publish("general", b'{"type": "join"}')
+
+        assert subscriber.queue.get_nowait().uid == 7
+        assert history.recent("general", 10) == ([(7, '{"id": 7}')], False)
+
+        await fanout.unsubscribe(subscriber)
+        await asyncio.sleep(0.01)
+        assert "general" not in history.rooms
+
+    asyncio.run(scenario())
+
+
+def test_subscribers_are_tracked_even_without_rooms():
+    async def scenario():
+        fanout = make_fanout(FakeNats())
+        roomless, member = QueueSubscriber(), QueueSubscriber()
+        await fanout.subscribe(roomless, [])
+        await fanout.subscribe(member, ["general"])
+        assert fanout.subscriber_count() == 2
+
+        fanout.drain_subscribers()
+        assert roomless.finished and member.finished
+        await fanout.unsubscribe(roomless)
+        await fanout.unsubscribe(member)
+        assert fanout.subscriber_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_room_subscription_only_rolls_back_its_callers():
+    class FlakyNats(FakeNats):
+        def __init__(self):
+            super().__init__()
+            self.release = asyncio.Event()
+
+        async def subscribe(self, subject, cb):
+            await self.release.wait()
+            if subject == "room.broken":
+                raise ConnectionError("permission denied")
+            return await super().subscribe(subject, cb)
+
+    async def scenario():
+        nc = FlakyNats()
+        fanout = make_fanout(nc)
+        first, second, bystander = QueueSubscriber(), QueueSubscriber(), QueueSubscriber()
+        nc.release.set()
+        await fanout.subscribe(bystander, ["general"])
+        nc.release.clear()
+
+        joins = [
+            asyncio.create_task(fanout.subscribe(first, ["general", "broken"])),
+            asyncio.create_task(fanout.subscribe(second, ["broken"])),
+        ]
+        await asyncio.sleep(0)
+        nc.release.set()
+        results = await asyncio.gather(*joins, return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+
+        assert "broken" not in fanout.rooms and not fanout._subscribing
+        assert fanout.rooms["general"] == {bystander}
+        assert fanout.subscriber_count() == 1
+        # Room counters are bound once per room, not per message
+        await fanout.publish("general", b"{}")
+        assert fanout._delivered_counters["general"].value >= 1
+
+    asyncio.run(scenario())
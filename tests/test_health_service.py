@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from app.nats.transport import new_client
+from app.services.health_service import HealthChecker
+
+
+class BrokenEngine:
+    pool = None
+
+    def connect(self):
+        raise ConnectionError("connection refused")
+
+
+def test_readiness_reports_cached_nats_and_db_state(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/health.db", poolclass=QueuePool, pool_size=2)
+
+    async def scenario():
+        nc = new_client("inproc://health")
+        checker = HealthChecker(engine, get_nats=lambda: nc, interval=0.01)
+        not_connected = checker.readiness()
+        await nc.connect("inproc://health")
+        checker.start()
+        await asyncio.sleep(0.05)
+        ready = checker.readiness()
+        draining = checker.readiness(draining=True)
+        await checker.close()
+        await nc.close()
+        return not_connected, ready, draining
+
+    not_connected, ready, draining = asyncio.run(scenario())
+    assert not not_connected["ready"]
+    assert ready["ready"]
+    assert ready["nats"] == {"connected": True, "reconnecting": False, "pending_bytes": 0}
+    assert ready["db"]["ok"] and ready["db"]["last_error"] is None
+    assert ready["db"]["size"] == 2 and ready["db"]["checkedout"] == 0
+    assert not draining["ready"]
+
+
+def test_failed_or_stale_db_checks_make_the_node_unready():
+    async def scenario():
+        nc = new_client("inproc://health-db")
+        await nc.connect("inproc://health-db")
+        checker = HealthChecker(BrokenEngine(), get_nats=lambda: nc, interval=1, max_missed=2)
+        await checker.check()
+        failed = checker.readiness()
+        # A ping that succeeded longer ago than max_missed intervals is stale
+        checker.db_last_ok = time.time() - 5
+        stale = checker.readiness()
+        await nc.close()
+        return failed, stale
+
+    failed, stale = asyncio.run(scenario())
+    assert not failed["ready"]
+    assert failed["db"]["last_error"] == "connection refused"
+    assert not stale["ready"]
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from app.services import history_service
+from app.services.history_service import HistoryBuffer, get_room_history, history_frame
+
+
+def fill(buffer, room, uids):
+    for uid in uids:
+        buffer.append(room, uid, json.dumps({"id": uid}))
+
+
+def test_append_keeps_last_n_of_tracked_rooms():
+    buffer = HistoryBuffer(room_size=3, budget=1 << 20)
+    fill(buffer, "untracked", [1])
+    buffer.track("general")
+    fill(buffer, "general", [1, 2, 3, 4])
+
+    assert "untracked" not in buffer.rooms
+    page, covered = buffer.recent("general", 10)
+    assert [uid for uid, _ in page] == [4, 3, 2] and not covered
+    assert [uid for uid, _ in buffer.recent("general", 2, before=4)[0]] == [3, 2]
+
+
+def test_budget_evicts_least_recently_used_rooms():
+    buffer = HistoryBuffer(room_size=100, budget=3 * (10 + history_service.ENTRY_OVERHEAD))
+    for room in ("a", "b"):
+        buffer.track(room)
+    fill(buffer, "a", [1])
+    fill(buffer, "b", [2])
+    buffer.recent("a", 1)
+    fill(buffer, "b", [3, 4])
+
+    assert list(buffer.rooms) == ["b"]
+    assert buffer.total_size == buffer.rooms["b"].size
+
+
+def test_history_falls_back_to_database_and_keeps_rows(monkeypatch):
+    calls = []
+
+    def fake_load(room, before, limit):
+        calls.append((before, limit))
+        return [(uid, json.dumps({"id": uid})) for uid in range(before - 1, 0, -1)][:limit]
+
+    monkeypatch.setattr(history_service, "_load_from_db", fake_load)
+    monkeypatch.setattr(history_service, "room_history", HistoryBuffer(room_size=10, budget=1 << 20))
+    history_service.room_history.track("general")
+    fill(history_service.room_history, "general", [5, 6])
+
+    page = asyncio.run(get_room_history("general", 4))
+    assert [uid for uid, _ in page] == [3, 4, 5, 6]
+    assert calls == [(5, 2)]
+
+    # The loaded rows now sit in the buffer, and it knows where the room starts
+    page = asyncio.run(get_room_history("general", 10))
+    assert [uid for uid, _ in page] == [1, 2, 3, 4, 5, 6]
+    page = asyncio.run(get_room_history("general", 10))
+    assert [uid for uid, _ in page] == [1, 2, 3, 4, 5, 6]
+    assert calls == [(5, 2), (3, 6)]
+
+
+def test_history_frame_embeds_envelopes():
+    frame = history_frame("general", [(1, '{"id": 1}'), (2, '{"id": 2}')])
+    assert json.loads(frame) == {"type": "history", "room": "general", "messages": [{"id": 1}, {"id": 2}]}
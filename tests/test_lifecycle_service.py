@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from app.nats.transport import new_client
+from app.services import lifecycle_service
+from app.services.fanout_service import QueueSubscriber, RoomFanout
+from app.services.lifecycle_service import Lifecycle
+
+
+async def connected(url="inproc://lifecycle"):
+    nc = new_client(url)
+    await nc.connect(url)
+    return nc
+
+
+def test_drain_sends_queued_events_before_disconnecting(monkeypatch):
+    async def scenario():
+        fanout = RoomFanout(connect=connected, linger_seconds=0)
+        monkeypatch.setattr(lifecycle_service, "fanout", fanout)
+        subscriber = QueueSubscriber()
+        await fanout.subscribe(subscriber, ["general"])
+        for i in range(3):
+            await fanout.publish("general", f"m{i}".encode())
+        await asyncio.sleep(0.01)
+
+        received = []
+
+        async def connection():
+            # A transport sending slower than the drain polls
+            while (event := await subscriber.queue.get()) is not None:
+                await asyncio.sleep(0.02)
+                received.append(event.text)
+            await fanout.unsubscribe(subscriber)
+
+        task = asyncio.create_task(connection())
+        exited = []
+        await Lifecycle(drain_timeout=5).drain_connections(lambda: exited.append(True))
+        await task
+        await fanout.close()
+        return received, exited, subscriber.finished, fanout.draining
+
+    assert asyncio.run(scenario()) == (["m0", "m1", "m2"], [True], True, True)
+
+
+def test_drain_gives_up_on_connections_at_the_deadline(monkeypatch):
+    async def scenario():
+        fanout = RoomFanout(connect=connected)
+        monkeypatch.setattr(lifecycle_service, "fanout", fanout)
+        await fanout.subscribe(QueueSubscriber(), ["general"])
+        started = time.perf_counter()
+        await Lifecycle(drain_timeout=0.1).drain_connections()
+        elapsed = time.perf_counter() - started
+        await fanout.close()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 1
+
+
+class FakeService:
+    def __init__(self, closed, name, delay=0.0):
+        self.closed = closed
+        self.name = name
+        self.delay = delay
+
+    async def close(self):
+        await asyncio.sleep(self.delay)
+        self.closed.append(self.name)
+
+
+def test_stop_flushes_buffers_first_and_keeps_to_the_deadline(monkeypatch):
+    closed = []
+    monkeypatch.setattr(lifecycle_service, "message_writer", FakeService(closed, "writer"))
+    monkeypatch.setattr(lifecycle_service, "read_markers", FakeService(closed, "read markers"))
+    monkeypatch.setattr(lifecycle_service, "auth_callout", FakeService(closed, "auth"))
+    monkeypatch.setattr(lifecycle_service, "presence", FakeService(closed, "presence", delay=10))
+    monkeypatch.setattr(lifecycle_service, "fanout", RoomFanout(connect=connected))
+
+    async def scenario():
+        started = time.perf_counter()
+        await Lifecycle(drain_timeout=0.2).stop()
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(scenario())
+    assert closed == ["writer", "read markers", "auth"]
+    assert elapsed < 1
@@ -0,0 +1,102 @@
+import json
+import logging
+import queue
+
+from app.shared.log import (
+    LOG_RECORDS_DROPPED,
+    DroppingQueueHandler,
+    JsonFormatter,
+    SampledLog,
+    ThrottledLog,
+    parse_sample_rates,
+)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_logger(name, level=logging.DEBUG):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(level)
+    handler = ListHandler()
+    logger.handlers = [handler]
+    return logger, handler.records
+
+
+def test_sampled_logs_the_first_and_every_nth_call():
+    logger, records = make_logger("test.sampled")
+    log = SampledLog(logger, 10)
+    for i in range(25):
+        log.info("event %d", i)
+    assert [record.getMessage() for record in records] == ["event 0", "event 10", "event 20"]
+    assert records[0].sample_every == 10
+    assert parse_sample_rates("ws.connections=100, ws.messages=1000,bad") == {"ws.connections": 100, "ws.messages": 1000}
+
+
+def test_disabled_levels_format_nothing():
+    logger, records = make_logger("test.lazy", logging.INFO)
+
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("formatted")
+
+    SampledLog(logger, 1).debug("%s", Expensive())
+    ThrottledLog(logger, 60).log(logging.DEBUG, "%s", Expensive())
+    assert records == []
+
+
+def test_throttled_reports_suppressed_messages():
+    logger, records = make_logger("test.throttled")
+    log = ThrottledLog(logger, 60)
+    for i in range(5):
+        log.error("send failed: %s", i)
+    log.error("other: %s", "x")
+    assert [record.getMessage() for record in records] == ["send failed: 0", "other: x"]
+    # The window is over: the next one says how many were skipped
+    log.windows["send failed: %s"][0] = 0
+    log.error("send failed: %s", 9)
+    assert records[-1].getMessage() == "send failed: 9 (4 similar suppressed)"
+
+
+def test_json_lines_with_extra_fields():
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "user %s joined", ("alice",), None)
+    record.room = "general"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "user alice joined"
+    assert entry["level"] == "INFO"
+    assert entry["room"] == "general"
+
+
+def test_full_log_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    logger = logging.getLogger("test.queue")
+    logger.propagate = False
+    logger.handlers = [handler]
+    before = LOG_RECORDS_DROPPED._unlabelled().value
+    for _ in range(3):
+        logger.warning("x")
+    assert LOG_RECORDS_DROPPED._unlabelled().value - before == 2
+
+
+def test_queued_records_are_formatted_by_the_listener():
+    records = queue.Queue()
+    logger = logging.getLogger("test.deferred")
+    logger.propagate = False
+    logger.handlers = [DroppingQueueHandler(records)]
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("failed for %s", "alice", exc_info=True)
+
+    record = records.get_nowait()
+    # Nothing was rendered on the calling thread
+    assert (record.msg, record.args) == ("failed for %s", ("alice",))
+    assert record.exc_info is not None and record.exc_text is None
+    assert "ValueError: boom" in logging.Formatter().format(record)
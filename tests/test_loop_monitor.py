@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import time
+
+from app.shared.loop_monitor import EVENT_LOOP_LAG, LoopMonitor
+
+
+def blocking_handler():
+    time.sleep(0.3)
+
+
+def test_lag_is_recorded_and_blocking_calls_are_logged_with_their_stack(caplog):
+    async def scenario():
+        monitor = LoopMonitor(interval=0.02, block_threshold=0.1)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        lag_count = EVENT_LOOP_LAG._unlabelled().count
+        lag_sum = EVENT_LOOP_LAG._unlabelled().sum
+        blocking_handler()
+        await asyncio.sleep(0.05)
+        await monitor.close()
+        return (monitor.blocks, EVENT_LOOP_LAG._unlabelled().count - lag_count,
+                EVENT_LOOP_LAG._unlabelled().sum - lag_sum)
+
+    with caplog.at_level(logging.WARNING, logger="app.shared.loop_monitor"):
+        blocks, samples, lag = asyncio.run(scenario())
+    assert blocks == 1
+    assert samples >= 2
+    assert lag >= 0.25
+    assert "in blocking_handler" in caplog.text
+
+
+def test_watchdog_is_off_without_a_threshold():
+    async def scenario():
+        monitor = LoopMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        watchdog = monitor.watchdog
+        await monitor.close()
+        return watchdog
+
+    assert asyncio.run(scenario()) is None
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database.models import Base, Message, NatsAccount, NatsRoom, User
+from app.querries.message_querries import MessageQueries
+from app.services.message_writer import MessageWriter
+from app.shared.ids import id_timestamp, next_message_id
+
+
+def make_session_factory():
+    # One shared in-memory database, as the writer inserts from a worker thread
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    account = NatsAccount(name="chat-app", public_key="ACHAT")
+    db.add(account)
+    db.flush()
+    db.add(NatsRoom(name="general", subject_prefix="room", account_id=account.id))
+    db.add(User(username="alice", hashed_password="x"))
+    db.commit()
+    db.close()
+    return factory
+
+
+def test_message_ids_are_increasing_and_timestamped():
+    ids = [next_message_id() for _ in range(5000)]
+    assert ids == sorted(set(ids))
+    assert abs(id_timestamp(ids[0]) - time.time()) < 5
+
+
+def test_writer_persists_batches_and_pages_by_uid():
+    factory = make_session_factory()
+    writer = MessageWriter(session_factory=factory, batch_size=2, flush_interval=0.01)
+
+    async def scenario():
+        uids = [next_message_id() for _ in range(3)]
+        for i, uid in enumerate(uids):
+            assert writer.enqueue(uid, "general", "alice", f"hello {i}")
+        assert writer.enqueue(next_message_id(), "nowhere", "alice", "lost")
+        await asyncio.sleep(0.2)
+        await writer.close()
+        return uids
+
+    uids = asyncio.run(scenario())
+
+    db = factory()
+    assert db.query(Message).count() == 3
+    room_id = db.query(NatsRoom).filter(NatsRoom.name == "general").one().id
+    page = MessageQueries(db).get_room_messages_before(room_id, before_uid=uids[2], limit=10)
+    assert [(message.content, username) for message, username in page] == [("hello 1", "alice"), ("hello 0", "alice")]
+
+
+def test_close_writes_the_batch_being_collected():
+    factory = make_session_factory()
+    writer = MessageWriter(session_factory=factory, batch_size=100, flush_interval=1)
+
+    async def scenario():
+        for i in range(3):
+            assert writer.enqueue(next_message_id(), "general", "alice", f"hello {i}")
+        # The writer has taken the rows off the queue and is waiting for more
+        await asyncio.sleep(0.05)
+        assert writer.queue.empty()
+        await writer.close()
+
+    asyncio.run(scenario())
+
+    db = factory()
+    assert db.query(Message).count() == 3
@@ -0,0 +1,74 @@
+import threading
+
+from app.shared.metrics import Counter, Gauge, Histogram, MetricsRegistry, instrument_queries
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    messages = Counter("messages_total", "Messages", ["room"], registry=registry)
+    sockets = Gauge("sockets", "Sockets", registry=registry)
+    messages.labels("general").inc()
+    messages.labels("general").inc(2)
+    sockets.inc()
+
+    output = registry.render()
+    assert 'messages_total{room="general"} 3' in output
+    assert "# TYPE sockets gauge" in output
+    assert "sockets 1" in output
+
+    sockets.set(5)
+    sockets.dec()
+    assert "sockets 4" in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0), registry=registry)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    output = registry.render()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in output
+    assert 'latency_seconds_bucket{le="1"} 2' in output
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in output
+    assert "latency_seconds_count 3" in output
+
+
+def test_instrument_queries_times_public_methods():
+    registry = MetricsRegistry()
+    latency = Histogram("query_seconds", "Query time", ["query"], registry=registry)
+
+    @instrument_queries(histogram=latency)
+    class FakeQueries:
+        def get_thing(self, thing_id):
+            return thing_id
+
+        def _private(self):
+            return None
+
+    assert FakeQueries().get_thing(7) == 7
+    FakeQueries()._private()
+    assert latency.labels("FakeQueries.get_thing").count == 1
+    assert 'query_seconds_count{query="FakeQueries._private"}' not in registry.render()
+
+
+def test_histogram_is_consistent_across_threads():
+    registry = MetricsRegistry()
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1,), registry=registry)
+
+    observed = Counter("observed_total", "Observations", registry=registry)
+
+    def record():
+        for _ in range(10000):
+            latency.observe(0.05)
+            observed.inc()
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert latency.labels().count == 40000
+    assert 'latency_seconds_bucket{le="0.1"} 40000' in registry.render()
+    assert "observed_total 40000" in registry.render()
@@ -0,0 +1,183 @@
+import asyncio
+
+import pytest
+from nats.errors import BadSubjectError, NoRespondersError, TimeoutError
+
+from app.nats.client import ChatClient
+from app.nats.transport import InProcessClient, new_client, subject_matches
+from app.services.fanout_service import QueueSubscriber, RoomFanout
+
+
+async def connected(url="inproc://test"):
+    nc = new_client(url)
+    await nc.connect(url)
+    return nc
+
+
+def test_new_client_picks_transport_by_url():
+    assert isinstance(new_client("inproc://"), InProcessClient)
+    assert not isinstance(new_client("nats://localhost:4222"), InProcessClient)
+
+
+def test_subject_wildcards():
+    assert subject_matches("room.general", "room.general")
+    assert subject_matches("room.*", "room.general")
+    assert not subject_matches("room.*", "room.general.x")
+    assert subject_matches("room.>", "room.general.x")
+    assert not subject_matches("room.>", "room")
+    assert subject_matches("*.general", "room.general")
+    assert not subject_matches("room.general", "room.other")
+
+
+def test_publish_reaches_matching_subscriptions_in_order():
+    async def scenario():
+        nc = await connected()
+        received = {"literal": [], "star": [], "tail": []}
+
+        def collect(name):
+            async def cb(msg):
+                received[name].append((msg.subject, msg.data, msg.headers))
+            return cb
+
+        await nc.subscribe("room.general", cb=collect("literal"))
+        await nc.subscribe("room.*", cb=collect("star"))
+        await nc.subscribe("room.>", cb=collect("tail"))
+        await nc.publish("room.general", b"1", headers={"Chat-Message-Id": "7"})
+        await nc.publish("room.general", b"2")
+        await nc.publish("room.a.b", b"3")
+        # Delivery is asynchronous, like a real connection
+        assert received["literal"] == []
+        await nc.drain()
+        return received
+
+    received = asyncio.run(scenario())
+    assert received["literal"] == [("room.general", b"1", {"Chat-Message-Id": "7"}), ("room.general", b"2", None)]
+    assert [data for _, data, _ in received["star"]] == [b"1", b"2"]
+    assert [data for _, data, _ in received["tail"]] == [b"1", b"2", b"3"]
+
+
+def test_queue_group_gets_each_message_once():
+    async def scenario():
+        nc = await connected()
+        counts = {"a": 0, "b": 0, "plain": 0}
+
+        def count(name):
+            async def cb(msg):
+                counts[name] += 1
+            return cb
+
+        await nc.subscribe("jobs", queue="workers", cb=count("a"))
+        await nc.subscribe("jobs", queue="workers", cb=count("b"))
+        await nc.subscribe("jobs", cb=count("plain"))
+        for _ in range(100):
+            await nc.publish("jobs", b"")
+        await nc.drain()
+        return counts
+
+    counts = asyncio.run(scenario())
+    assert counts["a"] + counts["b"] == 100
+    assert counts["plain"] == 100
+
+
+def test_request_reply_between_clients():
+    async def scenario():
+        server, client = await connected(), await connected()
+
+        async def echo(msg):
+            await msg.respond(msg.data.upper())
+
+        await server.subscribe("echo", queue="echoers", cb=echo)
+        reply = await client.request("echo", b"hi", timeout=1)
+
+        with pytest.raises(NoRespondersError):
+            await client.request("nobody.home", b"", timeout=0.1)
+
+        async def silent(msg):
+            pass
+
+        await server.subscribe("silent", cb=silent)
+        with pytest.raises(TimeoutError):
+            await client.request("silent", b"", timeout=0.05)
+
+        await client.close()
+        await server.close()
+        return reply.data
+
+    assert asyncio.run(scenario()) == b"HI"
+
+
+def test_rejects_bad_subjects_and_slow_consumers_drop():
+    async def scenario():
+        nc = await connected()
+        with pytest.raises(BadSubjectError):
+            await nc.publish("room.*", b"")
+        with pytest.raises(BadSubjectError):
+            await nc.subscribe("room.>.x")
+
+        sub = await nc.subscribe("busy", pending_msgs_limit=2)
+        for _ in range(5):
+            await nc.publish("busy", b"")
+        assert sub.pending_msgs == 2
+        assert sub.dropped == 3
+
+        by_size = await nc.subscribe("large", pending_bytes_limit=10)
+        for payload in (b"1234", b"5678", b"90ab", b"c"):
+            await nc.publish("large", payload)
+        assert (by_size.pending_msgs, by_size.pending_bytes, by_size.dropped) == (3, 9, 1)
+        await by_size.next_msg()
+        assert by_size.pending_bytes == 5
+        await nc.close()
+
+    asyncio.run(scenario())
+
+
+def test_brokers_are_isolated_by_url():
+    async def scenario():
+        a, b = await connected("inproc://one"), await connected("inproc://two")
+        sub = await b.subscribe("x")
+        await a.publish("x", b"")
+        with pytest.raises(TimeoutError):
+            await sub.next_msg(timeout=0.01)
+        await a.close()
+        await b.close()
+
+    asyncio.run(scenario())
+
+
+def test_room_fanout_across_nodes_without_a_server():
+    async def scenario():
+        # Two nodes, each with its own connection to the same broker
+        first = RoomFanout(connect=lambda: connected("inproc://app"))
+        second = RoomFanout(connect=lambda: connected("inproc://app"))
+        subscriber = QueueSubscriber()
+        await first.subscribe(subscriber, ["general"])
+        await second.publish("general", b'{"message": "hi"}', message_id=42)
+        event = await asyncio.wait_for(subscriber.queue.get(), 1)
+        await first.close()
+        await second.close()
+        return event
+
+    event = asyncio.run(scenario())
+    assert event.room == "general"
+    assert event.uid == 42
+    assert event.text == '{"message": "hi"}'
+
+
+def test_chat_clients_without_a_server(capsys):
+    async def scenario():
+        alice = ChatClient(server_url="inproc://chat", username="alice", publish_rate=0)
+        bob = ChatClient(server_url="inproc://chat", username="bob", publish_rate=0)
+        await alice.connect()
+        await bob.connect()
+        await bob.join_group("lobby")
+        await alice.join_group("lobby")
+        assert await alice.send_message("lobby", "hello")
+        await asyncio.sleep(0.01)
+        await alice.close()
+        await bob.close()
+
+    asyncio.run(scenario())
+    output = capsys.readouterr().out
+    # Joins are not broadcast to the group
+    assert "has joined the chat" not in output
+    assert "alice: hello" in output
@@ -0,0 +1,22 @@
+import asyncio
+
+from app.shared import passwords
+
+
+def test_hash_round_trip():
+    stored = passwords.hash_password_sync("secret", n=2 ** 10)
+    assert stored.startswith("scrypt$1024$")
+    assert passwords.verify_password_sync("secret", stored)
+    assert not passwords.verify_password_sync("wrong", stored)
+
+
+def test_legacy_plain_text_passwords_need_rehash():
+    assert passwords.verify_password_sync("secret", "secret")
+    assert passwords.needs_rehash("secret")
+    assert passwords.needs_rehash(passwords.hash_password_sync("secret", n=2 ** 10))
+    assert not passwords.needs_rehash(passwords.hash_password_sync("secret"))
+
+
+def test_async_verify_runs_on_pool():
+    stored = passwords.hash_password_sync("secret", n=2 ** 10)
+    assert asyncio.run(passwords.verify_password("secret", stored))
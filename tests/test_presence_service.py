@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+from app.services.fanout_service import QueueSubscriber, RoomFanout
+from app.services.presence_service import PresenceService
+
+
+class FakeMsg:
+    def __init__(self, subject, data, headers=None):
+        self.subject = subject
+        self.data = data
+        self.headers = headers
+
+
+class FakeSubscription:
+    async def unsubscribe(self):
+        pass
+
+
+class LoopbackNats:
+    """Delivers every publish to matching subscriptions, including the publisher's own"""
+
+    is_closed = False
+    is_connected = True
+
+    def __init__(self):
+        self.subscriptions = []
+        self.published = []
+
+    async def subscribe(self, subject, cb):
+        self.subscriptions.append((subject, cb))
+        return FakeSubscription()
+
+    async def publish(self, subject, payload, headers=None):
+        self.published.append((subject, payload))
+        for pattern, cb in list(self.subscriptions):
+            if pattern == subject or (pattern.endswith(".>") and subject.startswith(pattern[:-1])):
+                await cb(FakeMsg(subject, payload, headers))
+
+
+async def make_presence(**kwargs):
+    """A presence service driven by explicit tick() calls instead of its background loop"""
+    nc = LoopbackNats()
+
+    async def connect():
+        return nc
+
+    fanout = RoomFanout(connect=connect)
+    presence = PresenceService(fanout, node_id="node-a", **kwargs)
+    presence.start = lambda: None
+    presence.sync_requested = False
+    presence.last_sync = asyncio.get_running_loop().time()
+    await nc.subscribe("presence.>", presence._on_message)
+
+    subscriber = QueueSubscriber()
+    await fanout.subscribe(subscriber, ["general"])
+    return nc, presence, subscriber
+
+
+def presence_frames(subscriber):
+    frames = []
+    while not subscriber.queue.empty():
+        frames.append(json.loads(subscriber.queue.get_nowait().text))
+    return frames
+
+
+def test_joins_are_batched_and_flaps_debounced():
+    async def scenario():
+        nc, presence, subscriber = await make_presence(debounce=60)
+        presence.connect("alice", ["general"])
+        presence.connect("bob", ["general"])
+        await presence.tick()
+        assert [s for s, _ in nc.published] == ["presence.node-a"]
+        assert presence_frames(subscriber) == [{"type": "presence", "room": "general", "joined": ["alice", "bob"], "left": []}]
+
+        # A reconnect inside the debounce window publishes nothing
+        presence.disconnect("alice", ["general"])
+        presence.connect("alice", ["general"])
+        await presence.tick()
+        assert len(nc.published) == 1
+        assert presence.online("general") == ["alice", "bob"]
+
+    asyncio.run(scenario())
+
+
+def test_leave_after_debounce_and_cluster_view():
+    async def scenario():
+        nc, presence, subscriber = await make_presence(debounce=0)
+        presence.connect("alice", ["general"])
+        await presence.tick()
+        # Another node also has alice, plus carol
+        now = asyncio.get_running_loop().time()
+        presence.apply({"node": "node-b", "full": True, "rooms": {"general": ["alice", "carol"]}}, now)
+        presence_frames(subscriber)
+
+        presence.disconnect("alice", ["general"])
+        await presence.tick()
+        # Still online through node-b, so clients see no change
+        assert presence_frames(subscriber) == []
+        assert presence.online("general") == ["alice", "carol"]
+
+        # node-b goes silent and is dropped
+        presence.expire_nodes(now + 4 * presence.sync_interval)
+        assert presence_frames(subscriber) == [{"type": "presence", "room": "general", "joined": [], "left": ["alice", "carol"]}]
+        assert presence.online("general") == []
+        # Nobody is left in any room, so no username is kept
+        assert len(presence.users) == 0
+
+    asyncio.run(scenario())
+
+
+def test_usernames_are_forgotten_once_in_no_room():
+    async def scenario():
+        nc, presence, subscriber = await make_presence(debounce=0)
+        presence.connect("alice", ["general", "random"])
+        presence.connect("bob", [])
+        assert len(presence.users) == 1
+        await presence.tick()
+
+        presence.disconnect("alice", ["general"])
+        await presence.tick()
+        assert "alice" in presence.users.ids
+
+        presence.disconnect("alice", ["random"])
+        await presence.tick()
+        assert len(presence.users) == 0
+        # A leave for a user this node never saw does not intern them
+        presence.apply({"node": "node-b", "rooms": {"general": {"left": ["mallory"]}}}, 0.0)
+        assert len(presence.users) == 0
+
+        # Freed ids are reused
+        presence.connect("carol", ["general"])
+        assert presence.users.id("carol") in (0, 1) and len(presence.users.names) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,148 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.auth import dependencies
+from app.database.models import Base, NatsAccount, NatsPermission, NatsRoom, User
+from app.services import provisioning_service
+from app.services.provisioning_service import ImportJobs, ImportReport, _BulkImporter, iter_user_rows
+
+
+def fake_mint(username, account):
+    if username == "broken":
+        raise RuntimeError("nsc failed")
+    return {"jwt": f"jwt-{username}", "seed": f"seed-{username}", "public_key": f"U{username}",
+            "account_public_key": "ACHAT"}
+
+
+def make_session():
+    # One shared in-memory database, as background imports run in a worker thread
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    account = NatsAccount(name="chat-app", public_key="ACHAT")
+    db.add(account)
+    db.flush()
+    db.add(NatsRoom(name="general", subject_prefix="room", account_id=account.id))
+    db.add(User(username="taken", hashed_password="x"))
+    db.commit()
+    return db
+
+
+def test_iter_user_rows_reports_bad_json_lines():
+    stream = io.StringIO('{"username": "a", "password": "p", "rooms": ["general"]}\nnot json\n\n')
+    rows = list(iter_user_rows(stream, "ndjson"))
+    assert rows[0] == (1, {"username": "a", "password": "p", "email": None, "rooms": ["general"]}, None)
+    assert rows[1][0] == 2 and rows[1][1] is None and rows[1][2].startswith("Invalid JSON")
+
+
+def test_import_batch_keeps_going_on_row_errors(monkeypatch):
+    monkeypatch.setattr(provisioning_service, "mint_user_credentials", fake_mint)
+    db = make_session()
+    csv_data = (
+        "username,password,email,rooms\n"
+        "alice,pw,alice@example.com,general\n"
+        "taken,pw,,\n"
+        "alice,pw,,\n"
+        "broken,pw,,\n"
+        "bob,pw,,missing\n"
+        "carol,,,\n"
+        "dave,pw,,\n"
+    )
+    report = ImportReport()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        importer = _BulkImporter(db, executor, "chat-app", report)
+        importer.import_batch(list(iter_user_rows(io.StringIO(csv_data), "csv")))
+
+    assert report.processed == 7
+    assert report.created == 2
+    assert report.failed == 5
+    assert {error["username"] for error in report.errors} == {"taken", "alice", "broken", "bob", "carol"}
+
+    alice = db.query(User).filter(User.username == "alice").one()
+    assert alice.nats_jwt == "jwt-alice"
+    assert db.query(NatsPermission).filter(NatsPermission.user_id == alice.id).count() == 2
+
+
+def test_account_name_of_reads_the_users_account(monkeypatch):
+    db = make_session()
+    account = db.query(NatsAccount).filter_by(name="chat-app").one()
+    db.add(User(username="admin", hashed_password="x", nats_account_id=account.id))
+    db.commit()
+    monkeypatch.setattr(provisioning_service, "SessionLocal", sessionmaker(bind=db.get_bind()))
+
+    assert provisioning_service.account_name_of("admin") == "chat-app"
+    assert provisioning_service.account_name_of("taken") is None
+    assert provisioning_service.account_name_of("nobody") is None
+
+
+def test_only_admins_may_import(monkeypatch):
+    monkeypatch.setattr(dependencies, "ADMIN_USERS", {"admin"})
+    assert asyncio.run(dependencies.get_current_admin("admin")) == "admin"
+    with pytest.raises(HTTPException) as refused:
+        asyncio.run(dependencies.get_current_admin("alice"))
+    assert refused.value.status_code == 403
+
+
+def test_users_that_are_not_stored_are_deleted_from_nsc(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(provisioning_service, "mint_user_credentials", fake_mint)
+    monkeypatch.setattr(provisioning_service, "delete_user_credentials",
+                        lambda username, account: deleted.append((username, account)))
+    add_user = _BulkImporter._add_user
+
+    def failing_add_user(importer, row, creds, rooms):
+        if row["username"] == "dave":
+            raise RuntimeError("insert failed")
+        add_user(importer, row, creds, rooms)
+
+    monkeypatch.setattr(_BulkImporter, "_add_user", failing_add_user)
+    db = make_session()
+    report = ImportReport()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        importer = _BulkImporter(db, executor, "chat-app", report)
+        importer.import_batch(list(iter_user_rows(io.StringIO("username,password\nalice,pw\nbroken,pw\ndave,pw\n"),
+                                                  "csv")))
+
+    assert report.created == 1
+    assert sorted(deleted) == [("broken", "chat-app"), ("dave", "chat-app")]
+    assert db.query(User).filter(User.username == "alice").count() == 1
+
+
+def test_import_jobs_run_in_the_background_and_report_progress(monkeypatch, tmp_path):
+    db = make_session()
+    monkeypatch.setattr(provisioning_service, "mint_user_credentials", fake_mint)
+    monkeypatch.setattr(provisioning_service, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    monkeypatch.setattr(provisioning_service, "ProcessPoolExecutor",
+                        lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+    path = tmp_path / "users.ndjson"
+    path.write_text('{"username": "alice", "password": "pw", "rooms": ["general"]}\n'
+                    '{"username": "taken", "password": "pw"}\n')
+    jobs = ImportJobs(kept=1)
+
+    async def scenario():
+        job = jobs.start(str(path), "ndjson", "chat-app", "admin")
+        assert jobs.get(job.id).to_dict()["status"] == "running"
+        await jobs.tasks[job.id]
+        # Shutting down stops a job before its next batch
+        stopped_path = tmp_path / "more.ndjson"
+        stopped_path.write_text('{"username": "bob", "password": "pw"}\n')
+        stopped = jobs.start(str(stopped_path), "ndjson", "chat-app", "admin")
+        await jobs.close()
+        return job, stopped
+
+    job, stopped = asyncio.run(scenario())
+    assert stopped.status == "stopped" and stopped.report["created"] == 0
+    job = job.to_dict()
+    assert job["status"] == "finished"
+    assert (job["report"]["created"], job["report"]["failed"]) == (1, 1)
+    assert job["finished_at"] >= job["started_at"]
+    # The copy of the upload is removed once the job is done
+    assert not path.exists()
+    assert db.query(User).filter(User.username == "alice").count() == 1
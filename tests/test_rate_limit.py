@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database.models import Base, NatsAccount, NatsRoom, NatsUserRoom, User
+from app.querries.nats_room_querries import NatsRoomQueries
+from app.services.rate_limit_service import DEFAULT_LIMITS, MESSAGES_THROTTLED, PublishLimiter
+from app.shared.rate_limit import RateLimiter
+
+
+def test_bucket_allows_burst_then_refills():
+    limiter = RateLimiter()
+    assert [limiter.acquire("k", rate=2, burst=3, now=0.0) for _ in range(4)] == [0, 0, 0, 0.5]
+    assert limiter.acquire("k", rate=2, burst=3, now=0.5) == 0
+    # Refill never exceeds the burst
+    assert limiter.peek("k", rate=2, burst=3, now=100.0) == 0
+    assert limiter.buckets["k"].tokens == 3
+
+
+def test_limiter_is_bounded_and_zero_rate_is_unlimited():
+    limiter = RateLimiter(max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key, rate=1, burst=1, now=0.0)
+    assert list(limiter.buckets) == ["b", "c"]
+    assert all(limiter.acquire("x", rate=0, burst=0) == 0 for _ in range(10))
+
+
+def make_room(name, account_id, **limits):
+    defaults = dict(user_publish_rate=None, user_publish_burst=None, room_publish_rate=None, room_publish_burst=None)
+    defaults.update(limits)
+    return SimpleNamespace(name=name, account_id=account_id, **defaults)
+
+
+def test_publish_limiter_uses_account_limits_and_counts_rejections():
+    limiter = PublishLimiter()
+    limiter.remember_rooms([
+        make_room("general", 1, user_publish_rate=0.001, user_publish_burst=2, room_publish_rate=0.001, room_publish_burst=3),
+        make_room("random", 1, user_publish_rate=0.001, user_publish_burst=2),
+    ])
+    user_throttled = MESSAGES_THROTTLED.labels("user").value
+    room_throttled = MESSAGES_THROTTLED.labels("room").value
+
+    assert limiter.check("alice", "general") == 0
+    assert limiter.check("alice", "general") == 0
+    # alice's bucket is shared across the account's rooms
+    assert limiter.check("alice", "random") > 0
+    assert limiter.check("bob", "general") == 0
+    # The room is out of tokens; bob's rejected message does not cost him a token
+    assert limiter.check("bob", "general") > 0
+    assert limiter.limiter.buckets[("user", 1, "bob")].tokens == pytest.approx(1, abs=1e-3)
+
+    assert MESSAGES_THROTTLED.labels("user").value == user_throttled + 1
+    assert MESSAGES_THROTTLED.labels("room").value == room_throttled + 1
+
+
+def test_publish_limiter_takes_from_buckets_evicted_during_the_check():
+    limiter = PublishLimiter(max_keys=1)
+    limiter.remember_rooms([make_room("general", 1, user_publish_rate=1, user_publish_burst=2,
+                                      room_publish_rate=1, room_publish_burst=3)])
+    looked_up = []
+    bucket = limiter.limiter.bucket
+    limiter.limiter.bucket = lambda *args: looked_up.append(bucket(*args)) or looked_up[-1]
+
+    assert limiter.check("alice", "general") == 0
+    # The room's bucket pushed alice's out of the full limiter, but both paid a token
+    assert list(limiter.limiter.buckets) == [("room", "general")]
+    assert [round(found.tokens) for found in looked_up] == [1, 2]
+
+
+def test_room_limits_are_loaded_without_orm_objects():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    account = NatsAccount(name="chat-app", public_key="ACHAT", user_publish_rate=1.5)
+    plain = NatsAccount(name="plain", public_key="APLAIN")
+    user = User(username="alice", hashed_password="x")
+    db.add_all([account, plain, user])
+    db.flush()
+    general = NatsRoom(name="general", subject_prefix="room", account_id=account.id)
+    other = NatsRoom(name="other", subject_prefix="room", account_id=plain.id)
+    db.add_all([general, other])
+    db.flush()
+    db.add_all([NatsUserRoom(user_id=user.id, room_id=general.id), NatsUserRoom(user_id=user.id, room_id=other.id)])
+    db.commit()
+    account_id, plain_id = account.id, plain.id
+    db.expunge_all()
+
+    rows = NatsRoomQueries(db).get_room_limits_for_user("alice")
+    assert len(db.identity_map) == 0
+    limiter = PublishLimiter()
+    limiter.remember_rooms(rows)
+    assert limiter.room_limits["general"].account_id == account_id
+    assert limiter.room_limits["general"].user_rate == 1.5
+    assert limiter.room_limits["other"] == DEFAULT_LIMITS._replace(account_id=plain_id)
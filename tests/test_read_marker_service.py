@@ -0,0 +1,111 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database.models import Base, Message, NatsAccount, NatsRoom, NatsUserRoom, User
+from app.querries.message_querries import MessageQueries
+from app.querries.nats_room_querries import NatsRoomQueries
+from app.services.read_marker_service import ReadMarkers
+
+
+def make_session_factory():
+    # One shared in-memory database, as markers are written from a worker thread
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    account = NatsAccount(name="chat-app", public_key="ACHAT")
+    db.add(account)
+    db.flush()
+    for name in ("general", "random"):
+        db.add(NatsRoom(name=name, subject_prefix="room", account_id=account.id))
+    db.add(User(username="alice", hashed_password="x"))
+    db.commit()
+    db.close()
+    return factory
+
+
+def add_messages(db, room_id, uids):
+    MessageQueries(db).create_room_messages([{"uid": uid, "room_id": room_id, "content": "hi"} for uid in uids])
+
+
+def test_messages_are_numbered_per_room():
+    db = make_session_factory()()
+    general, random_room = [room.id for room in db.query(NatsRoom).order_by(NatsRoom.id)]
+    add_messages(db, general, [3, 1, 2])
+    MessageQueries(db).create_room_messages([
+        {"uid": 4, "room_id": general, "content": "a"},
+        {"uid": 5, "room_id": random_room, "content": "b"},
+    ])
+
+    assert [(m.uid, m.seq) for m in db.query(Message).filter(Message.room_id == general).order_by(Message.uid)] == [
+        (1, 1), (2, 2), (3, 3), (4, 4)]
+    room = db.get(NatsRoom, general)
+    assert (room.message_count, room.last_message_uid) == (4, 4)
+
+
+def test_unread_counts_follow_coalesced_markers():
+    factory = make_session_factory()
+    db = factory()
+    general, random_room = [room.id for room in db.query(NatsRoom).order_by(NatsRoom.id)]
+    alice = db.query(User).one().id
+    add_messages(db, general, [1, 2])
+    # Joining marks what was already sent as read
+    NatsRoomQueries(db).add_user_to_room(alice, general)
+    NatsRoomQueries(db).add_user_to_room(alice, random_room)
+    add_messages(db, general, [3, 4, 5])
+    add_messages(db, random_room, [6])
+
+    markers = ReadMarkers(session_factory=factory)
+
+    async def scenario():
+        assert await markers.get_unread_counts("alice") == {"general": 3, "random": 1}
+        for message_id in (3, 4, 2, 99):
+            markers.mark("alice", "general", message_id)
+        markers.mark("alice", "random", 6)
+        assert markers.pending == {("alice", "general"): 99, ("alice", "random"): 6}
+        # A pending mark covering the newest message already reads as zero
+        assert (await markers.get_unread_counts("alice"))["random"] == 0
+
+        # 99 is not persisted yet, so it waits for the next flush
+        await markers.flush()
+        assert markers.pending == {("alice", "general"): 99}
+        markers.pending.clear()
+        markers.mark("alice", "general", 4)
+        await markers.flush()
+        await markers.close()
+        return await markers.get_unread_counts("alice")
+
+    assert asyncio.run(scenario()) == {"general": 1, "random": 0}
+    member = db.query(NatsUserRoom).filter(NatsUserRoom.room_id == general).one()
+    db.refresh(member)
+    assert (member.last_read_seq, member.last_read_uid) == (4, 4)
+
+
+def test_unread_counts_follow_ids_when_node_batches_interleave():
+    factory = make_session_factory()
+    db = factory()
+    general = db.query(NatsRoom).filter(NatsRoom.name == "general").one().id
+    alice = db.query(User).one().id
+    NatsRoomQueries(db).add_user_to_room(alice, general)
+    # Two nodes' writers: the second node's batch is stored first, so seq order is 2, 4, 1, 3
+    add_messages(db, general, [2, 4])
+    add_messages(db, general, [1, 3])
+
+    markers = ReadMarkers(session_factory=factory)
+
+    async def scenario():
+        markers.mark("alice", "general", 3)
+        await markers.flush()
+        read_up_to_3 = await markers.get_unread_counts("alice")
+        # An older id never moves the marker back
+        markers.mark("alice", "general", 2)
+        await markers.flush()
+        return read_up_to_3, await markers.get_unread_counts("alice")
+
+    assert asyncio.run(scenario()) == ({"general": 1}, {"general": 1})
+    # Counts stop at the limit
+    add_messages(db, general, [5, 6])
+    assert [unread for _, unread, _, _ in NatsRoomQueries(db).get_unread_counts(alice, limit=2)] == [2]
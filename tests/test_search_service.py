@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import search_service
+
+
+def test_search_rejects_blank_queries_and_deep_offsets():
+    with pytest.raises(HTTPException) as blank:
+        asyncio.run(search_service.search_messages("alice", "   "))
+    assert blank.value.status_code == 400
+
+    with pytest.raises(HTTPException) as deep:
+        asyncio.run(search_service.search_messages("alice", "deploy", offset=search_service.SEARCH_MAX_OFFSET + 1))
+    assert deep.value.status_code == 400
+
+
+def test_search_reports_next_offset_only_for_full_pages(monkeypatch):
+    monkeypatch.setattr(search_service, "_search", lambda username, query, room, limit, offset: [{"id": 1}] * limit)
+    page = asyncio.run(search_service.search_messages("alice", " deploy ", limit=2, offset=4))
+    assert page["query"] == "deploy" and page["next_offset"] == 6
+
+    monkeypatch.setattr(search_service, "_search", lambda username, query, room, limit, offset: [])
+    assert asyncio.run(search_service.search_messages("alice", "deploy"))["next_offset"] is None
+
+
+def test_search_query_uses_the_index_filters_rooms_and_pages():
+    from sqlalchemy.orm import Query
+    from sqlalchemy.sql import operators, visitors
+    from sqlalchemy.sql.selectable import Subquery
+
+    from app.database.models import Message
+    from app.querries.message_querries import MessageQueries
+
+    executed = []
+
+    class CapturedQuery(Query):
+        def all(self):
+            executed.append(self)
+            return []
+
+    class FakeSession:
+        def query(self, *entities):
+            return CapturedQuery(entities)
+
+    assert MessageQueries(FakeSession()).search_room_messages([], "deploy") == []
+    assert executed == []
+
+    MessageQueries(FakeSession()).search_room_messages([3, 5], "deploy failed", limit=20, offset=40)
+    statement = executed[0].statement
+    # Ranking and paging happen in the subquery, on ids only
+    page = next(element for element in visitors.iterate(statement) if isinstance(element, Subquery)).element
+    assert (page._limit, page._offset) == (20, 40)
+    assert [column.name for column in page.selected_columns] == ["id", "rank"]
+
+    rooms, matches = page.whereclause.clauses
+    assert rooms.left.compare(Message.__table__.c.room_id) and rooms.operator is operators.in_op
+    assert rooms.right.value == [3, 5]
+    match = matches.element
+    assert match.operator.opstring == "@@" and match.left.name == "messages.search_vector"
+    assert match.right.name == "websearch_to_tsquery"
+    assert [argument.value for argument in match.right.clauses] == ["english", "deploy failed"]
+
+    # Snippets are built in the outer query, for the returned page only
+    snippet = statement.selected_columns.snippet
+    assert snippet.element.name == "ts_headline"
@@ -0,0 +1,33 @@
+import pytest
+
+from app.shared import serialization
+from app.shared.serialization import JSONResponse, _select
+
+
+def test_backends_write_the_same_compact_json():
+    envelope = {"type": "message", "room": "général", "message": "hi \"there\"\n", "id": 7, "timestamp": 1.5,
+                "_trace": {"hops": {"receive": 0.25}}, "rooms": {3: ["alice"]}}
+    outputs = set()
+    for name in ("json", "orjson"):
+        _, dumps, loads = _select(name)
+        data = dumps(envelope)
+        assert loads(data) == {**envelope, "rooms": {"3": ["alice"]}}
+        outputs.add(data)
+    assert len(outputs) == 1
+    assert b'"room":"g\xc3\xa9n\xc3\xa9ral"' in outputs.pop()
+
+
+def test_default_backend_and_errors():
+    assert serialization.BACKEND == "orjson"
+    assert serialization.dumps_text({"a": [1]}) == '{"a":[1]}'
+    assert serialization.loads('{"a": 1}') == {"a": 1}
+    with pytest.raises(ValueError):
+        serialization.loads(b"not json")
+    with pytest.raises(ValueError):
+        _select("yaml")
+
+
+def test_json_response_uses_the_serializer():
+    response = JSONResponse({"ok": True, "name": "é"})
+    assert response.body == '{"ok":true,"name":"é"}'.encode()
+    assert response.media_type == "application/json"
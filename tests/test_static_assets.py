@@ -0,0 +1,68 @@
+import gzip
+import os
+import sys
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.shared.static_assets import PrecompressedStaticFiles, accepted_encodings, load_manifest, negotiate
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from build_static import build
+
+
+def make_static(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "site.css").write_text("body { color: black; }\n" * 50)
+    (tmp_path / "tiny.js").write_text("x = 1;")
+    manifest, _ = build(str(tmp_path))
+    return manifest
+
+
+def test_build_hashes_and_compresses_deterministically(tmp_path):
+    manifest = make_static(tmp_path)
+    entry = manifest["css/site.css"]
+    assert entry["path"].startswith("css/site.") and entry["path"].endswith(".css")
+    assert "gzip" in entry["encodings"]
+    compressed = (tmp_path / "dist" / (entry["path"] + ".gz")).read_bytes()
+    assert gzip.decompress(compressed) == (tmp_path / "css" / "site.css").read_bytes()
+    # Too small to be worth compressing
+    assert manifest["tiny.js"]["encodings"] == []
+    assert load_manifest(str(tmp_path)) == manifest
+    assert build(str(tmp_path))[0] == manifest
+
+
+def test_encoding_negotiation():
+    assert accepted_encodings("gzip;q=0, br;q=0.5, deflate") == ["br", "deflate"]
+    assert negotiate("gzip, deflate, br", ["br", "gzip"]) == "br"
+    assert negotiate("gzip", ["br", "gzip"]) == "gzip"
+    assert negotiate("br;q=0, gzip;q=0", ["br", "gzip"]) is None
+    assert negotiate("*", ["gzip"]) == "gzip"
+
+
+def test_serving_negotiates_and_sets_cache_headers(tmp_path):
+    manifest = make_static(tmp_path)
+    app = Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=str(tmp_path)))])
+    client = TestClient(app)
+    hashed = f"/static/dist/{manifest['css/site.css']['path']}"
+
+    response = client.get(hashed, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == (tmp_path / "css" / "site.css").read_text()
+
+    identity = client.get(hashed, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] != response.headers["etag"]
+
+    revalidated = client.get(hashed, headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+
+    plain = client.get("/static/css/site.css")
+    assert plain.headers["cache-control"] == "no-cache"
+    assert "etag" in plain.headers
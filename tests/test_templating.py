@@ -0,0 +1,60 @@
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+
+from app.shared.templating import PageCache, make_environment, precompile, templates
+
+
+def make_templates(tmp_path):
+    directory = tmp_path / "templates"
+    directory.mkdir()
+    (directory / "base.html").write_text("<title>{% block title %}{% endblock %}</title>")
+    (directory / "page.html").write_text('{% extends "base.html" %}{% block title %}{{ title }}{% endblock %}')
+    cache_dir = tmp_path / "bytecode"
+    return Jinja2Templates(env=make_environment(str(directory), str(cache_dir), auto_reload=False)), directory, cache_dir
+
+
+def test_precompile_fills_the_bytecode_cache(tmp_path):
+    compiled, _, cache_dir = make_templates(tmp_path)
+    assert precompile(compiled.env) == 2
+    assert len(os.listdir(cache_dir)) == 2
+    assert "asset_url" in compiled.env.globals
+
+
+def test_static_pages_render_once_and_revalidate_with_etag(tmp_path):
+    compiled, directory, _ = make_templates(tmp_path)
+    cache = PageCache(compiled)
+    app = FastAPI()
+
+    @app.get("/page")
+    async def page(request: Request):
+        return cache.response(request, "page.html", {"title": "Hi <there>"})
+
+    client = TestClient(app)
+    first = client.get("/page")
+    assert first.status_code == 200
+    assert first.text == "<title>Hi &lt;there&gt;</title>"
+    assert first.headers["content-type"].startswith("text/html")
+
+    # Served from the cache, not re-rendered
+    (directory / "page.html").write_text("changed")
+    second = client.get("/page")
+    assert second.text == first.text
+    assert second.headers["etag"] == first.headers["etag"]
+
+    not_modified = client.get("/page", headers={"If-None-Match": first.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_page_cache_can_be_disabled(tmp_path):
+    compiled, _, _ = make_templates(tmp_path)
+    cache = PageCache(compiled, enabled=False)
+    cache.render("page.html", {"title": "a"})
+    assert cache.pages == {}
+
+
+def test_app_templates_precompile():
+    assert precompile(templates.env) >= 6
@@ -0,0 +1,25 @@
+import json
+
+from app.shared import tracing
+
+
+def test_start_trace_respects_sampling(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0)
+    assert tracing.start_trace("ws") is None
+    assert tracing.start_trace("ws", force=True)["origin"] == "ws"
+
+
+def test_extract_only_parses_traced_payloads():
+    assert tracing.extract(b'{"type": "message"}') == (None, None)
+
+    ctx = tracing.start_trace("ws", force=True)
+    tracing.mark_sent(ctx)
+    envelope, trace = tracing.extract(json.dumps({"type": "message", "_trace": ctx}).encode())
+    assert envelope["type"] == "message"
+    assert trace["id"] == ctx["id"] and "sent" in trace
+
+
+def test_record_observes_hops():
+    before = tracing.HOP_LATENCY.labels("send").count
+    tracing.record({"id": "abc", "hops": {}}, "deliver", {"send": 0.001})
+    assert tracing.HOP_LATENCY.labels("send").count == before + 1